@@ -0,0 +1,59 @@
+"""organization documents read model
+
+Revision ID: 3b9d2f6a1c47
+Revises: fc6202fda014
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b9d2f6a1c47'
+down_revision: Union[str, None] = 'fc6202fda014'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('organization_documents',
+    sa.Column('organization_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('building_id', sa.Integer(), nullable=True),
+    sa.Column('city', sa.String(), nullable=True),
+    sa.Column('street', sa.String(), nullable=True),
+    sa.Column('house', sa.String(), nullable=True),
+    sa.Column('latitude', sa.Float(), nullable=True),
+    sa.Column('longitude', sa.Float(), nullable=True),
+    sa.Column('phone_numbers', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('activity_ids', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.ForeignKeyConstraint(['organization_id'], ['organizations.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('organization_id')
+    )
+    op.create_index(op.f('ix_organization_documents_name'), 'organization_documents', ['name'], unique=False)
+    op.create_index('ix_organization_documents_address', 'organization_documents', ['city', 'street', 'house'], unique=False)
+
+    # backfill, afterwards the application keeps the documents up to date on writes
+    op.execute("""
+        INSERT INTO organization_documents
+            (organization_id, name, building_id, city, street, house, latitude, longitude,
+             phone_numbers, activity_ids)
+        SELECT o.id, o.name, o.building_id, b.city, b.street, b.house, b.latitude, b.longitude,
+               COALESCE((SELECT jsonb_agg(jsonb_build_object('id', p.id, 'phone_number', p.phone_number)
+                                          ORDER BY p.id)
+                         FROM phone_numbers p WHERE p.organization_id = o.id), '[]'::jsonb),
+               COALESCE((SELECT jsonb_agg(oa.activity_id ORDER BY oa.activity_id)
+                         FROM organization_activities oa WHERE oa.organization_id = o.id), '[]'::jsonb)
+        FROM organizations o
+        LEFT JOIN buildings b ON b.id = o.building_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_organization_documents_address', table_name='organization_documents')
+    op.drop_index(op.f('ix_organization_documents_name'), table_name='organization_documents')
+    op.drop_table('organization_documents')
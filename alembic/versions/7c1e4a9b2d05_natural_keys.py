@@ -0,0 +1,113 @@
+"""natural keys for bulk import upserts
+
+Revision ID: 7c1e4a9b2d05
+Revises: 3b9d2f6a1c47
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+import logging
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e4a9b2d05'
+down_revision: Union[str, None] = '3b9d2f6a1c47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+# organization_documents rows of the organizations in `touched`, as in 3b9d2f6a1c47
+REBUILD_DOCUMENTS = """
+    INSERT INTO organization_documents
+        (organization_id, name, building_id, city, street, house, latitude, longitude,
+         phone_numbers, activity_ids)
+    SELECT o.id, o.name, o.building_id, b.city, b.street, b.house, b.latitude, b.longitude,
+           COALESCE((SELECT jsonb_agg(jsonb_build_object('id', p.id, 'phone_number', p.phone_number)
+                                      ORDER BY p.id)
+                     FROM phone_numbers p WHERE p.organization_id = o.id), '[]'::jsonb),
+           COALESCE((SELECT jsonb_agg(DISTINCT oa.activity_id ORDER BY oa.activity_id)
+                     FROM organization_activities oa WHERE oa.organization_id = o.id), '[]'::jsonb)
+    FROM organizations o
+    LEFT JOIN buildings b ON b.id = o.building_id
+    WHERE o.id IN (SELECT id FROM touched)
+"""
+
+
+def merge_duplicates():
+    """
+    Merges buildings with the same address and organizations with the same name in
+    one building into the row with the smallest id: references are repointed to it,
+    the other rows deleted. Affected read model documents are rebuilt.
+    """
+    conn = op.get_bind()
+    conn.execute(sa.text("""
+        CREATE TEMP TABLE building_merges ON COMMIT DROP AS
+        SELECT id, keep_id FROM (
+            SELECT id, min(id) OVER (PARTITION BY city, street, house) AS keep_id FROM buildings
+        ) ranked
+        WHERE id <> keep_id
+    """))
+    conn.execute(sa.text("""
+        CREATE TEMP TABLE touched ON COMMIT DROP AS
+        SELECT o.id FROM organizations o JOIN building_merges m ON m.id = o.building_id
+    """))
+    conn.execute(sa.text("""
+        UPDATE organizations o SET building_id = m.keep_id
+        FROM building_merges m WHERE m.id = o.building_id
+    """))
+    conn.execute(sa.text("DELETE FROM buildings WHERE id IN (SELECT id FROM building_merges)"))
+
+    # NULL building ids never collide under the constraint
+    conn.execute(sa.text("""
+        CREATE TEMP TABLE organization_merges ON COMMIT DROP AS
+        SELECT id, keep_id FROM (
+            SELECT id, min(id) OVER (PARTITION BY building_id, name) AS keep_id
+            FROM organizations WHERE building_id IS NOT NULL
+        ) ranked
+        WHERE id <> keep_id
+    """))
+    conn.execute(sa.text("INSERT INTO touched SELECT DISTINCT keep_id FROM organization_merges"))
+    for table in ("phone_numbers", "organization_activities"):
+        conn.execute(sa.text(f"""
+            UPDATE {table} t SET organization_id = m.keep_id
+            FROM organization_merges m WHERE m.id = t.organization_id
+        """))
+    # their documents go with them (ON DELETE CASCADE)
+    conn.execute(sa.text("DELETE FROM organizations WHERE id IN (SELECT id FROM organization_merges)"))
+    conn.execute(sa.text("DELETE FROM organization_documents WHERE organization_id IN (SELECT id FROM touched)"))
+    conn.execute(sa.text(REBUILD_DOCUMENTS))
+
+    buildings = conn.execute(sa.text("SELECT id, keep_id FROM building_merges ORDER BY id")).all()
+    organizations = conn.execute(sa.text("SELECT id, keep_id FROM organization_merges ORDER BY id")).all()
+    if buildings:
+        logger.warning("merged %d duplicate buildings (id -> kept id): %s", len(buildings),
+                       ", ".join(f"{i} -> {keep}" for i, keep in buildings))
+    if organizations:
+        logger.warning("merged %d duplicate organizations (id -> kept id): %s", len(organizations),
+                       ", ".join(f"{i} -> {keep}" for i, keep in organizations))
+
+
+def upgrade() -> None:
+    merge_duplicates()
+    # exact duplicates carry no information, e.g. after merging organizations
+    op.execute("""
+        DELETE FROM organization_activities a
+        USING organization_activities b
+        WHERE a.organization_id = b.organization_id
+          AND a.activity_id = b.activity_id
+          AND a.id > b.id
+    """)
+    op.create_unique_constraint('uq_buildings_address', 'buildings', ['city', 'street', 'house'])
+    op.create_unique_constraint('uq_organizations_building_name', 'organizations', ['building_id', 'name'])
+    op.create_unique_constraint('uq_organization_activities', 'organization_activities',
+                                ['organization_id', 'activity_id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_organization_activities', 'organization_activities', type_='unique')
+    op.drop_constraint('uq_organizations_building_name', 'organizations', type_='unique')
+    op.drop_constraint('uq_buildings_address', 'buildings', type_='unique')
@@ -0,0 +1,33 @@
+"""persistent forward geocoding cache
+
+Revision ID: 9e4b7d2c1a30
+Revises: 7c1e4a9b2d05
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e4b7d2c1a30'
+down_revision: Union[str, None] = '7c1e4a9b2d05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'geocoded_addresses',
+        sa.Column('query', sa.String(), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=True),
+        sa.Column('longitude', sa.Float(), nullable=True),
+        sa.Column('geocoded_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('query'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('geocoded_addresses')
@@ -0,0 +1,25 @@
+"""index of building coordinates for bounding box search
+
+Revision ID: a1f3c5e7b9d2
+Revises: 9e4b7d2c1a30
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1f3c5e7b9d2'
+down_revision: Union[str, None] = '9e4b7d2c1a30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_buildings_coordinates', 'buildings', ['latitude', 'longitude'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_buildings_coordinates', table_name='buildings')
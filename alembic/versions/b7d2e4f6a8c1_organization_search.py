@@ -0,0 +1,41 @@
+"""full-text search over organization documents
+
+Revision ID: b7d2e4f6a8c1
+Revises: a1f3c5e7b9d2
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d2e4f6a8c1'
+down_revision: Union[str, None] = 'a1f3c5e7b9d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('organization_documents',
+                  sa.Column('search_text', sa.String(), server_default='', nullable=False))
+    # backfill, the same text app.read_model builds
+    op.execute("""
+        UPDATE organization_documents d
+        SET search_text = concat_ws(' ', d.name,
+            (SELECT string_agg(a.name, ' ' ORDER BY a.id)
+             FROM organization_activities oa JOIN activities a ON a.id = oa.activity_id
+             WHERE oa.organization_id = d.organization_id),
+            d.city, d.street, d.house)
+    """)
+    op.execute("""
+        CREATE INDEX ix_organization_documents_search ON organization_documents
+        USING gin (to_tsvector('simple'::regconfig, search_text))
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_organization_documents_search', table_name='organization_documents')
+    op.drop_column('organization_documents', 'search_text')
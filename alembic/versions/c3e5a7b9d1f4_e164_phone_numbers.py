@@ -0,0 +1,93 @@
+"""phone numbers in E.164
+
+Revision ID: c3e5a7b9d1f4
+Revises: b7d2e4f6a8c1
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+import logging
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.phones import normalize_phone
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e5a7b9d1f4'
+down_revision: Union[str, None] = 'b7d2e4f6a8c1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+BATCH_SIZE = 1000
+
+
+def normalize_all(conn) -> tuple[list[dict], list[tuple[int, int, str]], list[tuple[int, str]]]:
+    """
+    Every stored number through app.phones.normalize_phone, in id order. Returns the
+    changed rows, (id, kept id, number) of rows whose number another row with a
+    smaller id already has, and (id, number) of rows that aren't phone numbers.
+    """
+    changed, duplicates, invalid = [], [], []
+    owner: dict[str, int] = {}
+    last_id = 0
+    while True:
+        rows = conn.execute(sa.text(
+            "SELECT id, phone_number FROM phone_numbers WHERE id > :last_id AND phone_number IS NOT NULL"
+            " ORDER BY id LIMIT :limit"), {"last_id": last_id, "limit": BATCH_SIZE}).all()
+        if not rows:
+            return changed, duplicates, invalid
+        for row_id, phone_number in rows:
+            try:
+                normalized = normalize_phone(phone_number)
+            except ValueError:
+                invalid.append((row_id, phone_number))
+                normalized = phone_number
+            if normalized in owner:
+                duplicates.append((row_id, owner[normalized], normalized))
+                continue
+            owner[normalized] = row_id
+            if normalized != phone_number:
+                changed.append({"id": row_id, "phone_number": normalized})
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    changed, duplicates, invalid = normalize_all(conn)
+    if invalid:
+        logger.warning("%d phone numbers can't be normalized and are kept as they are (id: number): %s",
+                       len(invalid), ", ".join(f"{row_id}: {number!r}" for row_id, number in invalid))
+    # a number belongs to one organization - the row with the smallest id keeps it
+    if duplicates:
+        logger.warning("%d phone numbers duplicate another one once normalized and are removed "
+                       "(id -> kept id: number): %s", len(duplicates),
+                       ", ".join(f"{row_id} -> {kept}: {number}" for row_id, kept, number in duplicates))
+        ids = [row_id for row_id, _, _ in duplicates]
+        for i in range(0, len(ids), BATCH_SIZE):
+            conn.execute(sa.text("DELETE FROM phone_numbers WHERE id IN :ids")
+                         .bindparams(sa.bindparam("ids", expanding=True)), {"ids": ids[i:i + BATCH_SIZE]})
+
+    # rows may swap values, the constraint would see the intermediate duplicates
+    op.drop_constraint('phone_numbers_phone_number_key', 'phone_numbers', type_='unique')
+    for i in range(0, len(changed), BATCH_SIZE):
+        conn.execute(sa.text("UPDATE phone_numbers SET phone_number = :phone_number WHERE id = :id"),
+                     changed[i:i + BATCH_SIZE])
+    logger.info("normalized %d phone numbers", len(changed))
+    op.create_unique_constraint('phone_numbers_phone_number_key', 'phone_numbers', ['phone_number'])
+    op.create_index('ix_phone_numbers_organization_id', 'phone_numbers', ['organization_id'])
+
+    op.execute("""
+        UPDATE organization_documents d
+        SET phone_numbers = COALESCE((SELECT jsonb_agg(jsonb_build_object('id', p.id, 'phone_number', p.phone_number)
+                                                 ORDER BY p.id)
+                                      FROM phone_numbers p WHERE p.organization_id = d.organization_id), '[]'::jsonb)
+    """)
+
+
+def downgrade() -> None:
+    # the original formatting is gone
+    op.drop_index('ix_phone_numbers_organization_id', table_name='phone_numbers')
@@ -0,0 +1,153 @@
+"""
+    In-memory activity index: for every activity, a bitset (a Python int, bit i -
+    organization i) of the organizations in the activity or any of its descendants.
+
+    Subtree queries become one dict lookup, "X and Y" / "X or Y" a single & or |,
+    and the ids come out of the set bits sorted, ready for one batched fetch. The
+    bitsets are dense, so memory is about activities * max organization id / 8
+    bytes; past ACTIVITY_INDEX_MAX_MB the index isn't built and callers fall back
+    to SQL.
+
+    The index is rebuilt when the organizations or activities cache tags move, i.e.
+    after any write that could change the result, and at most CACHE_TTL seconds
+    after it was built - as stale as a cached entry can get.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Iterable
+
+from app import schemas
+from app.cache import cache
+from app.config import settings
+from app.uow import unit_of_work
+
+logger = logging.getLogger(__name__)
+
+# set bit positions of every byte value
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+def bitset_ids(bits: int, offset: int = 0, limit: int | None = None) -> list[int]:
+    """ Positions of the set bits, ascending - organization ids. """
+    ids = []
+    skip = offset
+    for index, byte in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, "little")):
+        if not byte:
+            continue
+        for bit in _BYTE_BITS[byte]:
+            if skip:
+                skip -= 1
+                continue
+            ids.append(index * 8 + bit)
+            if limit is not None and len(ids) >= limit:
+                return ids
+    return ids
+
+
+def to_bitset(ids: Iterable[int], max_id: int) -> int:
+    buffer = bytearray(max_id // 8 + 1)
+    for i in ids:
+        buffer[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buffer, "little")
+
+
+class ActivityIndex:
+    def __init__(self, tree: list[schemas.ActivityNode], organization_activities: Iterable[tuple[int, int]]):
+        direct: dict[int, list[int]] = defaultdict(list)
+        max_id = 0
+        for organization_id, activity_id in organization_activities:
+            direct[activity_id].append(organization_id)
+            max_id = max(max_id, organization_id)
+
+        self.ids_by_name: dict[str, list[int]] = defaultdict(list)
+        children = defaultdict(list)
+        known = {node.id for node in tree}
+        for node in tree:
+            self.ids_by_name[node.name].append(node.id)
+            if node.parent_id in known:
+                children[node.parent_id].append(node.id)
+
+        self.bits: dict[int, int] = {}
+        # post-order, children are merged into their parent
+        for root in [node.id for node in tree if node.parent_id not in known]:
+            stack = [(root, False)]
+            while stack:
+                activity_id, expanded = stack.pop()
+                if expanded:
+                    bits = to_bitset(direct[activity_id], max_id) if activity_id in direct else 0
+                    for child in children[activity_id]:
+                        bits |= self.bits[child]
+                    self.bits[activity_id] = bits
+                else:
+                    stack.append((activity_id, True))
+                    stack.extend((child, False) for child in children[activity_id])
+
+    def subtree(self, name: str) -> int:
+        """ Organizations in any activity called `name` or below it. """
+        bits = 0
+        for activity_id in self.ids_by_name.get(name, ()):
+            bits |= self.bits.get(activity_id, 0)
+        return bits
+
+    def match(self, all_of: Iterable[str] = (), any_of: Iterable[str] = ()) -> int:
+        """ In every subtree of `all_of` and in at least one of `any_of`. """
+        bits = None
+        for name in all_of:
+            bits = self.subtree(name) if bits is None else bits & self.subtree(name)
+        if any_of:
+            union = 0
+            for name in any_of:
+                union |= self.subtree(name)
+            bits = union if bits is None else bits & union
+        return bits or 0
+
+    def size_bytes(self) -> int:
+        return sum((bits.bit_length() + 7) // 8 for bits in self.bits.values())
+
+
+class LiveActivityIndex:
+    """ The current ActivityIndex, rebuilt on first use after the tags' versions change. """
+
+    def __init__(self, tags: list[str]):
+        self.tags = tags
+        self.index: ActivityIndex | None = None
+        self.versions: dict[str, int] | None = None
+        self.built_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> ActivityIndex | None:
+        """ None - too big to hold, query the database instead. """
+        versions = await cache.tag_versions(self.tags)
+        if not self._stale(versions):
+            return self.index
+        async with self._lock:
+            if self._stale(versions):
+                self.index = await self.build()
+                self.versions = versions
+                self.built_at = time.monotonic()
+        return self.index
+
+    def invalidate(self):
+        self.versions = None
+
+    def _stale(self, versions: dict[str, int]) -> bool:
+        return versions != self.versions or time.monotonic() - self.built_at >= settings.CACHE_TTL
+
+    async def build(self) -> ActivityIndex | None:
+        start = time.perf_counter()
+        async with unit_of_work(read_only=True) as uow:
+            tree = await uow.activity_repository.get_activity_tree()
+            max_id = await uow.activity_repository.get_max_organization_id()
+            if len(tree) * max_id / 8 > settings.ACTIVITY_INDEX_MAX_MB * 2 ** 20:
+                logger.warning("activity index too big, not built",
+                               extra={"activities": len(tree), "max_organization_id": max_id})
+                return None
+            pairs = [pair async for pair in uow.activity_repository.stream_organization_activities(
+                settings.STREAM_BATCH_SIZE)]
+        index = ActivityIndex(tree, pairs)
+        logger.info("activity index built", extra={"activities": len(tree), "pairs": len(pairs),
+                                                   "bytes": index.size_bytes(),
+                                                   "seconds": round(time.perf_counter() - start, 3)})
+        return index
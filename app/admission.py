@@ -0,0 +1,162 @@
+import asyncio
+import math
+import time
+from collections import deque
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.types import Scope, Receive, Send
+
+from app.config import settings
+
+
+class Overloaded(Exception):
+    def __init__(self, limiter: str, retry_after: float):
+        super().__init__(f"{limiter} is overloaded")
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """
+    Caps concurrent requests of a route group. Requests over the limit wait in a
+    bounded FIFO queue for at most `max_wait` seconds. A request is rejected right
+    away when the queue is full or when the expected wait (from the average service
+    time) already exceeds `max_wait`, so it doesn't hold a socket just to time out.
+
+    Used as a route dependency: `dependencies=[Depends(limiter)]`.
+    """
+
+    # weight of the latest observation in the average service time
+    ewma_alpha = 0.2
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        self.avg_service_time = 0.0
+
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_deadline = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+
+    def expected_wait(self) -> float:
+        return (len(self.waiters) + 1) / self.max_concurrency * self.avg_service_time
+
+    def retry_after(self) -> float:
+        return max(self.expected_wait(), 1.0)
+
+    async def acquire(self):
+        if self.active < self.max_concurrency and not self.waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self.waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise Overloaded(self.name, self.retry_after())
+        if self.expected_wait() > self.max_wait:
+            self.rejected_deadline += 1
+            raise Overloaded(self.name, self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise Overloaded(self.name, self.retry_after())
+        except BaseException:
+            # cancelled right after the slot was handed over - pass it on
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            self.total_wait += time.perf_counter() - start
+        self.admitted += 1
+
+    def release(self):
+        # hand the slot over to the first live waiter, `active` stays the same
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def observe(self, service_time: float):
+        self.avg_service_time += self.ewma_alpha * (service_time - self.avg_service_time)
+
+    async def admit(self):
+        """ acquire(), over the limit as a 503. """
+        try:
+            await self.acquire()
+        except Overloaded as e:
+            raise HTTPException(503, str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+
+    async def __call__(self):
+        await self.admit()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": len(self.waiters),
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_deadline": self.rejected_deadline,
+            "timed_out": self.timed_out,
+            "total_wait_seconds": self.total_wait,
+            "avg_service_time_seconds": self.avg_service_time,
+        }
+
+
+class LimitedStreamingResponse(StreamingResponse):
+    """
+    Holds a slot of `limiter`, taken with `limiter.admit()`, until the body is sent.
+    Yield dependencies exit before a streamed body is sent, so `Depends(limiter)`
+    would free the slot while the stream still holds a pooled connection.
+    """
+
+    def __init__(self, content, limiter: ConcurrencyLimiter, **kwargs):
+        super().__init__(content, **kwargs)
+        self.limiter = limiter
+        self.admitted_at = time.perf_counter()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.limiter.observe(time.perf_counter() - self.admitted_at)
+            self.limiter.release()
+
+
+# radius search (geocoder + per-building queries) and subactivity search
+expensive_limiter = ConcurrencyLimiter(
+    "expensive",
+    max_concurrency=settings.ADMISSION_EXPENSIVE_CONCURRENCY,
+    max_queue=settings.ADMISSION_EXPENSIVE_QUEUE,
+    max_wait=settings.ADMISSION_EXPENSIVE_MAX_WAIT,
+)
+# single indexed lookups
+cheap_limiter = ConcurrencyLimiter(
+    "cheap",
+    max_concurrency=settings.ADMISSION_CHEAP_CONCURRENCY,
+    max_queue=settings.ADMISSION_CHEAP_QUEUE,
+    max_wait=settings.ADMISSION_CHEAP_MAX_WAIT,
+)
+
+limiters = {limiter.name: limiter for limiter in (expensive_limiter, cheap_limiter)}
@@ -0,0 +1,68 @@
+from typing import Literal
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+from app.admission import limiters
+from app.db import async_engine, pool_stats
+from app.export import export_documents, export_slots, validate, FORMATS, COMPRESSIONS
+from app.profiling import profile_store
+from app.replicas import replica_pool
+
+router = APIRouter(prefix="/admin")
+
+
+@router.get("/pool_stats")
+async def get_pool_stats() -> dict:
+    return {
+        "primary": pool_stats(async_engine),
+        "replicas": {repr(replica): pool_stats(replica.engine)
+                     for replica in replica_pool.replicas},
+    }
+
+
+@router.get("/limiters")
+async def get_limiters() -> dict:
+    return {name: limiter.stats() for name, limiter in limiters.items()}
+
+
+@router.get("/profiles")
+async def get_profiles() -> list[dict]:
+    return [profile.summary() for profile in reversed(profile_store.profiles)]
+
+
+@router.get("/profiles/{request_id}")
+async def get_profile(request_id: str) -> dict:
+    profile = profile_store.get(request_id)
+    if profile is None:
+        raise HTTPException(404, "No profile for this request")
+    return {**profile.summary(), "statements": profile.statements, "collapsed": profile.collapsed}
+
+
+@router.get("/profiles/{request_id}/collapsed", response_class=PlainTextResponse)
+async def get_profile_collapsed(request_id: str) -> str:
+    """ Collapsed stacks, feed to flamegraph.pl or speedscope. """
+    profile = profile_store.get(request_id)
+    if profile is None:
+        raise HTTPException(404, "No profile for this request")
+    return profile.collapsed
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export(
+        file_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+        compression: Literal["none", "gzip", "zstd"] = "none"
+) -> StreamingResponse:
+    """ The whole organization directory, streamed from one consistent snapshot. """
+    if export_slots.locked():
+        raise HTTPException(503, "Too many exports running", headers={"Retry-After": "60"})
+    try:
+        validate(file_format, compression)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    extension, media_type = COMPRESSIONS[compression]
+    return StreamingResponse(
+        export_documents(file_format, compression),
+        media_type=media_type or FORMATS[file_format],
+        headers={"Content-Disposition": f'attachment; filename="organizations.{file_format}{extension}"'},
+    )
@@ -1,3 +1,4 @@
+import logging
 from datetime import timedelta
 from typing import Annotated
 
@@ -11,6 +12,8 @@ from app.services import AuthService
 from ....config import settings
 from ....dependencies import get_current_active_user
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -24,7 +27,9 @@ async def login_for_access_token(
         service: auth_service_dep
 ) -> Token:
     user = await service.authenticate_user(form_data.username, form_data.password)
-    print(user)
+    logger.debug("login attempt", extra={"username": form_data.username,
+                                         "authenticated": bool(user),
+                                         "requested_scopes": form_data.scopes})
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -32,7 +37,6 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
     expires_data = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    print(form_data.scopes)
     permissions = [s.name for s in user.permissions]
     access_token = service.create_access_token(
         {"sub": user.username, "scopes": permissions},
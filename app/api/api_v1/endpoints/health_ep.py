@@ -0,0 +1,17 @@
+from fastapi import APIRouter, HTTPException, Request
+
+router = APIRouter(prefix="/health")
+
+
+@router.get("/live")
+async def live() -> dict:
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def ready(request: Request) -> dict:
+    # not ready until the lifespan warm-up is done, so rolling deploys don't send
+    # traffic to cold workers
+    if not getattr(request.app.state, "ready", False):
+        raise HTTPException(503, "Warming up", headers={"Retry-After": "1"})
+    return {"status": "ready"}
@@ -0,0 +1,106 @@
+from typing import Annotated, List
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.exc import IntegrityError
+
+from app import schemas
+from app.config import settings
+from app.services import OrganizationService, BuildingService
+
+router = APIRouter()
+
+organization_service_dep = Annotated[OrganizationService, Depends()]
+building_service_dep = Annotated[BuildingService, Depends()]
+
+
+def is_unique_violation(error: IntegrityError) -> bool:
+    # asyncpg reports the SQLSTATE, sqlite only a message
+    return getattr(error.orig, "sqlstate", None) == "23505" or "UNIQUE constraint failed" in str(error.orig)
+
+
+def check_batch_size(items: list):
+    if not items:
+        raise HTTPException(400, "Empty batch")
+    if len(items) > settings.WRITE_BATCH_MAX:
+        raise HTTPException(413, f"At most {settings.WRITE_BATCH_MAX} items per request")
+
+
+@router.post("/create_buildings", response_model=List[schemas.Building])
+async def create_buildings(
+        buildings: List[schemas.BuildingCreate],
+        service: building_service_dep
+) -> List[schemas.Building]:
+    """ Creates buildings, existing addresses get the new coordinates. """
+    check_batch_size(buildings)
+    return await service.create_buildings(buildings)
+
+
+@router.patch("/update_buildings")
+async def update_buildings(
+        buildings: List[schemas.BuildingUpdate],
+        service: building_service_dep
+) -> dict:
+    check_batch_size(buildings)
+    try:
+        updated = await service.update_buildings(buildings)
+    except IntegrityError as e:
+        if not is_unique_violation(e):
+            raise
+        raise HTTPException(409, "Address is taken by another building")
+    return {"updated": updated}
+
+
+@router.delete("/delete_buildings")
+async def delete_buildings(
+        batch: schemas.BatchDelete,
+        service: building_service_dep
+) -> dict:
+    check_batch_size(batch.ids)
+    try:
+        deleted = await service.delete_buildings(batch.ids)
+    except ValueError as e:
+        raise HTTPException(409, str(e))
+    except IntegrityError:
+        # organizations added after the check
+        raise HTTPException(409, "Buildings still have organizations")
+    return {"deleted": deleted}
+
+
+@router.post("/create_organizations", response_model=List[schemas.Organization])
+async def create_organizations(
+        organizations: List[schemas.OrganizationCreate],
+        service: organization_service_dep
+) -> List[schemas.Organization]:
+    """ Creates organizations, existing (building, name) pairs are updated; phones move to their new owner. """
+    check_batch_size(organizations)
+    try:
+        return await service.create_organizations(organizations)
+    except ValueError as e:
+        raise HTTPException(409, str(e))
+
+
+@router.patch("/update_organizations")
+async def update_organizations(
+        organizations: List[schemas.OrganizationUpdate],
+        service: organization_service_dep
+) -> dict:
+    """ Updates the given fields, phone_numbers and activity_ids replace the current lists. """
+    check_batch_size(organizations)
+    try:
+        updated = await service.update_organizations(organizations)
+    except ValueError as e:
+        raise HTTPException(409, str(e))
+    except IntegrityError as e:
+        if not is_unique_violation(e):
+            raise
+        raise HTTPException(409, "Name is taken in the building")
+    return {"updated": updated}
+
+
+@router.delete("/delete_organizations")
+async def delete_organizations(
+        batch: schemas.BatchDelete,
+        service: organization_service_dep
+) -> dict:
+    check_batch_size(batch.ids)
+    return {"deleted": await service.delete_organizations(batch.ids)}
@@ -1,9 +1,15 @@
-from typing import Annotated, List
+from contextlib import contextmanager
+from typing import Annotated, AsyncIterator, List
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from geopy.exc import GeocoderRateLimited, GeocoderServiceError, GeocoderTimedOut, GeocoderUnavailable
 
 from app import schemas
+from app.admission import cheap_limiter, expensive_limiter, LimitedStreamingResponse
+from app.deadlines import DeadlineExceeded
 from app.dependencies import get_basic_user, get_advanced_user
+from app.replicas import is_connection_error
 from app.services import OrganizationService, BuildingService
 
 router = APIRouter()
@@ -11,8 +17,47 @@ router = APIRouter()
 organization_service_dep = Annotated[OrganizationService, Depends()]
 building_service_dep = Annotated[BuildingService, Depends()]
 
+# organizations per NDJSON chunk sent
+NDJSON_CHUNK = 100
+
+
+@contextmanager
+def lookup_errors():
+    """
+    Bad input is a 400, an unreachable geocoder or database a 502-504.
+    DeadlineExceeded is left to its own handler (504), anything else is a 500.
+    """
+    try:
+        yield
+    except DeadlineExceeded:
+        raise
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except GeocoderTimedOut as e:
+        raise HTTPException(504, "Geocoder timed out") from e
+    except (GeocoderUnavailable, GeocoderRateLimited) as e:
+        raise HTTPException(503, "Geocoder unavailable", headers={"Retry-After": "1"}) from e
+    except GeocoderServiceError as e:
+        raise HTTPException(502, "Geocoder failed") from e
+    except Exception as e:
+        if is_connection_error(e):
+            raise HTTPException(503, "Database unavailable", headers={"Retry-After": "1"}) from e
+        raise
+
+
+async def ndjson(organizations: AsyncIterator[schemas.Organization]) -> AsyncIterator[bytes]:
+    lines = []
+    async for organization in organizations:
+        lines.append(organization.model_dump_json())
+        if len(lines) >= NDJSON_CHUNK:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
 
 @router.get("/get_organizations_by_building_address",
+            dependencies=[Depends(cheap_limiter)],
             response_model=List[schemas.Organization])
 async def get_organizations_by_building_address(
         city: str,
@@ -21,64 +66,60 @@ async def get_organizations_by_building_address(
         service: organization_service_dep,
         basic_user: Annotated[schemas.User, Depends(get_basic_user)]
 ) -> List[schemas.Organization]:
-    try:
+    with lookup_errors():
         organizations = await service.get_organizations_by_building_address(city, street, house)
-    except Exception as e:
-        raise HTTPException(400, str(e))
     if not organizations:
         raise HTTPException(404, "No data by this query")
     return organizations
 
 
 @router.get("/get_organizations_by_activity",
+            dependencies=[Depends(cheap_limiter)],
             response_model=List[schemas.Organization])
 async def get_organizations_by_activity(
         activity: str,
         service: organization_service_dep,
         basic_user: Annotated[schemas.User, Depends(get_basic_user)]
 ) -> List[schemas.Organization]:
-    try:
+    with lookup_errors():
         organizations = await service.get_organizations_by_activity(activity)
-    except Exception as e:
-        raise HTTPException(400, str(e))
     if not organizations:
         raise HTTPException(404, "No data by this query")
     return organizations
 
 
 @router.get("/get_organization_by_id",
+            dependencies=[Depends(cheap_limiter)],
             response_model=schemas.Organization)
 async def get_organization_by_id(
         organization_id: int,
         service: organization_service_dep,
         basic_user: Annotated[schemas.User, Depends(get_basic_user)]
 ) -> schemas.Organization | None:
-    try:
+    with lookup_errors():
         organization = await service.get_organization_by_id(organization_id)
-    except Exception as e:
-        raise HTTPException(400, str(e))
     if not organization:
         raise HTTPException(404, "No data by this query")
     return organization
 
 
 @router.get("/get_organization_by_name",
+            dependencies=[Depends(cheap_limiter)],
             response_model=schemas.Organization)
 async def get_organization_by_name(
         name: str,
         service: organization_service_dep,
         basic_user: Annotated[schemas.User, Depends(get_basic_user)]
 ) -> schemas.Organization | None:
-    try:
+    with lookup_errors():
         organization = await service.get_organization_by_name(name)
-    except Exception as e:
-        raise HTTPException(400, str(e))
     if not organization:
         raise HTTPException(404, "No data by this query")
     return organization
 
 
 @router.get("/get_organizations_by_coordinates",
+            dependencies=[Depends(expensive_limiter)],
             response_model=List[dict])
 async def get_organizations_by_coordinates(
         latitude: float,
@@ -87,26 +128,129 @@ async def get_organizations_by_coordinates(
         service: building_service_dep,
         basic_user: Annotated[schemas.User, Depends(get_advanced_user)]
 ) -> List[dict]:
-    try:
+    with lookup_errors():
         buildings_organizations_dicts: list = await service.get_buildings_with_organizations_by_coordinates(latitude, longitude, radius)
-    except Exception as e:
-        raise HTTPException(400, str(e))
     if not buildings_organizations_dicts:
         raise HTTPException(404, "No data by this query")
     return buildings_organizations_dicts
 
 
+@router.get("/stream_organizations_by_activity",
+            response_class=StreamingResponse)
+async def stream_organizations_by_activity(
+        activity: str,
+        service: organization_service_dep,
+        basic_user: Annotated[schemas.User, Depends(get_basic_user)]
+) -> StreamingResponse:
+    """ get_organizations_by_activity as NDJSON, streamed from a server-side cursor. """
+    with lookup_errors():
+        organizations = await service.stream_organizations_by_activity(activity)
+    await expensive_limiter.admit()
+    return LimitedStreamingResponse(ndjson(organizations), expensive_limiter,
+                                    media_type="application/x-ndjson")
+
+
+@router.get("/stream_organizations_by_subactivities",
+            response_class=StreamingResponse)
+async def stream_organizations_by_subactivities(
+        activity: str,
+        service: organization_service_dep,
+        basic_user: Annotated[schemas.User, Depends(get_advanced_user)]
+) -> StreamingResponse:
+    """ get_organizations_by_subactivities as NDJSON, streamed from a server-side cursor. """
+    with lookup_errors():
+        organizations = await service.stream_organizations_by_subactivities(activity)
+    await expensive_limiter.admit()
+    return LimitedStreamingResponse(ndjson(organizations), expensive_limiter,
+                                    media_type="application/x-ndjson")
+
+
+@router.get("/get_organization_by_phone_number",
+            dependencies=[Depends(cheap_limiter)],
+            response_model=schemas.Organization)
+async def get_organization_by_phone_number(
+        phone_number: str,
+        service: organization_service_dep,
+        basic_user: Annotated[schemas.User, Depends(get_basic_user)]
+) -> schemas.Organization:
+    with lookup_errors():
+        owners = await service.get_organizations_by_phone_numbers([phone_number])
+    if owners[0].organization is None:
+        raise HTTPException(404, "No data by this query")
+    return owners[0].organization
+
+
+@router.post("/get_organizations_by_phone_numbers",
+             dependencies=[Depends(cheap_limiter)],
+             response_model=List[schemas.PhoneNumberOwner])
+async def get_organizations_by_phone_numbers(
+        phone_numbers: List[str],
+        service: organization_service_dep,
+        basic_user: Annotated[schemas.User, Depends(get_basic_user)]
+) -> List[schemas.PhoneNumberOwner]:
+    """ Owners of up to PHONE_LOOKUP_MAX numbers, in the order asked; numbers are normalized to E.164. """
+    with lookup_errors():
+        return await service.get_organizations_by_phone_numbers(phone_numbers)
+
+
+@router.get("/search_organizations",
+            dependencies=[Depends(cheap_limiter)],
+            response_model=schemas.SearchPage)
+async def search_organizations(
+        q: str,
+        service: organization_service_dep,
+        basic_user: Annotated[schemas.User, Depends(get_basic_user)],
+        latitude: float | None = None,
+        longitude: float | None = None,
+        offset: int = 0,
+        limit: int = 20
+) -> schemas.SearchPage:
+    with lookup_errors():
+        return await service.search_organizations(q, latitude, longitude, offset, limit)
+
+
+@router.get("/get_organizations_by_activities",
+            dependencies=[Depends(cheap_limiter)],
+            response_model=schemas.OrganizationPage)
+async def get_organizations_by_activities(
+        service: organization_service_dep,
+        advanced_user: Annotated[schemas.User, Depends(get_advanced_user)],
+        any_of: Annotated[List[str], Query()] = [],
+        all_of: Annotated[List[str], Query()] = [],
+        offset: int = 0,
+        limit: int = 100
+) -> schemas.OrganizationPage:
+    """ ?all_of=Eat&any_of=Milk&any_of=Meat - under Eat and under Milk or Meat, subactivities included. """
+    with lookup_errors():
+        return await service.get_organizations_by_activities(any_of, all_of, offset, limit)
+
+
+@router.get("/get_buildings_in_viewport",
+            dependencies=[Depends(cheap_limiter)],
+            response_model=schemas.Viewport)
+async def get_buildings_in_viewport(
+        south: float,
+        west: float,
+        north: float,
+        east: float,
+        zoom: int,
+        service: building_service_dep,
+        basic_user: Annotated[schemas.User, Depends(get_basic_user)]
+) -> schemas.Viewport:
+    with lookup_errors():
+        return await service.get_viewport(south, west, north, east, zoom)
+
+
 @router.get("/get_organizations_by_subactivities",
+            dependencies=[Depends(expensive_limiter)],
             response_model=List[schemas.Organization])
 async def get_organizations_by_subactivities(
         activity: str,
         service: organization_service_dep,
         basic_user: Annotated[schemas.User, Depends(get_advanced_user)]
 ):
-    try:
+    with lookup_errors():
         organizations = await service.get_organizations_by_subactivities(activity)
-    except Exception as e:
-        raise HTTPException(400, str(e))
     if not organizations:
         raise HTTPException(404, "No data by this query")
     return organizations
@@ -0,0 +1,452 @@
+"""
+    Bulk import of buildings, activities and organizations (with their phones and
+    activities) from NDJSON or CSV.
+
+    python -m app.bulk_import data.ndjson
+    python -m app.bulk_import data.csv --batch-size 10000
+    python -m app.bulk_import data.ndjson --geocode
+
+    Every record has a `kind`:
+        {"kind": "building", "city": ..., "street": ..., "house": ..., "latitude": ..., "longitude": ...}
+        {"kind": "activity", "path": "Eat/Meat/Sausages"}
+        {"kind": "organization", "name": ..., "city": ..., "street": ..., "house": ...,
+         "phones": ["+375..."], "activities": ["Eat/Meat"]}
+    Phones are normalized to E.164 (app.phones), a record with an invalid one is rejected.
+    CSV files have the union of these columns, lists are ";"-separated.
+    Buildings without coordinates are geocoded by address (--geocode, see
+    app.geocoding) before their batch is written; without a geocoder, or when it
+    finds nothing, they are rejected.
+
+    Records are validated and written in batches, one transaction per batch.
+    Foreign keys are resolved in memory: buildings by address, activities by path
+    (missing parents are created), organizations by (building, name). Writes are
+    upserts on these natural keys, so re-running an import is harmless:
+    buildings get the new coordinates, phones move to the organization of the
+    latest record, activities are added. On asyncpg the phone and activity rows
+    go through COPY into a staging table.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import sys
+import time
+from typing import Annotated, Iterable, Iterator, Literal, Union
+
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError, field_validator, model_validator
+from sqlalchemy import select, tuple_, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.db import async_engine
+from app.geocoding import Geocoder, NominatimBackend
+from app.phones import normalize_phone
+from app.read_model import mark_dirty
+from app.services import BUILDINGS_TAG, ACTIVITIES_TAG, invalidate_organizations
+from app.uow import unit_of_work
+
+logger = logging.getLogger(__name__)
+
+PATH_SEPARATOR = "/"
+LIST_SEPARATOR = ";"
+# keys per IN (...) lookup
+LOOKUP_CHUNK_SIZE = 1000
+
+
+def _split_list(value):
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(LIST_SEPARATOR) if item.strip()]
+    return value
+
+
+class BuildingRecord(BaseModel):
+    kind: Literal["building"]
+    city: str
+    street: str
+    house: str
+    # both missing - geocoded by address
+    latitude: float | None = Field(None, ge=-90, le=90)
+    longitude: float | None = Field(None, ge=-180, le=180)
+
+    @model_validator(mode="after")
+    def coordinates_together(self):
+        if (self.latitude is None) != (self.longitude is None):
+            raise ValueError("latitude and longitude go together")
+        return self
+
+    @property
+    def address(self) -> tuple[str, str, str]:
+        return self.city, self.street, self.house
+
+
+class ActivityRecord(BaseModel):
+    kind: Literal["activity"]
+    path: str = Field(min_length=1)
+
+
+class OrganizationRecord(BaseModel):
+    kind: Literal["organization"]
+    name: str = Field(min_length=1)
+    city: str
+    street: str
+    house: str
+    phones: list[str] = []
+    activities: list[str] = []
+
+    _split_lists = field_validator("phones", "activities", mode="before")(_split_list)
+
+    @field_validator("phones")
+    @classmethod
+    def normalize_phones(cls, phones: list[str]) -> list[str]:
+        return [normalize_phone(phone) for phone in phones]
+
+    @property
+    def address(self) -> tuple[str, str, str]:
+        return self.city, self.street, self.house
+
+
+ImportRecord = Annotated[Union[BuildingRecord, ActivityRecord, OrganizationRecord], Field(discriminator="kind")]
+IMPORT_RECORD_ADAPTER = TypeAdapter(ImportRecord)
+
+
+def split_path(path: str) -> tuple[str, ...]:
+    return tuple(name.strip() for name in path.split(PATH_SEPARATOR) if name.strip())
+
+
+def read_ndjson(lines: Iterable[str]) -> Iterator[tuple[int, dict | str]]:
+    """ (line number, record) - or the error message for lines that aren't JSON objects. """
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, f"invalid JSON: {e}"
+
+
+def read_csv(lines: Iterable[str]) -> Iterator[tuple[int, dict]]:
+    # line 1 is the header
+    for number, row in enumerate(csv.DictReader(lines), 2):
+        yield number, {key: value for key, value in row.items() if value not in ("", None)}
+
+
+class ImportStats:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.records = 0
+        self.invalid = 0
+        self.buildings = 0
+        self.activities = 0
+        self.organizations = 0
+        self.phones = 0
+        self.errors: list[tuple[int, str]] = []
+
+    def as_dict(self) -> dict:
+        elapsed = time.perf_counter() - self.started_at
+        return {
+            "records": self.records,
+            "invalid": self.invalid,
+            "buildings": self.buildings,
+            "activities": self.activities,
+            "organizations": self.organizations,
+            "phones": self.phones,
+            "elapsed_seconds": round(elapsed, 3),
+            "records_per_second": round(self.records / elapsed) if elapsed else 0,
+        }
+
+
+class BulkImporter:
+    def __init__(self, batch_size: int = 5000, max_errors: int = 1000, geocoder: Geocoder | None = None):
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.geocoder = geocoder
+        self.stats = ImportStats()
+        # natural key -> id, filled as rows are written or looked up
+        self.building_ids: dict[tuple[str, str, str], int] = {}
+        self.activity_ids: dict[tuple[str, ...], int] | None = None
+
+    async def run(self, rows: Iterable[tuple[int, dict | str]]) -> ImportStats:
+        batch: list[BuildingRecord | ActivityRecord | OrganizationRecord] = []
+        for number, row in rows:
+            self.stats.records += 1
+            try:
+                if isinstance(row, str):
+                    raise ValueError(row)
+                batch.append(IMPORT_RECORD_ADAPTER.validate_python(row))
+            except (ValidationError, ValueError) as e:
+                self.reject(number, str(e))
+            if len(batch) >= self.batch_size:
+                await self.import_batch(batch)
+                batch = []
+        if batch:
+            await self.import_batch(batch)
+        logger.info("bulk import finished", extra=self.stats.as_dict())
+        return self.stats
+
+    def reject(self, number: int, error: str):
+        self.stats.invalid += 1
+        self.stats.errors.append((number, error))
+        logger.warning("invalid import record", extra={"line": number, "error": error})
+        if self.stats.invalid > self.max_errors:
+            raise RuntimeError(f"More than {self.max_errors} invalid records, import aborted.")
+
+    async def import_batch(self, records: list):
+        # the last record of a key wins within a batch
+        buildings = {r.address: r for r in records if isinstance(r, BuildingRecord)}
+        organizations = {(r.address, r.name): r for r in records if isinstance(r, OrganizationRecord)}
+        paths = {split_path(r.path) for r in records if isinstance(r, ActivityRecord)}
+        paths.update(split_path(path) for r in organizations.values() for path in r.activities)
+        paths.discard(())
+        # network calls, before the transaction is open
+        await self.geocode_buildings(buildings)
+
+        async with unit_of_work() as uow:
+            session = uow.session
+            if self.activity_ids is None:
+                self.activity_ids = await self.load_activities(session)
+            building_ids = await self.upsert_buildings(session, list(buildings.values()))
+            await self.create_activities(session, paths)
+            await self.resolve_buildings(session, {address for address, _ in organizations})
+            organization_ids = await self.upsert_organizations(session, list(organizations.values()))
+            moved_from = await self.upsert_phones(session, organizations, organization_ids)
+            await self.add_activities(session, organizations, organization_ids)
+            touched = {*organization_ids.values(), *moved_from}
+            mark_dirty(session, touched, building_ids)
+        # commit refreshed the read model, drop what was cached from the old data
+        await invalidate_organizations(touched, BUILDINGS_TAG, ACTIVITIES_TAG)
+        logger.info("bulk import progress", extra=self.stats.as_dict())
+
+    async def geocode_buildings(self, buildings: dict[tuple[str, str, str], BuildingRecord]):
+        """ Fills in missing coordinates, buildings that can't be placed are dropped. """
+        missing = [b for b in buildings.values() if b.latitude is None]
+        if not missing:
+            return
+        found = await self.geocoder.geocode_many([b.address for b in missing]) if self.geocoder else {}
+        for building in missing:
+            coordinates = found.get(building.address)
+            if coordinates is None:
+                del buildings[building.address]
+                self.stats.invalid += 1
+                logger.warning("building without coordinates", extra={"address": building.address})
+            else:
+                building.latitude, building.longitude = coordinates
+
+    @staticmethod
+    def insert(session: AsyncSession, table):
+        dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+        return dialect.insert(table)
+
+    async def load_activities(self, session: AsyncSession) -> dict[tuple[str, ...], int]:
+        rows = (await session.execute(
+            select(models.Activity.id, models.Activity.name, models.Activity.parent_id))).all()
+        by_id = {row.id: row for row in rows}
+        paths = {}
+
+        def path(activity_id: int) -> tuple[str, ...]:
+            row = by_id[activity_id]
+            if row.parent_id is None or row.parent_id not in by_id:
+                return (row.name,)
+            return (*path(row.parent_id), row.name)
+
+        for row in rows:
+            # the first of duplicates wins, same as the tree lookups
+            paths.setdefault(path(row.id), row.id)
+        return paths
+
+    async def create_activities(self, session: AsyncSession, paths: set[tuple[str, ...]]):
+        missing = {path[:depth] for path in paths for depth in range(1, len(path) + 1)} - set(self.activity_ids)
+        # level by level, parents get their ids first
+        for depth in sorted({len(path) for path in missing}):
+            level = sorted(path for path in missing if len(path) == depth)
+            result = await session.execute(
+                self.insert(session, models.Activity).returning(models.Activity.id, sort_by_parameter_order=True),
+                [{"name": path[-1], "parent_id": self.activity_ids[path[:-1]] if depth > 1 else None}
+                 for path in level]
+            )
+            self.activity_ids.update(zip(level, result.scalars()))
+            self.stats.activities += len(level)
+
+    async def upsert_buildings(self, session: AsyncSession, buildings: list[BuildingRecord]) -> set[int]:
+        if not buildings:
+            return set()
+        table = models.Building.__table__
+        statement = self.insert(session, table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.city, table.c.street, table.c.house],
+            set_={"latitude": statement.excluded.latitude, "longitude": statement.excluded.longitude},
+        ).returning(table.c.id, table.c.city, table.c.street, table.c.house)
+        result = await session.execute(statement, [b.model_dump(exclude={"kind"}) for b in buildings])
+        ids = set()
+        for row in result:
+            self.building_ids[(row.city, row.street, row.house)] = row.id
+            ids.add(row.id)
+        self.stats.buildings += len(buildings)
+        return ids
+
+    async def resolve_buildings(self, session: AsyncSession, addresses: set[tuple[str, str, str]]):
+        unknown = sorted(addresses - set(self.building_ids))
+        table = models.Building.__table__
+        for i in range(0, len(unknown), LOOKUP_CHUNK_SIZE):
+            result = await session.execute(
+                select(table.c.id, table.c.city, table.c.street, table.c.house)
+                .where(tuple_(table.c.city, table.c.street, table.c.house).in_(unknown[i:i + LOOKUP_CHUNK_SIZE]))
+            )
+            for row in result:
+                self.building_ids[(row.city, row.street, row.house)] = row.id
+
+    async def upsert_organizations(
+            self,
+            session: AsyncSession,
+            organizations: list[OrganizationRecord]
+    ) -> dict[tuple, int]:
+        """ (address, name) -> organization id. Organizations in unknown buildings are rejected. """
+        rows = []
+        addresses = {}
+        for organization in organizations:
+            building_id = self.building_ids.get(organization.address)
+            if building_id is None:
+                self.stats.invalid += 1
+                logger.warning("unknown building", extra={"organization": organization.name,
+                                                          "address": organization.address})
+                continue
+            rows.append({"name": organization.name, "building_id": building_id})
+            addresses[building_id] = organization.address
+        if not rows:
+            return {}
+
+        table = models.Organization.__table__
+        statement = self.insert(session, table)
+        # no-op update, so existing rows are returned too
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.building_id, table.c.name],
+            set_={"name": statement.excluded.name},
+        ).returning(table.c.id, table.c.building_id, table.c.name)
+        result = await session.execute(statement, rows)
+        self.stats.organizations += len(rows)
+        return {(addresses[row.building_id], row.name): row.id for row in result}
+
+    async def upsert_phones(
+            self,
+            session: AsyncSession,
+            organizations: dict[tuple, OrganizationRecord],
+            organization_ids: dict[tuple, int]
+    ) -> set[int]:
+        """ Returns the organizations phones were moved away from. """
+        owners = {}
+        for key, organization_id in organization_ids.items():
+            for phone in organizations[key].phones:
+                owners[phone] = organization_id
+        if not owners:
+            return set()
+
+        table = models.PhoneNumber.__table__
+        phones = sorted(owners)
+        previous_owners = set()
+        for i in range(0, len(phones), LOOKUP_CHUNK_SIZE):
+            previous_owners.update((await session.execute(
+                select(table.c.organization_id).where(table.c.phone_number.in_(phones[i:i + LOOKUP_CHUNK_SIZE]))
+            )).scalars())
+
+        records = [(phone, owners[phone]) for phone in phones]
+        if session.bind.dialect.driver == "asyncpg":
+            await self.copy_upsert(session, "phone_numbers", ("phone_number", "organization_id"), records,
+                                   "ON CONFLICT (phone_number) DO UPDATE SET organization_id = EXCLUDED.organization_id")
+        else:
+            statement = self.insert(session, table)
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.phone_number],
+                set_={"organization_id": statement.excluded.organization_id},
+            )
+            await session.execute(statement, [{"phone_number": p, "organization_id": o} for p, o in records])
+        self.stats.phones += len(records)
+        return previous_owners - set(owners.values()) - {None}
+
+    async def add_activities(
+            self,
+            session: AsyncSession,
+            organizations: dict[tuple, OrganizationRecord],
+            organization_ids: dict[tuple, int]
+    ):
+        records = sorted({
+            (organization_id, self.activity_ids[split_path(path)])
+            for key, organization_id in organization_ids.items()
+            for path in organizations[key].activities
+            if split_path(path)
+        })
+        if not records:
+            return
+        if session.bind.dialect.driver == "asyncpg":
+            await self.copy_upsert(session, "organization_activities", ("organization_id", "activity_id"), records,
+                                   "ON CONFLICT (organization_id, activity_id) DO NOTHING")
+        else:
+            await session.execute(
+                self.insert(session, models.OrganizationActivity.__table__).on_conflict_do_nothing(),
+                [{"organization_id": o, "activity_id": a} for o, a in records]
+            )
+
+    @staticmethod
+    async def copy_upsert(
+            session: AsyncSession,
+            table: str,
+            columns: tuple[str, ...],
+            records: list[tuple],
+            on_conflict: str
+    ):
+        """ COPY into a per-connection staging table, then one INSERT ... SELECT with `on_conflict`. """
+        staging = f"import_{table}"
+        column_list = ", ".join(columns)
+        await session.execute(text(
+            f"CREATE TEMP TABLE IF NOT EXISTS {staging} ON COMMIT DELETE ROWS "
+            f"AS SELECT {column_list} FROM {table} WITH NO DATA"
+        ))
+        connection = await session.connection()
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(staging, records=records, columns=list(columns))
+        await session.execute(text(
+            f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {staging} {on_conflict}"
+        ))
+
+
+async def run_import(
+        rows: Iterable[tuple[int, dict | str]],
+        batch_size: int,
+        max_errors: int,
+        geocode: bool = False
+) -> ImportStats:
+    try:
+        if not geocode:
+            return await BulkImporter(batch_size, max_errors).run(rows)
+        async with Geocoder(NominatimBackend()) as geocoder:
+            stats = await BulkImporter(batch_size, max_errors, geocoder).run(rows)
+        logger.info("geocoding finished", extra=geocoder.stats.as_dict())
+        return stats
+    finally:
+        await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import buildings, activities and organizations.")
+    parser.add_argument("path", help="NDJSON or CSV file, '-' for NDJSON from stdin")
+    parser.add_argument("--format", choices=["ndjson", "csv"],
+                        help="default: from the file extension")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--max-errors", type=int, default=1000)
+    parser.add_argument("--geocode", action="store_true",
+                        help="geocode buildings without coordinates with Nominatim")
+    args = parser.parse_args()
+
+    from app.log import setup_logging
+    setup_logging()
+
+    file_format = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    source = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8")
+    with source:
+        rows = read_csv(source) if file_format == "csv" else read_ndjson(source)
+        stats = asyncio.run(run_import(rows, args.batch_size, args.max_errors, args.geocode))
+    print(json.dumps(stats.as_dict()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Protocol, Any, Awaitable, Callable, Iterable
+
+from pydantic import TypeAdapter
+
+from app.config import settings
+
+
+def make_key(namespace: str, *parts) -> str:
+    return f"{namespace}:{json.dumps(parts, ensure_ascii=False)}"
+
+
+class CacheBackend(Protocol):
+    """
+    Shared (L2) cache storage. Besides plain values it keeps a version counter per
+    tag; bumping a tag's version invalidates every entry stored with an older one.
+    """
+
+    async def get(self, key: str) -> bytes | None:
+        ...
+
+    async def set(self, key: str, value: bytes, ttl: float | None) -> None:
+        ...
+
+    async def delete(self, keys: Iterable[str]) -> None:
+        ...
+
+    async def get_tag_versions(self, tags: list[str]) -> list[int]:
+        ...
+
+    async def bump_tags(self, tags: list[str]) -> None:
+        ...
+
+
+class MemoryBackend:
+    """
+    Process local stand-in for a shared backend - tests and single worker setups.
+    Holds at most `max_size` entries (least recently used go first) and drops
+    expired ones every `sweep_interval` seconds, read or not.
+    """
+
+    def __init__(self, max_size: int = 10000, sweep_interval: float = 60):
+        self.max_size = max_size
+        self.sweep_interval = sweep_interval
+        self.entries: OrderedDict[str, tuple[bytes, float | None]] = OrderedDict()
+        self.tags: dict[str, int] = {}
+        self._swept_at = time.time()
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at < time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float | None) -> None:
+        now = time.time()
+        self.entries[key] = (value, now + ttl if ttl else None)
+        self.entries.move_to_end(key)
+        if now - self._swept_at >= self.sweep_interval:
+            self._sweep(now)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def _sweep(self, now: float):
+        expired = [key for key, (_, expires_at) in self.entries.items()
+                   if expires_at is not None and expires_at < now]
+        for key in expired:
+            del self.entries[key]
+        self._swept_at = now
+
+    async def delete(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self.entries.pop(key, None)
+
+    async def get_tag_versions(self, tags: list[str]) -> list[int]:
+        return [self.tags.get(tag, 0) for tag in tags]
+
+    async def bump_tags(self, tags: list[str]) -> None:
+        for tag in tags:
+            self.tags[tag] = self.tags.get(tag, 0) + 1
+
+
+class SQLiteBackend:
+    """
+    Shared between the workers of one host through a sqlite file (WAL mode).
+    Calls run in a thread so the event loop doesn't block on disk.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache_entries "
+                               "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache_tags "
+                               "(tag TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+    async def _run(self, fn: Callable, *args):
+        def locked():
+            with self._lock:
+                return fn(*args)
+        return await asyncio.to_thread(locked)
+
+    def _get(self, key: str) -> bytes | None:
+        row = self._conn.execute("SELECT value, expires_at FROM cache_entries WHERE key = ?",
+                                 (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+            return None
+        return value
+
+    def _set(self, key: str, value: bytes, ttl: float | None):
+        self._conn.execute("INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                           (key, value, time.time() + ttl if ttl else None))
+
+    def _delete(self, keys: list[str]):
+        self._conn.executemany("DELETE FROM cache_entries WHERE key = ?", [(key,) for key in keys])
+
+    def _get_tag_versions(self, tags: list[str]) -> list[int]:
+        placeholders = ", ".join("?" for _ in tags)
+        rows = self._conn.execute(f"SELECT tag, version FROM cache_tags WHERE tag IN ({placeholders})",
+                                  tags).fetchall()
+        versions = dict(rows)
+        return [versions.get(tag, 0) for tag in tags]
+
+    def _bump_tags(self, tags: list[str]):
+        self._conn.executemany("INSERT INTO cache_tags (tag, version) VALUES (?, 1) "
+                               "ON CONFLICT(tag) DO UPDATE SET version = version + 1",
+                               [(tag,) for tag in tags])
+
+    async def get(self, key: str) -> bytes | None:
+        return await self._run(self._get, key)
+
+    async def set(self, key: str, value: bytes, ttl: float | None) -> None:
+        await self._run(self._set, key, value, ttl)
+
+    async def delete(self, keys: Iterable[str]) -> None:
+        await self._run(self._delete, list(keys))
+
+    async def get_tag_versions(self, tags: list[str]) -> list[int]:
+        if not tags:
+            return []
+        return await self._run(self._get_tag_versions, tags)
+
+    async def bump_tags(self, tags: list[str]) -> None:
+        await self._run(self._bump_tags, tags)
+
+
+class RedisBackend:
+    """ Any Redis-compatible server. Needs the `redis` package. """
+
+    tags_key = "cache:tags"
+
+    def __init__(self, url: str):
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND=redis requires the redis package.")
+        self.redis = redis.from_url(url)
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.redis.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float | None) -> None:
+        await self.redis.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    async def delete(self, keys: Iterable[str]) -> None:
+        keys = list(keys)
+        if keys:
+            await self.redis.delete(*keys)
+
+    async def get_tag_versions(self, tags: list[str]) -> list[int]:
+        if not tags:
+            return []
+        return [int(version or 0) for version in await self.redis.hmget(self.tags_key, tags)]
+
+    async def bump_tags(self, tags: list[str]) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for tag in tags:
+                pipe.hincrby(self.tags_key, tag, 1)
+            await pipe.execute()
+
+
+class TwoTierCache:
+    """
+    In-process LRU (L1) in front of a shared backend (L2).
+
+    Every entry is stored with the versions its tags had before the value was
+    loaded, and is served only while those versions are current. `invalidate(tags)`
+    bumps the versions in L2, so all workers drop the dependent entries. Workers
+    re-read a tag's version at most every `tag_check_interval` seconds, which bounds
+    how long another worker can serve a stale L1 entry (0 - always check).
+    """
+
+    def __init__(
+            self,
+            backend: CacheBackend,
+            default_ttl: float = 60,
+            l1_size: int = 10000,
+            tag_check_interval: float = 1
+    ):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self.l1_size = l1_size
+        self.tag_check_interval = tag_check_interval
+        # key -> (expires_at, tag versions, value)
+        self._l1: OrderedDict[str, tuple[float, dict[str, int], Any]] = OrderedDict()
+        # tag -> (version, checked_at)
+        self._tag_versions: dict[str, tuple[int, float]] = {}
+
+        self.hits_l1 = 0
+        self.hits_l2 = 0
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls) -> "TwoTierCache":
+        if settings.CACHE_BACKEND == "memory":
+            backend = MemoryBackend(max_size=settings.CACHE_MEMORY_SIZE, sweep_interval=settings.CACHE_TTL)
+        elif settings.CACHE_BACKEND == "sqlite":
+            backend = SQLiteBackend(settings.CACHE_URL or "cache.sqlite3")
+        elif settings.CACHE_BACKEND == "redis":
+            backend = RedisBackend(settings.CACHE_URL)
+        else:
+            raise ValueError(f"Unknown cache backend: {settings.CACHE_BACKEND}")
+        return cls(backend,
+                   default_ttl=settings.CACHE_TTL,
+                   l1_size=settings.CACHE_L1_SIZE,
+                   tag_check_interval=settings.CACHE_TAG_CHECK_INTERVAL)
+
+    async def tag_versions(self, tags: list[str]) -> dict[str, int]:
+        now = time.monotonic()
+        stale = [tag for tag in tags
+                 if tag not in self._tag_versions
+                 or now - self._tag_versions[tag][1] >= self.tag_check_interval]
+        if stale:
+            for tag, version in zip(stale, await self.backend.get_tag_versions(stale)):
+                self._tag_versions[tag] = (version, now)
+        return {tag: self._tag_versions[tag][0] for tag in tags}
+
+    async def get_or_load(
+            self,
+            key: str,
+            loader: Callable[[], Awaitable[Any]],
+            adapter: TypeAdapter,
+            tags: list[str] = (),
+            ttl: float | None = None
+    ) -> Any:
+        """ Cached value of `key`, or the result of `loader()` which is then cached. None isn't cached. """
+        tags = list(tags)
+        versions = await self.tag_versions(tags)
+        now = time.time()
+
+        entry = self._l1.get(key)
+        if entry is not None:
+            expires_at, entry_versions, value = entry
+            if expires_at > now and entry_versions == versions:
+                self._l1.move_to_end(key)
+                self.hits_l1 += 1
+                return value
+            del self._l1[key]
+
+        raw = await self.backend.get(key)
+        if raw is not None:
+            header, _, body = raw.partition(b"\n")
+            entry_versions = json.loads(header)
+            if entry_versions == versions:
+                value = adapter.validate_json(body)
+                self._store_l1(key, value, versions, ttl)
+                self.hits_l2 += 1
+                return value
+
+        self.misses += 1
+        value = await loader()
+        if value is not None:
+            self._store_l1(key, value, versions, ttl)
+            raw = json.dumps(versions).encode() + b"\n" + adapter.dump_json(value)
+            await self.backend.set(key, raw, ttl or self.default_ttl)
+        return value
+
+    def _store_l1(self, key: str, value: Any, versions: dict[str, int], ttl: float | None):
+        self._l1[key] = (time.time() + (ttl or self.default_ttl), versions, value)
+        self._l1.move_to_end(key)
+        while len(self._l1) > self.l1_size:
+            self._l1.popitem(last=False)
+
+    async def invalidate(self, tags: Iterable[str]):
+        tags = list(tags)
+        if not tags:
+            return
+        await self.backend.bump_tags(tags)
+        for tag in tags:
+            # this worker sees its own writes right away
+            self._tag_versions.pop(tag, None)
+
+    def clear_local(self):
+        self._l1.clear()
+        self._tag_versions.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits_l1 + self.hits_l2 + self.misses
+        return {
+            "hits_l1": self.hits_l1,
+            "hits_l2": self.hits_l2,
+            "misses": self.misses,
+            "hit_ratio": (self.hits_l1 + self.hits_l2) / lookups if lookups else 0.0,
+            "l1_entries": len(self._l1),
+        }
+
+
+cache = TwoTierCache.from_settings()
@@ -1,12 +1,100 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+import time
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.config import settings
 
-async_engine = create_async_engine(
-    url=settings.DATABASE_URL_asyncpg,
-    echo=True
-)
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """ Queue pool which also measures how long checkouts wait for a connection. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            self.checkouts += 1
+            self.total_wait += waited
+            if waited > self.max_wait:
+                self.max_wait = waited
+
+
+def make_engine(url: str, pool_size: int | None = None, max_overflow: int | None = None) -> AsyncEngine:
+    """ `pool_size`, `max_overflow` - override the DB_POOL_* settings, for side pools like exports. """
+    if not url.startswith("postgresql+asyncpg"):
+        # sqlite stand-ins etc. - dialect default pool, no asyncpg arguments
+        return create_async_engine(url=url, echo=settings.DB_ECHO)
+
+    server_settings = {}
+    if settings.DB_STATEMENT_TIMEOUT_MS:
+        server_settings["statement_timeout"] = str(settings.DB_STATEMENT_TIMEOUT_MS)
+    return create_async_engine(
+        url=url,
+        echo=settings.DB_ECHO,
+        poolclass=TimedQueuePool,
+        pool_size=settings.DB_POOL_SIZE if pool_size is None else pool_size,
+        max_overflow=settings.DB_MAX_OVERFLOW if max_overflow is None else max_overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        connect_args={
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "server_settings": server_settings,
+        }
+    )
+
+
+def pool_stats(engine: AsyncEngine) -> dict:
+    pool = engine.pool
+    stats = {"status": pool.status()}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+    if isinstance(pool, TimedQueuePool):
+        stats.update(
+            checkouts=pool.checkouts,
+            total_wait_seconds=pool.total_wait,
+            max_wait_seconds=pool.max_wait,
+            avg_wait_seconds=pool.total_wait / pool.checkouts if pool.checkouts else 0.0,
+        )
+    return stats
+
+
+def make_read_only_sessionmaker(engine: AsyncEngine) -> async_sessionmaker:
+    # read-only sessions never flush and never commit, so there is nothing to expire.
+    # READ ONLY transaction, so multi-statement reads see one consistent snapshot
+    return async_sessionmaker(
+        autoflush=False,
+        expire_on_commit=False,
+        bind=engine.execution_options(postgresql_readonly=True)
+    )
+
+
+def make_autocommit_sessionmaker(engine: AsyncEngine) -> async_sessionmaker:
+    # single-statement reads don't need a transaction at all (no BEGIN/COMMIT round trips)
+    return async_sessionmaker(
+        autoflush=False,
+        expire_on_commit=False,
+        bind=engine.execution_options(isolation_level="AUTOCOMMIT")
+    )
+
+
+async_engine = make_engine(settings.DATABASE_URL_asyncpg)
 AsyncSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, bind=async_engine)
+ReadOnlySessionLocal = make_read_only_sessionmaker(async_engine)
+AutocommitSessionLocal = make_autocommit_sessionmaker(async_engine)
 
 Base = declarative_base()
@@ -0,0 +1,27 @@
+"""
+    Per-request deadlines. DeadlineMiddleware sets the deadline of a request, code
+    below it asks how much time is left (to bound timeouts of outgoing calls) or
+    refuses to start work that can't finish in time.
+"""
+import asyncio
+from contextvars import ContextVar
+
+# loop.time() by which the current request has to be answered, None - no deadline
+current_deadline: ContextVar[float | None] = ContextVar("current_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def time_left() -> float | None:
+    deadline = current_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - asyncio.get_running_loop().time()
+
+
+def check_deadline():
+    left = time_left()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
@@ -47,7 +47,7 @@ async def get_current_user(
         token_data = TokenData(scopes=token_scopes, username=username)
     except (InvalidTokenError, ValidationError):
         raise credentials_exception
-    async with unit_of_work() as uow:
+    async with unit_of_work(read_only=True, single_statement=True, primary=True) as uow:
         user = await uow.user_repository.get_user(token_data.username)
     if not user:
         raise credentials_exception
@@ -0,0 +1,179 @@
+"""
+    Streaming export of the organization directory (the organization_documents read
+    model) as NDJSON or CSV, optionally gzip or zstd compressed.
+
+    python -m app.export --format csv --compression gzip -o organizations.csv.gz
+
+    Rows come from a server-side cursor in a single REPEATABLE READ, READ ONLY
+    transaction - one consistent snapshot however long the export runs, in constant
+    memory. Exports use their own small pool (on a replica when configured), so a
+    full dump doesn't take connections from request handling.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import sys
+import zlib
+from typing import AsyncIterator
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app import models
+from app.config import settings
+from app.db import make_engine
+from app.replicas import replica_pool
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+# compression -> (file extension, media type of the compressed file)
+COMPRESSIONS = {"none": ("", None), "gzip": (".gz", "application/gzip"), "zstd": (".zst", "application/zstd")}
+CSV_COLUMNS = ["id", "name", "building_id", "city", "street", "house", "latitude", "longitude",
+               "phone_numbers", "activity_ids"]
+# bytes buffered before a chunk is compressed and sent
+CHUNK_SIZE = 64 * 1024
+
+documents = models.OrganizationDocument.__table__
+
+# url -> engine, created on first export
+_engines: dict[str, AsyncEngine] = {}
+# concurrent exports per process
+export_slots = asyncio.Semaphore(settings.EXPORT_POOL_SIZE)
+
+
+def export_engine() -> AsyncEngine:
+    # the engine outlives this export, so it can't report a trial's outcome
+    replica, _ = replica_pool.choose(allow_trial=False)
+    url = replica.url if replica is not None else settings.DATABASE_URL_asyncpg
+    if url not in _engines:
+        _engines[url] = make_engine(url, pool_size=settings.EXPORT_POOL_SIZE, max_overflow=0)
+    return _engines[url]
+
+
+async def dispose_engines():
+    for engine in _engines.values():
+        await engine.dispose()
+    _engines.clear()
+
+
+def validate(file_format: str, compression: str):
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown format: {file_format}")
+    _Compressor(compression)
+
+
+class _Compressor:
+    def __init__(self, compression: str):
+        if compression == "gzip":
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        elif compression == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise ValueError("zstd compression requires the zstandard package.")
+            self._compressor = zstandard.ZstdCompressor().compressobj()
+        elif compression == "none":
+            self._compressor = None
+        else:
+            raise ValueError(f"Unknown compression: {compression}")
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) if self._compressor else data
+
+    def flush(self) -> bytes:
+        return self._compressor.flush() if self._compressor else b""
+
+
+def _document(row) -> dict:
+    return {
+        "id": row.organization_id,
+        "name": row.name,
+        "building_id": row.building_id,
+        "city": row.city,
+        "street": row.street,
+        "house": row.house,
+        "latitude": row.latitude,
+        "longitude": row.longitude,
+        "phone_numbers": row.phone_numbers,
+        "activity_ids": row.activity_ids,
+    }
+
+
+def _csv_row(row) -> list:
+    return [row.organization_id, row.name, row.building_id, row.city, row.street, row.house,
+            row.latitude, row.longitude,
+            ";".join(phone["phone_number"] for phone in row.phone_numbers),
+            ";".join(str(activity_id) for activity_id in row.activity_ids)]
+
+
+async def _rows(engine: AsyncEngine, batch_size: int):
+    async with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            conn = await conn.execution_options(isolation_level="REPEATABLE READ", postgresql_readonly=True)
+        async with conn.begin():
+            result = await conn.stream(
+                select(documents).order_by(documents.c.organization_id)
+                .execution_options(yield_per=batch_size)
+            )
+            async for partition in result.partitions():
+                for row in partition:
+                    yield row
+
+
+async def export_documents(
+        file_format: str = "ndjson",
+        compression: str = "none",
+        engine: AsyncEngine | None = None,
+        batch_size: int | None = None
+) -> AsyncIterator[bytes]:
+    """ The whole directory as `file_format` chunks, compressed with `compression`. """
+    validate(file_format, compression)
+    compressor = _Compressor(compression)
+    engine = engine or export_engine()
+    buffer = io.StringIO()
+    writer = None
+    if file_format == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+
+    async with export_slots:
+        async for row in _rows(engine, batch_size or settings.EXPORT_BATCH_SIZE):
+            if writer is not None:
+                writer.writerow(_csv_row(row))
+            else:
+                buffer.write(json.dumps(_document(row), ensure_ascii=False))
+                buffer.write("\n")
+            if buffer.tell() >= CHUNK_SIZE:
+                chunk = compressor.compress(buffer.getvalue().encode())
+                buffer.seek(0)
+                buffer.truncate()
+                if chunk:
+                    yield chunk
+    yield compressor.compress(buffer.getvalue().encode()) + compressor.flush()
+
+
+async def export_to(out, file_format: str, compression: str):
+    try:
+        async for chunk in export_documents(file_format, compression):
+            out.write(chunk)
+    finally:
+        await dispose_engines()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the organization directory.")
+    parser.add_argument("--format", choices=list(FORMATS), default="ndjson")
+    parser.add_argument("--compression", choices=list(COMPRESSIONS), default="none")
+    parser.add_argument("-o", "--output", help="default: stdout")
+    args = parser.parse_args()
+
+    if args.output:
+        with open(args.output, "wb") as out:
+            asyncio.run(export_to(out, args.format, args.compression))
+    else:
+        asyncio.run(export_to(sys.stdout.buffer, args.format, args.compression))
+
+
+if __name__ == '__main__':
+    main()
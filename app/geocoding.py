@@ -0,0 +1,291 @@
+"""
+    Forward geocoding of building addresses for ingestion.
+
+    Addresses are geocoded concurrently, but every backend request goes through one
+    token bucket, so the geocoder's usage policy holds however many tasks run (the
+    public Nominatim allows 1 request per second). Results, including "not found",
+    are kept in the geocoded_addresses table as they come in, so an address isn't
+    asked twice, even when a run is cut short - until the result is older than
+    GEOCODER_RESULT_TTL (GEOCODER_NOT_FOUND_TTL for "not found").
+    Timeouts, unavailability and rate limiting are retried with exponential backoff.
+
+    The backend is pluggable: NominatimBackend (geopy with the aiohttp adapter, the
+    same integration as the reverse geocoding of GeoUtils) or StaticBackend, a local
+    stand-in answering from a dict.
+"""
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Protocol
+
+from geopy import Nominatim
+from geopy.adapters import AioHTTPAdapter
+from geopy.exc import GeocoderRateLimited, GeocoderServiceError, GeocoderTimedOut, GeocoderUnavailable
+from sqlalchemy import and_, or_, select
+
+from app import models
+from app.config import settings
+from app.metrics import GEOCODER_REQUEST_DURATION
+from app.repositories import upsert_statement
+from app.uow import unit_of_work
+
+logger = logging.getLogger(__name__)
+
+Address = tuple[str, str, str]
+Coordinates = tuple[float, float]
+
+try:
+    from aiohttp import ClientError
+except ImportError:
+    # only NominatimBackend needs aiohttp
+    ClientError = OSError
+
+RETRYABLE = (GeocoderTimedOut, GeocoderUnavailable, GeocoderRateLimited)
+# failures of a single address: it is left out, the next run asks again
+FAILURES = (GeocoderServiceError, ClientError, OSError)
+# queries per cache lookup
+LOOKUP_CHUNK_SIZE = 1000
+# geocoded results per write to the cache table
+STORE_CHUNK_SIZE = 100
+
+
+def address_query(address: Address) -> str:
+    """ Free-form query of a (city, street, house) address, normalized - it is also the cache key. """
+    city, street, house = address
+    return " ".join(f"{street} {house}, {city}".lower().split())
+
+
+class GeocoderBackend(Protocol):
+    async def __aenter__(self) -> "GeocoderBackend": ...
+
+    async def __aexit__(self, *exc_info): ...
+
+    async def geocode(self, query: str) -> Coordinates | None:
+        """ Coordinates of the best match, None - nothing found. Raises geopy exceptions. """
+        ...
+
+
+class NominatimBackend:
+    def __init__(self, domain: str = "", timeout: float | None = None):
+        self.domain = domain or settings.GEOCODER_DOMAIN
+        self.timeout = timeout or settings.GEOCODER_TIMEOUT
+        self._geolocator: Nominatim | None = None
+
+    async def __aenter__(self) -> "NominatimBackend":
+        kwargs = {"domain": self.domain} if self.domain else {}
+        geolocator = Nominatim(user_agent="companies_app", adapter_factory=AioHTTPAdapter,
+                               timeout=self.timeout, **kwargs)
+        self._geolocator = await geolocator.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        geolocator, self._geolocator = self._geolocator, None
+        await geolocator.__aexit__(*exc_info)
+
+    async def geocode(self, query: str) -> Coordinates | None:
+        location = await self._geolocator.geocode(query, exactly_one=True)
+        if not location:
+            return None
+        return location.latitude, location.longitude
+
+
+class StaticBackend:
+    """ Answers from `results` (query -> coordinates); `failures` - errors raised by the first calls. """
+
+    def __init__(self, results: dict[str, Coordinates], failures: Iterable[Exception] = ()):
+        self.results = results
+        self.failures = list(failures)
+        self.queries: list[str] = []
+
+    async def __aenter__(self) -> "StaticBackend":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def geocode(self, query: str) -> Coordinates | None:
+        self.queries.append(query)
+        if self.failures:
+            raise self.failures.pop(0)
+        return self.results.get(query)
+
+
+class RateLimiter:
+    """ Token bucket: `rate` acquisitions per second on average, bursts of up to `burst`. """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # waiters queue on the lock, so they are served in order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """ No acquisitions for `seconds` - the backend asked to back off. """
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+        # otherwise the next acquire() refills for the time before the pause
+        self.updated = time.monotonic()
+
+
+class GeocodeStats:
+    def __init__(self):
+        self.cached = 0
+        self.requests = 0
+        self.retries = 0
+        self.found = 0
+        self.not_found = 0
+        self.failed = 0
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+class Geocoder:
+    """
+    async with Geocoder(NominatimBackend()) as geocoder:
+        coordinates = await geocoder.geocode_many(addresses)
+    """
+
+    def __init__(
+            self,
+            backend: GeocoderBackend,
+            rate: float | None = None,
+            concurrency: int | None = None,
+            retries: int | None = None,
+            backoff: float | None = None
+    ):
+        self.backend = backend
+        self.limiter = RateLimiter(rate or settings.GEOCODER_RATE)
+        self.concurrency = concurrency or settings.GEOCODER_CONCURRENCY
+        self.retries = settings.GEOCODER_RETRIES if retries is None else retries
+        self.backoff = settings.GEOCODER_BACKOFF if backoff is None else backoff
+        self.stats = GeocodeStats()
+
+    async def __aenter__(self) -> "Geocoder":
+        await self.backend.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.backend.__aexit__(*exc_info)
+
+    async def geocode_many(self, addresses: Iterable[Address]) -> dict[Address, Coordinates | None]:
+        """
+        Coordinates of every address, None - not found. Addresses the geocoder kept
+        failing on are left out and not cached, the next run asks again.
+        """
+        queries = {address: address_query(address) for address in set(addresses)}
+        results = await self.load_cached(set(queries.values()))
+        self.stats.cached += len(results)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def geocode(query: str):
+            async with semaphore:
+                try:
+                    return query, await self.geocode(query)
+                except FAILURES as e:
+                    self.stats.failed += 1
+                    logger.warning("geocoding failed", extra={"query": query, "error": repr(e)})
+                    return query, e
+
+        fetched: dict[str, Coordinates | None] = {}
+
+        async def store_fetched():
+            batch = dict(fetched)
+            fetched.clear()
+            await self.store(batch)
+            results.update(batch)
+
+        tasks = [asyncio.ensure_future(geocode(query)) for query in sorted(set(queries.values()) - set(results))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                query, coordinates = await next_done
+                if not isinstance(coordinates, Exception):
+                    fetched[query] = coordinates
+                if len(fetched) >= STORE_CHUNK_SIZE:
+                    await store_fetched()
+        finally:
+            for task in tasks:
+                task.cancel()
+            # what was fetched is kept however the run ends
+            await asyncio.shield(store_fetched())
+        return {address: results[query] for address, query in queries.items() if query in results}
+
+    async def geocode(self, query: str) -> Coordinates | None:
+        for attempt in range(self.retries + 1):
+            await self.limiter.acquire()
+            self.stats.requests += 1
+            try:
+                with GEOCODER_REQUEST_DURATION.time("forward"):
+                    coordinates = await self.backend.geocode(query)
+            except RETRYABLE as e:
+                if attempt == self.retries:
+                    raise
+                if isinstance(e, GeocoderRateLimited) and e.retry_after:
+                    self.limiter.pause(e.retry_after)
+                self.stats.retries += 1
+                # full jitter, retries of concurrent tasks don't come back together
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+                continue
+            if coordinates is None:
+                self.stats.not_found += 1
+            else:
+                self.stats.found += 1
+            return coordinates
+
+    @staticmethod
+    async def load_cached(
+            queries: set[str],
+            result_ttl: float = settings.GEOCODER_RESULT_TTL,
+            not_found_ttl: float = settings.GEOCODER_NOT_FOUND_TTL
+    ) -> dict[str, Coordinates | None]:
+        """ Results younger than their TTL; expired ones are left out, so they are asked again. """
+        table = models.GeocodedAddress.__table__
+        queries = sorted(queries)
+        now = datetime.now(timezone.utc)
+        fresh = or_(
+            and_(table.c.latitude.is_not(None), table.c.geocoded_at >= now - timedelta(seconds=result_ttl)),
+            and_(table.c.latitude.is_(None), table.c.geocoded_at >= now - timedelta(seconds=not_found_ttl)),
+        )
+        results = {}
+        async with unit_of_work(read_only=True, primary=True) as uow:
+            for i in range(0, len(queries), LOOKUP_CHUNK_SIZE):
+                rows = await uow.session.execute(
+                    select(table.c.query, table.c.latitude, table.c.longitude)
+                    .where(table.c.query.in_(queries[i:i + LOOKUP_CHUNK_SIZE]), fresh)
+                )
+                for row in rows:
+                    results[row.query] = None if row.latitude is None else (row.latitude, row.longitude)
+        return results
+
+    @staticmethod
+    async def store(results: dict[str, Coordinates | None]):
+        if not results:
+            return
+        now = datetime.now(timezone.utc)
+        async with unit_of_work() as uow:
+            statement = upsert_statement(uow.session, models.GeocodedAddress)
+            statement = statement.on_conflict_do_update(
+                index_elements=[models.GeocodedAddress.query],
+                set_={"latitude": statement.excluded.latitude, "longitude": statement.excluded.longitude,
+                      "geocoded_at": statement.excluded.geocoded_at},
+            )
+            await uow.session.execute(statement, [
+                {"query": query, "latitude": coordinates and coordinates[0],
+                 "longitude": coordinates and coordinates[1], "geocoded_at": now}
+                for query, coordinates in results.items()
+            ])
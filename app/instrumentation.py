@@ -0,0 +1,64 @@
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryStats:
+    """ SQL statements executed while handling one request. """
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement: str | None = None
+        # statement text with bound parameters is the "shape" of a query
+        self.shapes: Counter[str] = Counter()
+        self.shape_times: Counter[str] = Counter()
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.total_time += duration
+        self.shapes[statement] += 1
+        self.shape_times[statement] += duration
+        if duration > self.slowest_time:
+            self.slowest_time = duration
+            self.slowest_statement = statement
+
+    def repeated_statements(self, threshold: int) -> list[tuple[str, int]]:
+        """ Statements executed more than `threshold` times - likely N+1 queries. """
+        return [(statement, count) for statement, count in self.shapes.most_common()
+                if count > threshold]
+
+    def statements(self) -> list[dict]:
+        """ Per statement shape: executions and total time, slowest first. """
+        return [{"statement": statement, "count": self.shapes[statement], "total_ms": round(duration * 1000, 3)}
+                for statement, duration in self.shape_times.most_common()]
+
+    def as_dict(self) -> dict:
+        return {
+            "db_statements": self.count,
+            "db_time_ms": round(self.total_time * 1000, 3),
+            "db_slowest_ms": round(self.slowest_time * 1000, 3),
+            "db_slowest_statement": self.slowest_statement,
+        }
+
+
+current_query_stats: ContextVar[QueryStats | None] = ContextVar("current_query_stats", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # on the statement's own context - a failing statement gets no after_cursor_execute
+    if context is not None:
+        context.query_start_time = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "query_start_time", None)
+    stats = current_query_stats.get()
+    if start is not None and stats is not None:
+        stats.record(statement, time.perf_counter() - start)
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app import export, metrics
+from app.config import settings
+from app.db import async_engine
+from app.replicas import replica_pool
+from app.repositories import HOT_STATEMENTS
+from app.services import GeoUtils, OrganizationService, activity_index
+
+logger = logging.getLogger(__name__)
+
+
+async def warm_up_connection(engine: AsyncEngine):
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        # through a session - ORM statements are cached per execution path
+        async with AsyncSession(bind=conn) as session:
+            for statement, parameters in HOT_STATEMENTS:
+                await session.execute(statement, parameters)
+
+
+async def warm_up_engine(engine: AsyncEngine, connections: int):
+    """ Opens `connections` pooled connections at once and runs every hot statement on each. """
+    await asyncio.gather(*(warm_up_connection(engine) for _ in range(connections)))
+
+
+async def warm_up():
+    await GeoUtils.open_geolocator()
+    await warm_up_engine(async_engine, settings.DB_POOL_WARMUP_CONNECTIONS)
+    for replica in replica_pool.replicas:
+        try:
+            await warm_up_engine(replica.engine, settings.DB_POOL_WARMUP_CONNECTIONS)
+        except Exception:
+            logger.exception("replica warm up failed", extra={"replica": repr(replica)})
+            replica_pool.eject(replica)
+    await OrganizationService().get_activity_tree()
+    await activity_index.get()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    await warm_up()
+    background = []
+    if replica_pool.replicas:
+        background.append(asyncio.create_task(replica_pool.run_health_checks()))
+    if metrics.store is not None:
+        background.append(asyncio.create_task(metrics.run_flush(settings.METRICS_FLUSH_INTERVAL)))
+    app.state.ready = True
+    logger.info("application is warm")
+    try:
+        yield
+    finally:
+        app.state.ready = False
+        for task in background:
+            task.cancel()
+        await metrics.flush()
+        await GeoUtils.close_geolocator()
+        await export.dispose_engines()
+        await replica_pool.dispose()
+        await async_engine.dispose()
@@ -0,0 +1,91 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from app.config import settings
+
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+# attributes every LogRecord has - everything else came from `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id"}
+
+
+class JsonFormatter(logging.Formatter):
+    """ One JSON object per line: standard fields, request id and everything passed in `extra`. """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        data.update((key, value) for key, value in vars(record).items()
+                    if key not in _RECORD_ATTRIBUTES)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """ Lets through only a fraction of records per level, e.g. {logging.DEBUG: 0.01}. """
+
+    def __init__(self, rates: dict[int, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Puts records on an in-memory queue, formatting and writing happen in the
+    listener thread. Everything that depends on the caller's context (message
+    arguments, traceback, request id) is captured here.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.request_id = request_id_var.get()
+        return record
+
+
+def parse_sampling(value: str) -> dict[int, float]:
+    """ "DEBUG:0.01,INFO:0.5" -> {10: 0.01, 20: 0.5} """
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        level, rate = item.split(":")
+        rates[logging.getLevelName(level.strip().upper())] = float(rate)
+    return rates
+
+
+def setup_logging() -> QueueListener:
+    log_queue = queue.SimpleQueue()
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(parse_sampling(settings.LOG_SAMPLING)))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(settings.LOG_LEVEL)
+    return listener
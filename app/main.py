@@ -1,13 +1,60 @@
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends
 
-from app.api.api_v1.endpoints import organizations_ep, auth_ep
+from app.api.api_v1.endpoints import organizations_ep, auth_ep, admin_ep, health_ep, metrics_ep, ingest_ep
+from app.config import settings
+from app.deadlines import DeadlineExceeded
+from app.dependencies import verify_api_key
+from app.lifespan import lifespan
+from app.log import setup_logging
+from app.middleware import (QueryStatsMiddleware, RequestIdMiddleware, ResponseCacheMiddleware, ProfilingMiddleware,
+                            MetricsMiddleware, DeadlineMiddleware, deadline_exceeded_handler)
+from app.profiling import profile_store
 
 
-app = FastAPI()
+setup_logging()
+
+app = FastAPI(lifespan=lifespan)
+app.add_exception_handler(DeadlineExceeded, deadline_exceeded_handler)
+app.add_middleware(DeadlineMiddleware, deadlines={
+    "/get_organizations_by_building_address": settings.REQUEST_DEADLINE,
+    "/get_organizations_by_activity": settings.REQUEST_DEADLINE,
+    "/get_organization_by_id": settings.REQUEST_DEADLINE,
+    "/get_organization_by_name": settings.REQUEST_DEADLINE,
+    "/get_organization_by_phone_number": settings.REQUEST_DEADLINE,
+    "/get_organizations_by_phone_numbers": settings.REQUEST_DEADLINE,
+    "/search_organizations": settings.REQUEST_DEADLINE,
+    "/get_organizations_by_activities": settings.REQUEST_DEADLINE,
+    "/get_buildings_in_viewport": settings.REQUEST_DEADLINE,
+    "/get_organizations_by_coordinates": settings.REQUEST_DEADLINE_EXPENSIVE,
+    "/get_organizations_by_subactivities": settings.REQUEST_DEADLINE_EXPENSIVE,
+})
+app.add_middleware(ResponseCacheMiddleware, ttls={
+    "/get_organizations_by_building_address": settings.RESPONSE_CACHE_TTL,
+    "/get_organizations_by_activity": settings.RESPONSE_CACHE_TTL,
+    "/get_organization_by_id": settings.RESPONSE_CACHE_TTL,
+    "/get_organization_by_name": settings.RESPONSE_CACHE_TTL,
+    "/search_organizations": settings.RESPONSE_CACHE_TTL,
+    "/get_organizations_by_activities": settings.RESPONSE_CACHE_TTL,
+    "/get_organization_by_phone_number": settings.RESPONSE_CACHE_TTL,
+    "/get_organizations_by_coordinates": settings.RESPONSE_CACHE_TTL_EXPENSIVE,
+    "/get_organizations_by_subactivities": settings.RESPONSE_CACHE_TTL_EXPENSIVE,
+})
+app.add_middleware(ProfilingMiddleware,
+                   store=profile_store,
+                   sample_rate=settings.PROFILE_SAMPLE_RATE,
+                   interval=settings.PROFILE_INTERVAL_MS / 1000)
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(MetricsMiddleware, routes=app.routes)
+# the last added middleware is the outermost one, request id has to be set before anything logs
+app.add_middleware(RequestIdMiddleware)
 
 app.include_router(organizations_ep.router, dependencies=[], tags=["Organizations"])
 app.include_router(auth_ep.router, dependencies=[], tags=["Authentication"])
+app.include_router(ingest_ep.router, dependencies=[Depends(verify_api_key)], tags=["Ingestion"])
+app.include_router(admin_ep.router, dependencies=[Depends(verify_api_key)], tags=["Admin"])
+app.include_router(health_ep.router, dependencies=[], tags=["Health"])
+app.include_router(metrics_ep.router, dependencies=[], tags=["Metrics"])
 
 if __name__ == '__main__':
     uvicorn.run(host="localhost", port=82, app="main:app", reload=True)
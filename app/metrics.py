@@ -0,0 +1,306 @@
+"""
+    Prometheus metrics without the client library.
+
+    Metrics are updated from the event loop thread only, so the hot path is a plain
+    dict update with no locks. With METRICS_MULTIPROC_DIR set every worker dumps its
+    values to `<dir>/metrics_<pid>.json` every METRICS_FLUSH_INTERVAL seconds (and
+    on scrape and shutdown); a scrape sums counters and histograms over all files,
+    dead workers' included so counters never go down, and reports gauges of live
+    workers with a `pid` label.
+"""
+import asyncio
+import bisect
+import functools
+import glob
+import inspect
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+from app.cache import cache
+from app.config import settings
+from app.db import async_engine, pool_stats
+from app.replicas import replica_pool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = tuple[str, ...]
+
+
+class Metric:
+    kind: str
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: tuple[str, ...] = (),
+            callback: Callable[[], dict[Labels, float]] | None = None
+    ):
+        """ `callback` - computes the values at collection time instead of them being updated. """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.callback = callback
+        self.values: dict[Labels, float] = {}
+
+    def collect(self) -> dict[Labels, object]:
+        return self.callback() if self.callback is not None else dict(self.values)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str):
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self.values: dict[Labels, list[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def collect(self) -> dict[Labels, list[float]]:
+        return {labels: list(state) for labels, state in self.values.items()}
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> dict:
+        return {
+            name: [[list(labels), value] for labels, value in metric.collect().items()]
+            for name, metric in self.metrics.items()
+        }
+
+    def render(self, snapshots: dict[int, dict], live_pids: set[int] | None = None) -> str:
+        """
+        Text exposition of per-process `snapshots` (pid -> snapshot). Gauges get a
+        `pid` label when there are several processes and are skipped for dead ones.
+        """
+        multiprocess = live_pids is not None
+        lines = []
+        for name, metric in self.metrics.items():
+            merged: dict[Labels, object] = {}
+            for pid, snapshot in snapshots.items():
+                for labels, value in snapshot.get(name, []):
+                    labels = tuple(labels)
+                    if metric.kind == "gauge":
+                        if multiprocess:
+                            if pid not in live_pids:
+                                continue
+                            labels = (*labels, str(pid))
+                        merged[labels] = value
+                    elif metric.kind == "histogram":
+                        current = merged.get(labels)
+                        merged[labels] = value if current is None else [a + b for a, b in zip(current, value)]
+                    else:
+                        merged[labels] = merged.get(labels, 0.0) + value
+
+            labelnames = metric.labelnames
+            if metric.kind == "gauge" and multiprocess:
+                labelnames = (*labelnames, "pid")
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, value in sorted(merged.items()):
+                pairs = list(zip(labelnames, labels))
+                if metric.kind == "histogram":
+                    cumulative = 0
+                    for bound, count in zip((*metric.buckets, float("inf")), value[:-1]):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(float(bound))
+                        lines.append(f"{name}_bucket{_labels([*pairs, ('le', le)])} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(pairs)} {value[-1]}")
+                    lines.append(f"{name}_count{_labels(pairs)} {cumulative}")
+                else:
+                    lines.append(f"{name}{_labels(pairs)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(pairs: list[tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MultiProcessStore:
+    """ Per-worker snapshot files in a directory shared by the workers of one host. """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"metrics_{pid}.json")
+
+    def write(self, snapshot: dict, pid: int | None = None):
+        path = self.path(pid or os.getpid())
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, path)
+
+    def read_all(self) -> dict[int, dict]:
+        snapshots = {}
+        for path in glob.glob(os.path.join(self.directory, "metrics_*.json")):
+            pid = int(os.path.basename(path)[len("metrics_"):-len(".json")])
+            try:
+                with open(path) as f:
+                    snapshots[pid] = json.load(f)
+            except (OSError, ValueError):
+                logger.warning("unreadable metrics file", extra={"path": path})
+        return snapshots
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+registry = Registry()
+store = MultiProcessStore(settings.METRICS_MULTIPROC_DIR) if settings.METRICS_MULTIPROC_DIR else None
+
+
+def _gather(snapshot: dict) -> str:
+    store.write(snapshot)
+    snapshots = store.read_all()
+    return registry.render(snapshots, live_pids={pid for pid in snapshots if _pid_alive(pid)})
+
+
+async def exposition() -> str:
+    # snapshot on the loop thread - that's where the values change; file IO in a thread
+    snapshot = registry.snapshot()
+    if store is None:
+        return registry.render({os.getpid(): snapshot})
+    return await asyncio.to_thread(_gather, snapshot)
+
+
+async def flush():
+    if store is not None:
+        await asyncio.to_thread(store.write, registry.snapshot())
+
+
+async def run_flush(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await flush()
+        except OSError:
+            logger.exception("metrics flush failed")
+
+
+def _engines() -> dict[str, object]:
+    engines = {"primary": async_engine}
+    engines.update((repr(replica), replica.engine) for replica in replica_pool.replicas)
+    return engines
+
+
+def _pool_values(key: str) -> Callable[[], dict[Labels, float]]:
+    def collect():
+        values = {}
+        for name, engine in _engines().items():
+            stats = pool_stats(engine)
+            if key in stats:
+                values[(name,)] = float(stats[key])
+        return values
+    return collect
+
+
+def _cache_requests() -> dict[Labels, float]:
+    stats = cache.stats()
+    return {("hit_l1",): stats["hits_l1"], ("hit_l2",): stats["hits_l2"], ("miss",): stats["misses"]}
+
+
+HTTP_REQUESTS = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status")))
+HTTP_REQUEST_DURATION = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route")))
+HTTP_REQUESTS_ABANDONED = registry.register(Counter(
+    "http_requests_abandoned_total", "Requests cancelled mid-flight, by reason (deadline, disconnect).",
+    ("route", "reason")))
+REPOSITORY_CALL_DURATION = registry.register(Histogram(
+    "repository_call_duration_seconds", "Repository method latency, DB round trips included.",
+    ("repository", "method")))
+GEOCODER_REQUEST_DURATION = registry.register(Histogram(
+    "geocoder_request_duration_seconds", "Geocoder request latency.", ("operation",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)))
+
+for key, documentation in (("size", "Pool size."),
+                           ("checked_out", "Connections in use."),
+                           ("checked_in", "Idle connections."),
+                           ("overflow", "Connections over the pool size.")):
+    registry.register(Gauge(f"db_pool_{key}", documentation, ("engine",), callback=_pool_values(key)))
+registry.register(Counter("db_pool_checkouts_total", "Connection checkouts.", ("engine",),
+                          callback=_pool_values("checkouts")))
+registry.register(Counter("db_pool_wait_seconds_total", "Time spent waiting for a connection.", ("engine",),
+                          callback=_pool_values("total_wait_seconds")))
+registry.register(Counter("cache_requests_total", "Two-tier cache lookups by result.", ("result",),
+                          callback=_cache_requests))
+registry.register(Gauge("cache_hit_ratio", "Share of cache lookups served from L1 or L2.",
+                        callback=lambda: {(): cache.stats()["hit_ratio"]}))
+
+
+def timed_repository(cls):
+    """ Class decorator: records the latency of every public async method of a repository. """
+    for name, method in list(vars(cls).items()):
+        if name.startswith("_") or not inspect.iscoroutinefunction(method):
+            continue
+        setattr(cls, name, _timed(method, cls.__name__, name))
+    return cls
+
+
+def _timed(method, repository: str, name: str):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            REPOSITORY_CALL_DURATION.observe(time.perf_counter() - start, repository, name)
+    return wrapper
@@ -0,0 +1,395 @@
+import asyncio
+import gzip
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from urllib.parse import parse_qsl
+
+import jwt
+from pydantic import BaseModel, ConfigDict, TypeAdapter
+from starlette.datastructures import MutableHeaders, Headers
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import BaseRoute, Match
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from app.cache import cache, make_key
+from app.config import settings
+from app.deadlines import DeadlineExceeded, current_deadline
+from app.instrumentation import QueryStats, current_query_stats
+from app.log import request_id_var
+from app.metrics import HTTP_REQUESTS, HTTP_REQUEST_DURATION, HTTP_REQUESTS_ABANDONED
+from app.profiling import StackSampler, Profile, ProfileStore
+from app.services import ORGANIZATIONS_TAG, BUILDINGS_TAG, ACTIVITIES_TAG, AuthService
+
+logger = logging.getLogger(__name__)
+
+
+class RequestIdMiddleware:
+    """ Takes X-Request-ID from the request (or generates one), exposes it to logs and echoes it back. """
+
+    header = "X-Request-ID"
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = Headers(scope=scope).get(self.header) or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)[self.header] = request_id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
+
+
+class MetricsMiddleware:
+    """
+    Counts requests and observes their latency per method, route template and
+    status. Requests answered before routing (e.g. by the response cache) are
+    matched against `routes` here; unknown paths are counted as "unmatched" to keep
+    label cardinality bounded.
+    """
+
+    def __init__(self, app: ASGIApp, routes: list[BaseRoute]):
+        self.app = app
+        self.routes = routes
+
+    def route_template(self, scope: Scope) -> str:
+        route = scope.get("route")
+        if route is not None:
+            return route.path
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = self.route_template(scope)
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, scope["method"], route)
+            HTTP_REQUESTS.inc(scope["method"], route, str(status))
+
+
+class QueryStatsMiddleware:
+    """
+    Counts SQL statements, DB time and the slowest statement of every request,
+    logs them, optionally reports them in the Server-Timing header and warns
+    about statements repeated more than N_PLUS_ONE_THRESHOLD times.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = current_query_stats.set(stats)
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start" and settings.QUERY_STATS_SERVER_TIMING:
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    f'db;dur={stats.total_time * 1000:.3f};desc="{stats.count} statements"'
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_query_stats.reset(token)
+            self.report(scope, stats)
+
+    @staticmethod
+    def report(scope: Scope, stats: QueryStats):
+        path = scope["path"]
+        logger.info("request db stats", extra={"path": path, **stats.as_dict()})
+        repeated = stats.repeated_statements(settings.N_PLUS_ONE_THRESHOLD)
+        if repeated:
+            logger.warning("possible N+1 queries", extra={
+                "path": path,
+                "repeated_statements": [{"statement": statement, "count": count}
+                                        for statement, count in repeated],
+            })
+
+
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded) -> JSONResponse:
+    """ 504 for work refused below an endpoint (app.deadlines.check_deadline), like DeadlineMiddleware's own. """
+    return JSONResponse({"detail": str(exc)}, status_code=504)
+
+
+class DeadlineMiddleware:
+    """
+    Runs the routes in `deadlines` (path -> seconds) as a task that is cancelled
+    when the deadline passes or the client disconnects. Cancellation interrupts
+    whatever the request awaits: a running asyncpg query is cancelled on the
+    server and its connection goes back to the pool, a geocoder call is dropped,
+    the rest of the handler never runs. A request past its deadline gets a 504
+    unless its response has already started. The deadline is visible below
+    through app.deadlines. Routes not listed (exports, streams) are left alone.
+    """
+
+    def __init__(self, app: ASGIApp, deadlines: dict[str, float]):
+        self.app = app
+        self.deadlines = deadlines
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] not in self.deadlines:
+            await self.app(scope, receive, send)
+            return
+
+        timeout = self.deadlines[scope["path"]]
+        token = current_deadline.set(asyncio.get_running_loop().time() + timeout)
+        response_started = False
+        # this middleware reads the client's messages, so it notices a disconnect
+        # while the app isn't reading; the app gets them from the queue
+        messages: asyncio.Queue[Message] = asyncio.Queue()
+        disconnected = asyncio.Event()
+
+        async def listen():
+            while True:
+                message = await receive()
+                messages.put_nowait(message)
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    return
+
+        async def send_wrapper(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        # the task runs in a copy of this context - deadline, request id and query stats included
+        request = asyncio.create_task(self.app(scope, messages.get, send_wrapper))
+        listener = asyncio.create_task(listen())
+        disconnect = asyncio.create_task(disconnected.wait())
+        try:
+            done, _ = await asyncio.wait({request, disconnect}, timeout=timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if request in done:
+                request.result()
+                return
+            reason = "disconnect" if disconnected.is_set() else "deadline"
+            request.cancel()
+            await asyncio.wait({request})
+            HTTP_REQUESTS_ABANDONED.inc(scope["path"], reason)
+            logger.warning("request abandoned", extra={"path": scope["path"], "reason": reason, "timeout": timeout})
+            if reason == "deadline" and not response_started:
+                await send({"type": "http.response.start", "status": 504,
+                            "headers": [(b"content-type", b"application/json")]})
+                await send({"type": "http.response.body",
+                            "body": json.dumps({"detail": "Request deadline exceeded"}).encode()})
+        finally:
+            current_deadline.reset(token)
+            for task in (request, listener, disconnect):
+                task.cancel()
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a `sample_rate` share of requests, and any request sent with
+    `X-Profile: 1` and a valid API-key header. A stack sampler runs only for the
+    duration of a profiled request, and at most one at a time. The profile
+    (collapsed stacks and per-statement SQL timings from QueryStatsMiddleware,
+    which must wrap this one) goes to `store`. Profiled responses carry
+    X-Profile-Id to fetch it from /admin/profiles.
+    """
+
+    header = "x-profile"
+
+    def __init__(self, app: ASGIApp, store: ProfileStore, sample_rate: float, interval: float):
+        self.app = app
+        self.store = store
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self._busy = threading.Lock()
+
+    def requested(self, scope: Scope) -> bool:
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        headers = Headers(scope=scope)
+        if headers.get(self.header) != "1":
+            return False
+        return hmac.compare_digest(headers.get("api-key", ""), settings.API_SECRET_KEY)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.requested(scope) or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = request_id_var.get() or uuid.uuid4().hex
+        profile = Profile(request_id, scope["method"], scope["path"], scope["query_string"].decode("latin-1"))
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                MutableHeaders(scope=message)["X-Profile-Id"] = request_id
+            await send(message)
+
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            self._busy.release()
+            profile.duration = time.perf_counter() - start
+            profile.samples = sampler.samples
+            profile.collapsed = sampler.collapsed()
+            stats = current_query_stats.get()
+            if stats is not None:
+                profile.statements = stats.statements()
+            self.store.add(profile)
+
+
+class CachedResponse(BaseModel):
+    model_config = ConfigDict(ser_json_bytes="base64", val_json_bytes="base64")
+
+    status: int
+    headers: list[tuple[str, str]]
+    body: bytes
+    # pre-compressed body, only for bodies worth compressing
+    gzip_body: bytes | None = None
+
+
+CACHED_RESPONSE_ADAPTER = TypeAdapter(CachedResponse)
+
+
+class ResponseCacheMiddleware:
+    """
+    Caches complete GET responses of the routes in `ttls` (path -> seconds).
+    The key is the path, the sorted query string and the caller's permission class
+    (the basic_user / advanced_user scopes of the bearer token), so a hit skips
+    the full auth dependency, DB queries and serialization. The token's user must
+    still exist and be active (AuthService.is_active_user, cached for a few
+    seconds); requests without a valid token of an active user bypass the cache
+    and get the app's own 401/400. Only 200 responses are stored,
+    next to a gzip copy for clients that accept it. Writes invalidate the entries
+    through the organizations/buildings/activities cache tags.
+    """
+
+    permission_scopes = {"basic_user", "advanced_user"}
+    min_gzip_size = 1024
+
+    def __init__(self, app: ASGIApp, ttls: dict[str, float]):
+        self.app = app
+        self.ttls = ttls
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] != "GET" or scope["path"] not in self.ttls:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        permission_class = await self.permission_class(headers.get("authorization"))
+        if permission_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        ttl = self.ttls[scope["path"]]
+        query = sorted(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True))
+        key = make_key("http", scope["path"], query, permission_class)
+        loaded: list[CachedResponse] = []
+
+        async def load() -> CachedResponse | None:
+            response = await self.capture(scope, receive)
+            loaded.append(response)
+            if response.status != 200:
+                return None
+            if len(response.body) >= self.min_gzip_size:
+                response.gzip_body = gzip.compress(response.body, compresslevel=6)
+            return response
+
+        response = await cache.get_or_load(key, load, CACHED_RESPONSE_ADAPTER,
+                                           tags=[ORGANIZATIONS_TAG, BUILDINGS_TAG, ACTIVITIES_TAG],
+                                           ttl=ttl)
+        if response is None:
+            await self.send(send, loaded[0], headers, cache_status=None, ttl=None)
+            return
+        await self.send(send, response, headers, cache_status="MISS" if loaded else "HIT", ttl=ttl)
+
+    async def permission_class(self, authorization: str | None) -> str | None:
+        if not authorization or not authorization.lower().startswith("bearer "):
+            return None
+        try:
+            payload = jwt.decode(authorization[7:], settings.SECRET_KEY, [settings.ALGORITHM])
+        except jwt.InvalidTokenError:
+            return None
+        username = payload.get("sub")
+        if not isinstance(username, str) or not username or not await AuthService.is_active_user(username):
+            return None
+        return ",".join(sorted(self.permission_scopes.intersection(payload.get("scopes", []))))
+
+    async def capture(self, scope: Scope, receive: Receive) -> CachedResponse:
+        status = 500
+        response_headers = []
+        body = bytearray()
+
+        async def capture_send(message: Message):
+            nonlocal status, response_headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers = [(k.decode("latin-1"), v.decode("latin-1"))
+                                    for k, v in message.get("headers", [])]
+            elif message["type"] == "http.response.body":
+                body.extend(message.get("body", b""))
+
+        await self.app(scope, receive, capture_send)
+        return CachedResponse(status=status, headers=response_headers, body=bytes(body))
+
+    @staticmethod
+    async def send(
+            send: Send,
+            response: CachedResponse,
+            request_headers: Headers,
+            cache_status: str | None,
+            ttl: float | None
+    ):
+        body = response.body
+        headers = MutableHeaders(raw=[(k.encode("latin-1"), v.encode("latin-1"))
+                                      for k, v in response.headers])
+        if cache_status is not None:
+            if response.gzip_body is not None and "gzip" in request_headers.get("accept-encoding", ""):
+                body = response.gzip_body
+                headers["Content-Encoding"] = "gzip"
+            headers["Content-Length"] = str(len(body))
+            headers["Cache-Control"] = f"private, max-age={int(ttl)}"
+            headers["Vary"] = "Authorization, Accept-Encoding"
+            headers["X-Cache"] = cache_status
+        await send({"type": "http.response.start", "status": response.status, "headers": headers.raw})
+        await send({"type": "http.response.body", "body": body})
@@ -1,7 +1,10 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, Boolean
-from sqlalchemy.orm import relationship, Mapped
+from sqlalchemy import (Column, Integer, String, ForeignKey, Float, Boolean, JSON, Index, UniqueConstraint, DateTime,
+                        func, literal_column)
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import relationship, Mapped, validates
 
 from app.db import Base
+from app.phones import normalize_phone
 
 
 # back_populates on the both sides -> what will happen? (they're not consist)
@@ -25,16 +28,28 @@ class Building(Base):
     organizations = relationship("Organization",
                                  back_populates="building")
 
+    # natural key of bulk import upserts
+    __table_args__ = (
+        UniqueConstraint("city", "street", "house", name="uq_buildings_address"),
+        # bounding box search
+        Index("ix_buildings_coordinates", "latitude", "longitude"),
+    )
+
 
 class PhoneNumber(Base):
     __tablename__ = "phone_numbers"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
+    # E.164, see app.phones
     phone_number = Column(String, unique=True)
-    organization_id = Column(Integer, ForeignKey("organizations.id"))
+    organization_id = Column(Integer, ForeignKey("organizations.id"), index=True)
 
     organization = relationship("Organization", back_populates="phone_numbers")
 
+    @validates("phone_number")
+    def _normalize_phone_number(self, key, phone_number):
+        return normalize_phone(phone_number) if phone_number is not None else None
+
 
 class Organization(Base):
     __tablename__ = "organizations"
@@ -50,6 +65,10 @@ class Organization(Base):
                               back_populates="organizations")
     phone_numbers = relationship("PhoneNumber", back_populates="organization")
 
+    __table_args__ = (
+        UniqueConstraint("building_id", "name", name="uq_organizations_building_name"),
+    )
+
 
 class Activity(Base):
     __tablename__ = "activities"
@@ -75,6 +94,10 @@ class OrganizationActivity(Base):
     organization_id = Column(Integer, ForeignKey("organizations.id"))
     activity_id = Column(Integer, ForeignKey("activities.id"))
 
+    __table_args__ = (
+        UniqueConstraint("organization_id", "activity_id", name="uq_organization_activities"),
+    )
+
 
 class User(Base):
     __tablename__ = "users"
@@ -106,4 +129,46 @@ class UserPermissions(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    permission_id = Column(Integer, ForeignKey("permissions.id"))
\ No newline at end of file
+    permission_id = Column(Integer, ForeignKey("permissions.id"))
+
+
+class OrganizationDocument(Base):
+    """
+    Denormalized read model: one ready-to-serve row per organization with its phones,
+    address, coordinates and activity ids. Kept up to date by app.read_model.
+    """
+    __tablename__ = "organization_documents"
+
+    organization_id = Column(Integer,
+                             ForeignKey("organizations.id", ondelete="CASCADE"),
+                             primary_key=True)
+    name = Column(String, index=True, nullable=False)
+    building_id = Column(Integer, nullable=True)
+    city = Column(String, nullable=True)
+    street = Column(String, nullable=True)
+    house = Column(String, nullable=True)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    # [{"id": ..., "phone_number": ...}]
+    phone_numbers = Column(JSON().with_variant(JSONB, "postgresql"), nullable=False)
+    activity_ids = Column(JSON().with_variant(JSONB, "postgresql"), nullable=False)
+    # name, activity names and address - the full-text search document
+    search_text = Column(String, nullable=False, default="")
+
+    __table_args__ = (
+        Index("ix_organization_documents_address", "city", "street", "house"),
+        # OrganizationRepository.search has to use the very same expression
+        Index("ix_organization_documents_search",
+              func.to_tsvector(literal_column("'simple'::regconfig"), search_text),
+              postgresql_using="gin").ddl_if(dialect="postgresql"),
+    )
+
+
+class GeocodedAddress(Base):
+    """ Forward geocoding results by normalized query; no coordinates - the geocoder found nothing. """
+    __tablename__ = "geocoded_addresses"
+
+    query = Column(String, primary_key=True)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geocoded_at = Column(DateTime(timezone=True), nullable=False)
@@ -0,0 +1,40 @@
+"""
+    Phone numbers are stored in E.164: "+", country code, subscriber number, digits only.
+
+    "+..." and "00..." numbers are international. Anything else is national: the
+    trunk prefix is dropped and the default country code added, e.g. with the
+    defaults (Belarus) "8 (029) 123-45-67" and "29 123 45 67" both become
+    "+375291234567".
+"""
+import re
+
+from app.config import settings
+
+# formatting people put into numbers
+SEPARATORS = re.compile(r"[\s\-().]")
+# E.164: at most 15 digits including the country code
+MAX_DIGITS = 15
+
+
+def normalize_phone(
+        phone_number: str,
+        country_code: str | None = None,
+        trunk_prefix: str | None = None
+) -> str:
+    """ E.164 form of `phone_number`, ValueError if it can't be a phone number. """
+    country_code = settings.PHONE_COUNTRY_CODE if country_code is None else country_code
+    trunk_prefix = settings.PHONE_TRUNK_PREFIX if trunk_prefix is None else trunk_prefix
+
+    number = SEPARATORS.sub("", phone_number)
+    if number.startswith("+"):
+        digits = number[1:]
+    elif number.startswith("00"):
+        digits = number[2:]
+    else:
+        if trunk_prefix and number.startswith(trunk_prefix):
+            number = number[len(trunk_prefix):]
+        # "" - nothing but a trunk prefix
+        digits = country_code + number if number else ""
+    if not digits.isdigit() or len(digits) > MAX_DIGITS:
+        raise ValueError(f"Invalid phone number: {phone_number!r}")
+    return "+" + digits
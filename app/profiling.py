@@ -0,0 +1,97 @@
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+from app.config import settings
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class StackSampler:
+    """
+    Wall-clock sampling profiler of one thread: a daemon thread snapshots the target
+    thread's stack every `interval` seconds and counts collapsed stacks
+    ("root;...;leaf"), the input format of flamegraph.pl and speedscope.
+
+    For the event loop thread this includes other requests served concurrently
+    and the time spent idle in the selector.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+class Profile:
+    def __init__(self, request_id: str | None, method: str, path: str, query_string: str):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.query_string = query_string
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.status: int | None = None
+        self.samples = 0
+        self.collapsed = ""
+        self.statements: list[dict] = []
+
+    def summary(self) -> dict:
+        return {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "query_string": self.query_string,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+            "samples": self.samples,
+        }
+
+
+class ProfileStore:
+    """ The most recent profiles, oldest dropped first. """
+
+    def __init__(self, size: int):
+        self.profiles: deque[Profile] = deque(maxlen=size)
+
+    def add(self, profile: Profile):
+        self.profiles.append(profile)
+
+    def get(self, request_id: str) -> Profile | None:
+        for profile in reversed(self.profiles):
+            if profile.request_id == request_id:
+                return profile
+        return None
+
+
+profile_store = ProfileStore(settings.PROFILE_HISTORY)
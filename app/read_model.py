@@ -0,0 +1,136 @@
+"""
+    Incremental refresh of the organization read model (organization_documents).
+
+    Flushes record which organizations (and buildings) were touched; right before
+    the transaction commits their documents are rebuilt in the same transaction.
+    Paths that write with Core statements instead of the ORM (bulk import, batch
+    writes) call mark_dirty() themselves.
+"""
+from collections import defaultdict
+from typing import Iterable
+
+from sqlalchemy import select, delete, insert, event, inspect
+from sqlalchemy.orm import Session
+
+from app import models
+
+DIRTY_ORGANIZATIONS = "dirty_organizations"
+DIRTY_BUILDINGS = "dirty_buildings"
+
+# ids per statement in refresh queries
+CHUNK_SIZE = 1000
+
+documents = models.OrganizationDocument.__table__
+
+
+def mark_dirty(
+        session,
+        organization_ids: Iterable[int] = (),
+        building_ids: Iterable[int] = ()
+):
+    """ `session` - Session or AsyncSession. """
+    session.info.setdefault(DIRTY_ORGANIZATIONS, set()).update(organization_ids)
+    session.info.setdefault(DIRTY_BUILDINGS, set()).update(building_ids)
+
+
+def _changed_values(obj, attribute: str) -> list:
+    history = inspect(obj).attrs[attribute].history
+    return [value for value in (*history.added, *history.unchanged, *history.deleted)
+            if value is not None]
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_dirty(session: Session, flush_context):
+    organization_ids, building_ids = set(), set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, models.Organization):
+            organization_ids.add(obj.id)
+        elif isinstance(obj, (models.PhoneNumber, models.OrganizationActivity)):
+            # old owner too, if the row moved to another organization
+            organization_ids.update(_changed_values(obj, "organization_id"))
+        elif isinstance(obj, models.Building):
+            building_ids.add(obj.id)
+    if organization_ids or building_ids:
+        mark_dirty(session, organization_ids, building_ids)
+
+
+@event.listens_for(Session, "before_commit")
+def _refresh_before_commit(session: Session):
+    # commit flushes only after this hook, flush now so pending changes are collected
+    session.flush()
+    organization_ids = session.info.pop(DIRTY_ORGANIZATIONS, set())
+    building_ids = session.info.pop(DIRTY_BUILDINGS, set())
+    if organization_ids or building_ids:
+        refresh_documents(session, organization_ids, building_ids)
+
+
+def _chunks(ids: list[int]):
+    for i in range(0, len(ids), CHUNK_SIZE):
+        yield ids[i:i + CHUNK_SIZE]
+
+
+def refresh_documents(session: Session, organization_ids: set[int], building_ids: set[int] = frozenset()):
+    """ Rebuilds the documents of the given organizations and of every organization in the given buildings. """
+    organization_ids = set(organization_ids)
+    for chunk in _chunks(list(building_ids)):
+        organization_ids.update(session.execute(
+            select(models.Organization.id).where(models.Organization.building_id.in_(chunk))
+        ).scalars())
+    for chunk in _chunks(sorted(organization_ids)):
+        _refresh_chunk(session, chunk)
+
+
+def _refresh_chunk(session: Session, organization_ids: list[int]):
+    organizations = session.execute(
+        select(models.Organization.id,
+               models.Organization.name,
+               models.Organization.building_id,
+               models.Building.city,
+               models.Building.street,
+               models.Building.house,
+               models.Building.latitude,
+               models.Building.longitude)
+        .outerjoin(models.Building, models.Building.id == models.Organization.building_id)
+        .where(models.Organization.id.in_(organization_ids))
+    ).all()
+
+    phone_numbers = defaultdict(list)
+    for organization_id, phone_id, phone_number in session.execute(
+            select(models.PhoneNumber.organization_id, models.PhoneNumber.id, models.PhoneNumber.phone_number)
+            .where(models.PhoneNumber.organization_id.in_(organization_ids))
+            .order_by(models.PhoneNumber.id)
+    ):
+        phone_numbers[organization_id].append({"id": phone_id, "phone_number": phone_number})
+
+    activity_ids = defaultdict(list)
+    activity_names = defaultdict(list)
+    for organization_id, activity_id, activity_name in session.execute(
+            select(models.OrganizationActivity.organization_id,
+                   models.OrganizationActivity.activity_id,
+                   models.Activity.name)
+            .join(models.Activity, models.Activity.id == models.OrganizationActivity.activity_id)
+            .where(models.OrganizationActivity.organization_id.in_(organization_ids))
+            .order_by(models.OrganizationActivity.activity_id)
+    ):
+        activity_ids[organization_id].append(activity_id)
+        activity_names[organization_id].append(activity_name)
+
+    session.execute(delete(documents).where(documents.c.organization_id.in_(organization_ids)))
+    if organizations:
+        session.execute(insert(documents), [
+            {
+                "organization_id": org.id,
+                "name": org.name,
+                "building_id": org.building_id,
+                "city": org.city,
+                "street": org.street,
+                "house": org.house,
+                "latitude": org.latitude,
+                "longitude": org.longitude,
+                "phone_numbers": phone_numbers[org.id],
+                "activity_ids": activity_ids[org.id],
+                "search_text": " ".join(filter(None, (org.name, *activity_names[org.id],
+                                                      org.city, org.street, org.house))),
+            }
+            for org in organizations
+        ])
@@ -0,0 +1,156 @@
+import asyncio
+import itertools
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, InterfaceError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.config import settings
+from app.db import make_engine, make_read_only_sessionmaker, make_autocommit_sessionmaker
+
+# errors after which the replica is considered dead, not the query wrong
+CONNECTION_ERRORS = (OSError, asyncio.TimeoutError, InterfaceError)
+
+
+def is_connection_error(error: BaseException) -> bool:
+    if isinstance(error, CONNECTION_ERRORS):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+class Replica:
+    def __init__(self, url: str, engine: AsyncEngine | None = None):
+        self.url = url
+        self.engine = engine or make_engine(url)
+        self.read_only_sessionmaker = make_read_only_sessionmaker(self.engine)
+        self.autocommit_sessionmaker = make_autocommit_sessionmaker(self.engine)
+        self.healthy = True
+        self.ejected_at: float | None = None
+        self.failures = 0
+        # an ejected replica has a trial request in flight
+        self.on_trial = False
+
+    def session(self, single_statement: bool = False) -> AsyncSession:
+        if single_statement:
+            return self.autocommit_sessionmaker()
+        return self.read_only_sessionmaker()
+
+    def in_use(self) -> int:
+        pool = self.engine.pool
+        return pool.checkedout() if hasattr(pool, "checkedout") else 0
+
+    def __repr__(self):
+        return f"Replica({self.engine.url.render_as_string(hide_password=True)}, healthy={self.healthy})"
+
+
+class ReplicaPool:
+    """
+    Routes read-only units of work between read replicas.
+    Replicas that fail a query or a health check are ejected. An ejected replica is
+    half-open after `retry_after` seconds, or right after a successful health check:
+    it gets a single trial request, and only once that succeeds does it take its
+    share of the traffic again. A failed trial ejects it again.
+    """
+
+    def __init__(
+            self,
+            replicas: list[Replica],
+            strategy: str = "round_robin",
+            retry_after: float = 30
+    ):
+        if strategy not in ("round_robin", "least_connections"):
+            raise ValueError(f"Unknown replica routing strategy: {strategy}")
+        self.replicas = replicas
+        self.strategy = strategy
+        self.retry_after = retry_after
+        self._round_robin = itertools.cycle(replicas) if replicas else None
+
+    @classmethod
+    def from_settings(cls) -> "ReplicaPool":
+        return cls([Replica(url) for url in settings.replica_urls],
+                   strategy=settings.DB_REPLICA_STRATEGY,
+                   retry_after=settings.DB_REPLICA_RETRY_SECONDS)
+
+    def available(self) -> list[Replica]:
+        now = time.monotonic()
+        return [r for r in self.replicas
+                if r.healthy or (not r.on_trial and now - r.ejected_at >= self.retry_after)]
+
+    def choose(self, allow_trial: bool = True) -> tuple[Replica | None, bool]:
+        """
+        Returns the replica and whether this request is its trial. None means there
+        is no live replica and the caller should use the primary.
+        Only the trial request reports the outcome: succeeded() or eject(), then end_trial().
+        allow_trial=False: healthy replicas only, for callers that can't report the outcome.
+        """
+        if not allow_trial:
+            return self._choose([r for r in self.replicas if r.healthy]), False
+        replica = self._choose(self.available())
+        if replica is None or replica.healthy:
+            return replica, False
+        replica.on_trial = True
+        return replica, True
+
+    def _choose(self, available: list[Replica]) -> Replica | None:
+        if not available:
+            return None
+        if self.strategy == "least_connections":
+            return min(available, key=Replica.in_use)
+        for _ in range(len(self.replicas)):
+            replica = next(self._round_robin)
+            if replica in available:
+                return replica
+        return None
+
+    def eject(self, replica: Replica):
+        replica.healthy = False
+        replica.ejected_at = time.monotonic()
+        replica.failures += 1
+
+    def readmit(self, replica: Replica):
+        replica.healthy = True
+        replica.ejected_at = None
+        replica.failures = 0
+        replica.on_trial = False
+
+    def half_open(self, replica: Replica):
+        """ The next request may be the ejected replica's trial. """
+        replica.ejected_at = time.monotonic() - self.retry_after
+
+    def succeeded(self, replica: Replica):
+        """ Called by the trial request only: a request routed before the ejection proves nothing. """
+        if not replica.healthy:
+            self.readmit(replica)
+
+    def end_trial(self, replica: Replica):
+        """ An inconclusive trial (cancelled, failed query) - the next request gets another one. """
+        replica.on_trial = False
+
+    async def check_replica(self, replica: Replica, timeout: float) -> bool:
+        try:
+            async with asyncio.timeout(timeout):
+                async with replica.engine.connect() as conn:
+                    await conn.execute(text("SELECT 1"))
+        except Exception:
+            self.eject(replica)
+            return False
+        if not replica.healthy:
+            self.half_open(replica)
+        return True
+
+    async def check_health(self, timeout: float = settings.DB_REPLICA_HEALTH_CHECK_TIMEOUT) -> dict[str, bool]:
+        results = await asyncio.gather(*(self.check_replica(r, timeout) for r in self.replicas))
+        return {repr(r): ok for r, ok in zip(self.replicas, results)}
+
+    async def run_health_checks(self, interval: float = settings.DB_REPLICA_HEALTH_CHECK_INTERVAL):
+        while True:
+            await self.check_health()
+            await asyncio.sleep(interval)
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+
+replica_pool = ReplicaPool.from_settings()
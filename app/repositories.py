@@ -1,12 +1,177 @@
-from typing import List
+import logging
+import math
+from typing import AsyncIterator, List
 
-from sqlalchemy import select
-from sqlalchemy.orm import joinedload
+from sqlalchemy import select, bindparam, update, delete, func, case, literal, literal_column, and_, or_, exists, Float
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import joinedload, contains_eager
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from . import models, schemas
+from .metrics import timed_repository
+from .tiles import longitude_ranges
 
+logger = logging.getLogger(__name__)
 
+# Hot statements are built once at import time with bound parameters instead of on
+# every call. The statement objects memoize their cache key, so each execution is
+# a straight lookup in the engine's compiled cache (and asyncpg's prepared statement
+# cache on the connection) with no Python-side query construction.
+BUILDINGS_BY_CITY = (
+    select(models.Building)
+    .filter(models.Building.city == bindparam("city"))
+)
+
+ACTIVITY_TREE = (
+    select(models.Activity.id, models.Activity.name, models.Activity.parent_id)
+    .order_by(models.Activity.id)
+)
+
+# single organization lookups go to the denormalized read model - one indexed row
+# per organization, no joins
+ORGANIZATIONS_BY_BUILDING_ADDRESS = (
+    select(models.OrganizationDocument)
+    .filter((models.OrganizationDocument.city == bindparam("city")) &
+            (models.OrganizationDocument.street == bindparam("street")) &
+            (models.OrganizationDocument.house == bindparam("house")))
+    .order_by(models.OrganizationDocument.organization_id)
+)
+
+ORGANIZATIONS_BY_ACTIVITY = (
+    select(models.Organization)
+    .join(models.Organization.activities)
+    .options(contains_eager(models.Organization.activities))
+    .options(joinedload(models.Organization.phone_numbers))
+    .filter(models.Activity.name == bindparam("activity"))
+)
+
+ORGANIZATIONS_BY_ACTIVITY_IDS = (
+    select(models.Organization)
+    .join(models.OrganizationActivity,
+          models.OrganizationActivity.organization_id == models.Organization.id)
+    .options(joinedload(models.Organization.phone_numbers))
+    .filter(models.OrganizationActivity.activity_id.in_(bindparam("activity_ids", expanding=True)))
+    .order_by(models.Organization.id)
+)
+
+# Streamed variants: one row per (organization, phone), ordered so the rows of an
+# organization are adjacent and collapse_organizations can merge them as they come.
+# Activities are an EXISTS filter, so they don't multiply the rows.
+_ORGANIZATION_ROWS = (
+    select(models.Organization.id, models.Organization.name,
+           models.PhoneNumber.id.label("phone_id"), models.PhoneNumber.phone_number)
+    .outerjoin(models.PhoneNumber, models.PhoneNumber.organization_id == models.Organization.id)
+    .order_by(models.Organization.id, models.PhoneNumber.id)
+)
+
+ORGANIZATION_ROWS_BY_ACTIVITY = _ORGANIZATION_ROWS.filter(
+    exists()
+    .where(models.OrganizationActivity.organization_id == models.Organization.id)
+    .where(models.OrganizationActivity.activity_id == models.Activity.id)
+    .where(models.Activity.name == bindparam("activity"))
+)
+
+ORGANIZATION_ROWS_BY_ACTIVITY_IDS = _ORGANIZATION_ROWS.filter(
+    exists()
+    .where(models.OrganizationActivity.organization_id == models.Organization.id)
+    .where(models.OrganizationActivity.activity_id.in_(bindparam("activity_ids", expanding=True)))
+)
+
+ORGANIZATION_BY_ID = (
+    select(models.OrganizationDocument)
+    .filter(models.OrganizationDocument.organization_id == bindparam("organization_id"))
+)
+
+ORGANIZATION_BY_NAME = (
+    select(models.OrganizationDocument)
+    .filter(models.OrganizationDocument.name == bindparam("name"))
+    .order_by(models.OrganizationDocument.organization_id)
+    .limit(1)
+)
+
+ORGANIZATIONS_BY_IDS = (
+    select(models.OrganizationDocument)
+    .filter(models.OrganizationDocument.organization_id.in_(bindparam("organization_ids", expanding=True)))
+    .order_by(models.OrganizationDocument.organization_id)
+)
+
+# one index probe per number on the phone_number unique constraint
+ORGANIZATIONS_BY_PHONE_NUMBERS = (
+    select(models.PhoneNumber.phone_number, models.OrganizationDocument)
+    .join(models.OrganizationDocument,
+          models.OrganizationDocument.organization_id == models.PhoneNumber.organization_id)
+    .filter(models.PhoneNumber.phone_number.in_(bindparam("phone_numbers", expanding=True)))
+)
+
+USER_BY_USERNAME = (
+    select(models.User)
+    .options(joinedload(models.User.permissions))
+    .filter(models.User.username == bindparam("username"))
+)
+
+# (statement, parameters matching nothing) - executed on start up to pre-compile
+# the hot statements and prepare them on the pooled connections
+HOT_STATEMENTS = [
+    (BUILDINGS_BY_CITY, {"city": ""}),
+    (ACTIVITY_TREE, {}),
+    (ORGANIZATIONS_BY_BUILDING_ADDRESS, {"city": "", "street": "", "house": ""}),
+    (ORGANIZATIONS_BY_ACTIVITY, {"activity": ""}),
+    (ORGANIZATIONS_BY_ACTIVITY_IDS, {"activity_ids": [0]}),
+    (ORGANIZATION_BY_ID, {"organization_id": 0}),
+    (ORGANIZATION_BY_NAME, {"name": ""}),
+    (ORGANIZATIONS_BY_IDS, {"organization_ids": [0]}),
+    (ORGANIZATIONS_BY_PHONE_NUMBERS, {"phone_numbers": [""]}),
+    (USER_BY_USERNAME, {"username": ""}),
+]
+
+
+# the text search configuration of ix_organization_documents_search
+SEARCH_CONFIG = literal_column("'simple'::regconfig")
+# km per degree of latitude
+KM_PER_DEGREE = 111.2
+
+
+def upsert_statement(session: AsyncSession, model):
+    """ INSERT with the dialect's ON CONFLICT support (sqlite for local stand-ins). """
+    dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+    return dialect.insert(model.__table__)
+
+
+async def existing_ids(session: AsyncSession, model, ids: list[int]) -> set[int]:
+    result = await session.execute(select(model.id).filter(model.id.in_(ids)))
+    return set(result.scalars().all())
+
+
+async def check_references(session: AsyncSession, model, ids: set[int]):
+    """ ValueError naming the ids with no `model` row. """
+    missing = ids - await existing_ids(session, model, list(ids)) if ids else set()
+    if missing:
+        raise ValueError(f"Unknown {model.__tablename__}: {sorted(missing)}")
+
+
+async def collapse_organizations(rows: AsyncIterator) -> AsyncIterator[schemas.Organization]:
+    """ Organizations of (id, name, phone_id, phone_number) rows ordered by id, one at a time. """
+    current = None
+    async for row in rows:
+        if current is None or current.id != row.id:
+            if current is not None:
+                yield current
+            current = schemas.Organization(id=row.id, name=row.name, phone_numbers=[])
+        if row.phone_id is not None:
+            current.phone_numbers.append(schemas.PhoneNumber(id=row.phone_id, phone_number=row.phone_number))
+    if current is not None:
+        yield current
+
+
+def document_to_organization(document: models.OrganizationDocument) -> schemas.Organization:
+    return schemas.Organization(
+        id=document.organization_id,
+        name=document.name,
+        phone_numbers=document.phone_numbers
+    )
+
+
+@timed_repository
 class BuildingRepository:
     def __init__(self, session: AsyncSession):
         self.session = session
@@ -15,39 +180,110 @@ class BuildingRepository:
             self,
             city: str
     ):
-        query = (select(models.Building)
-                 .filter(models.Building.city == city))
-        result = await self.session.execute(query)
+        result = await self.session.execute(BUILDINGS_BY_CITY, {"city": city})
         buildings = result.scalars().all()
 
         return [schemas.Building.model_validate(building) for building in buildings]
 
+    async def get_buildings_in_bbox(
+            self,
+            south: float,
+            west: float,
+            north: float,
+            east: float,
+            limit: int
+    ) -> list[schemas.Building]:
+        result = await self.session.execute(
+            select(models.Building)
+            .filter(models.Building.latitude.between(south, north),
+                    or_(*(models.Building.longitude.between(range_west, range_east)
+                          for range_west, range_east in longitude_ranges(west, east))))
+            .order_by(models.Building.id)
+            .limit(limit)
+        )
+        return [schemas.Building.model_validate(building) for building in result.scalars().all()]
 
+    async def get_clusters(
+            self,
+            south: float,
+            west: float,
+            north: float,
+            east: float,
+            grid_size: int
+    ) -> list[schemas.BuildingCluster]:
+        """ Buildings of the box aggregated on a grid_size x grid_size grid. The box is half-open, north and east excluded. """
+        latitude, longitude = models.Building.latitude, models.Building.longitude
+        row = func.floor((latitude - south) / ((north - south) / grid_size)).label("row")
+        column = func.floor((longitude - west) / ((east - west) / grid_size)).label("column")
+        result = await self.session.execute(
+            select(row, column, func.count().label("count"),
+                   func.avg(latitude).label("latitude"), func.avg(longitude).label("longitude"))
+            .filter(latitude >= south, latitude < north, longitude >= west, longitude < east)
+            .group_by(row, column)
+            .order_by(row, column)
+        )
+        return [schemas.BuildingCluster(latitude=r.latitude, longitude=r.longitude, count=r.count)
+                for r in result.all()]
+
+    async def upsert_buildings(self, buildings: list[schemas.BuildingCreate]) -> list[schemas.Building]:
+        """ One multi-row INSERT ... ON CONFLICT (address) DO UPDATE ... RETURNING. """
+        table = models.Building.__table__
+        statement = upsert_statement(self.session, models.Building)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.city, table.c.street, table.c.house],
+            set_={"latitude": statement.excluded.latitude, "longitude": statement.excluded.longitude},
+        ).returning(*table.c)
+        # the last one wins when an address repeats - a statement can't update a row twice
+        rows = {(b.city, b.street, b.house): b.model_dump() for b in buildings}
+        result = await self.session.execute(statement, list(rows.values()))
+        return [schemas.Building.model_validate(row) for row in result.mappings()]
+
+    async def update_buildings(self, buildings: list[schemas.BuildingUpdate]) -> list[int]:
+        """ Bulk UPDATE by primary key, returns the ids that exist. """
+        ids = await existing_ids(self.session, models.Building, [b.id for b in buildings])
+        rows = [b.model_dump(exclude_unset=True) for b in buildings if b.id in ids]
+        if rows:
+            await self.session.execute(update(models.Building), rows)
+        return sorted(ids)
+
+    async def delete_buildings(self, building_ids: list[int]) -> list[int]:
+        """ Buildings with organizations can't be deleted - ValueError. """
+        in_use = (await self.session.execute(
+            select(models.Organization.building_id).distinct()
+            .filter(models.Organization.building_id.in_(building_ids))
+        )).scalars().all()
+        if in_use:
+            raise ValueError(f"Buildings still have organizations: {sorted(in_use)}")
+        result = await self.session.execute(
+            delete(models.Building).filter(models.Building.id.in_(building_ids)).returning(models.Building.id)
+        )
+        return sorted(result.scalars().all())
+
+
+@timed_repository
 class ActivityRepository:
     def __init__(self, session: AsyncSession):
         self.session = session
 
-    async def get_all_subactivities(
-            self,
-            activity_name,
-            depth=0,
-            max_depth=3
-    ) -> list[schemas.Activity]:
-        query = select(models.Activity).filter_by(name=activity_name)
-        result = await self.session.execute(query)
-        activity = result.scalar()
-        if not activity or depth > max_depth:
-            return []
-        subactivities = []
-        for child in activity.children:
-            subactivities.append(child)
-            subactivities.extend(
-                await self.get_all_subactivities(child.name, depth + 1, max_depth)
-            )
-        return [schemas.Activity.model_validate(act) for
-                act in subactivities]
+    async def get_activity_tree(self) -> list[schemas.ActivityNode]:
+        """ Every activity as a flat (id, name, parent_id) list - one query for the whole tree. """
+        result = await self.session.execute(ACTIVITY_TREE)
+        return [schemas.ActivityNode.model_validate(row) for row in result.all()]
+
+    async def get_max_organization_id(self) -> int:
+        return (await self.session.execute(select(func.max(models.Organization.id)))).scalar() or 0
+
+    async def stream_organization_activities(self, batch_size: int) -> AsyncIterator[tuple[int, int]]:
+        """ Every (organization id, activity id) pair, through a server-side cursor. """
+        table = models.OrganizationActivity.__table__
+        result = await self.session.stream(
+            select(table.c.organization_id, table.c.activity_id).execution_options(yield_per=batch_size))
+        async for partition in result.partitions():
+            for organization_id, activity_id in partition:
+                yield organization_id, activity_id
 
 
+@timed_repository
 class OrganizationRepository:
     def __init__(self, session: AsyncSession):
         self.session = session
@@ -58,82 +294,234 @@ class OrganizationRepository:
             street: str,
             house: str,
     ) -> List[schemas.Organization] | None:
-        query = (select(models.Organization)
-                 .options(joinedload(models.Organization.phone_numbers))
-                 .options(joinedload(models.Organization.building))
-                 .filter((models.Building.city == city) &
-                         (models.Building.street == street) &
-                         (models.Building.house == house)))
-        result = (await self.session.execute(query)).unique()
-        organizations = result.scalars().all()
-        return [schemas.Organization.model_validate(org) for
-                org in organizations]
+        result = await self.session.execute(
+            ORGANIZATIONS_BY_BUILDING_ADDRESS,
+            {"city": city, "street": street, "house": house}
+        )
+        return [document_to_organization(document) for
+                document in result.scalars().all()]
 
     async def get_organizations_by_activity(
             self,
             activity: str
     ) -> List[schemas.Organization] | None:
-        query = (
-            select(models.Organization)
-            .options(joinedload(models.Organization.activities))
-            .options(joinedload(models.Organization.phone_numbers))
-            .filter(models.Activity.name == activity)
-        )
-        result = (await self.session.execute(query)).unique()
+        result = (await self.session.execute(ORGANIZATIONS_BY_ACTIVITY, {"activity": activity})).unique()
         organizations = result.scalars().all()
         return [schemas.Organization.model_validate(org) for
                 org in organizations]
 
+    async def stream_organizations_by_activity(
+            self,
+            activity: str,
+            batch_size: int
+    ) -> AsyncIterator[schemas.Organization]:
+        """ get_organizations_by_activity through a server-side cursor, `batch_size` rows in memory at a time. """
+        result = await self.session.stream(
+            ORGANIZATION_ROWS_BY_ACTIVITY.execution_options(yield_per=batch_size), {"activity": activity})
+        async for organization in collapse_organizations(result):
+            yield organization
+
+    async def stream_organizations_by_activity_ids(
+            self,
+            activity_ids: list[int],
+            batch_size: int
+    ) -> AsyncIterator[schemas.Organization]:
+        """ get_organizations_by_activity_ids through a server-side cursor, `batch_size` rows in memory at a time. """
+        if not activity_ids:
+            return
+        result = await self.session.stream(
+            ORGANIZATION_ROWS_BY_ACTIVITY_IDS.execution_options(yield_per=batch_size), {"activity_ids": activity_ids})
+        async for organization in collapse_organizations(result):
+            yield organization
+
     async def get_organization_by_id(
             self,
             organization_id: int
     ) -> schemas.Organization | None:
-        query = (
-            select(models.Organization)
-            .options(joinedload(models.Organization.phone_numbers))
-            .options(joinedload(models.Organization.building))
-            .filter(models.Organization.id == organization_id)
-        )
-        result = await self.session.execute(query)
-        organization = result.unique().scalars().first()
+        result = await self.session.execute(ORGANIZATION_BY_ID, {"organization_id": organization_id})
+        document = result.scalars().first()
 
-        return schemas.Organization.model_validate(organization) if organization else None
+        return document_to_organization(document) if document else None
 
     async def get_organization_by_name(
             self,
             name: str
     ) -> schemas.Organization | None:
-        query = (select(models.Organization)
-                 .options(joinedload(models.Organization.phone_numbers))
-                 .filter(models.Organization.name == name))
-        result = await self.session.execute(query)
-        org = result.scalar()
-        return schemas.Organization.model_validate(org) if org else None
-
-    async def find_organizations_by_activity(self, activity_name, subactivities: list[schemas.Activity]):
-        query = select().filter_by(name=activity_name)
-        result = await self.session.execute(query)
-        all_activities = result.scalars().all()
-        all_activities += subactivities
-        organizations = set()
-        for act in all_activities:
-            if act:
-                organizations.update(act.organizations)
-        return [schemas.Organization.model_validate(org) for org in organizations]
+        result = await self.session.execute(ORGANIZATION_BY_NAME, {"name": name})
+        document = result.scalars().first()
+        return document_to_organization(document) if document else None
+
+    async def get_organizations_by_activity_ids(
+            self,
+            activity_ids: list[int]
+    ) -> List[schemas.Organization]:
+        if not activity_ids:
+            return []
+        result = await self.session.execute(ORGANIZATIONS_BY_ACTIVITY_IDS, {"activity_ids": activity_ids})
+        organizations = result.unique().scalars().all()
+        return [schemas.Organization.model_validate(org) for
+                org in organizations]
+
+    async def get_organization_ids_by_activity_ids(self, activity_ids: list[int]) -> set[int]:
+        table = models.OrganizationActivity.__table__
+        result = await self.session.execute(
+            select(table.c.organization_id).where(table.c.activity_id.in_(activity_ids)).distinct())
+        return set(result.scalars().all())
+
+    async def get_organizations_by_ids(
+            self,
+            organization_ids: list[int]
+    ) -> List[schemas.Organization]:
+        if not organization_ids:
+            return []
+        result = await self.session.execute(ORGANIZATIONS_BY_IDS, {"organization_ids": organization_ids})
+        return [document_to_organization(document) for document in result.scalars().all()]
+
+    async def get_organizations_by_phone_numbers(
+            self,
+            phone_numbers: list[str]
+    ) -> dict[str, schemas.Organization]:
+        """ E.164 phone number -> its organization, numbers nobody has are left out. """
+        result = await self.session.execute(ORGANIZATIONS_BY_PHONE_NUMBERS, {"phone_numbers": phone_numbers})
+        return {phone_number: document_to_organization(document) for phone_number, document in result.all()}
+
+    async def search(
+            self,
+            query: str,
+            limit: int,
+            offset: int,
+            latitude: float | None = None,
+            longitude: float | None = None,
+            distance_scale_km: float = 5
+    ) -> list[schemas.SearchHit]:
+        """
+        Documents matching every word of `query`, best first. On Postgres the match
+        goes through the GIN index and the score is ts_rank_cd, plus 1 when the
+        name itself matches; elsewhere (sqlite stand-ins) a substring match scored
+        by the words found in the name. Around a point the score is divided by
+        1 + distance / distance_scale_km.
+        """
+        document = models.OrganizationDocument
+        if self.session.bind.dialect.name == "postgresql":
+            tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+            match = func.to_tsvector(SEARCH_CONFIG, document.search_text).op("@@")(tsquery)
+            score = (func.ts_rank_cd(func.to_tsvector(SEARCH_CONFIG, document.search_text), tsquery)
+                     + case((func.to_tsvector(SEARCH_CONFIG, document.name).op("@@")(tsquery), 1.0), else_=0.0))
+        else:
+            words = query.lower().split()
+            match = and_(*(func.lower(document.search_text).contains(word) for word in words))
+            score = sum((case((func.lower(document.name).contains(word), 1.0), else_=0.0) for word in words),
+                        literal(0.0))
+
+        distance = literal(None, Float)
+        if latitude is not None:
+            # equirectangular approximation, exact enough for ranking
+            dx = (document.longitude - longitude) * (KM_PER_DEGREE * math.cos(math.radians(latitude)))
+            dy = (document.latitude - latitude) * KM_PER_DEGREE
+            distance = func.sqrt(dx * dx + dy * dy, type_=Float)
+            # no building - as far as it gets
+            score = score / (1.0 + func.coalesce(distance, 20000.0) / float(distance_scale_km))
+
+        score = score.label("score")
+        result = await self.session.execute(
+            select(document, score, distance.label("distance"))
+            .filter(match)
+            .order_by(score.desc(), document.organization_id)
+            .limit(limit)
+            .offset(offset)
+        )
+        return [
+            schemas.SearchHit(
+                id=doc.organization_id, name=doc.name, phone_numbers=doc.phone_numbers,
+                city=doc.city, street=doc.street, house=doc.house,
+                latitude=doc.latitude, longitude=doc.longitude,
+                score=score, distance_km=distance,
+            )
+            for doc, score, distance in result.all()
+        ]
+
+    async def upsert_organizations(self, organizations: list[schemas.OrganizationCreate]) -> dict[tuple[int, str], int]:
+        """ One multi-row INSERT ... ON CONFLICT (building_id, name) ... RETURNING. (building_id, name) -> id. """
+        table = models.Organization.__table__
+        statement = upsert_statement(self.session, models.Organization)
+        # no-op update, so existing rows are returned too
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.building_id, table.c.name],
+            set_={"name": statement.excluded.name},
+        ).returning(table.c.id, table.c.building_id, table.c.name)
+        await check_references(self.session, models.Building, {o.building_id for o in organizations})
+        rows = {(o.building_id, o.name): {"building_id": o.building_id, "name": o.name} for o in organizations}
+        result = await self.session.execute(statement, list(rows.values()))
+        return {(row.building_id, row.name): row.id for row in result}
+
+    async def update_organizations(self, organizations: list[schemas.OrganizationUpdate]) -> list[int]:
+        """ Bulk UPDATE by primary key of the scalar fields, returns the ids that exist. """
+        ids = await existing_ids(self.session, models.Organization, [o.id for o in organizations])
+        await check_references(self.session, models.Building,
+                               {o.building_id for o in organizations if o.building_id is not None})
+        rows = [o.model_dump(exclude_unset=True, include={"id", "name", "building_id"})
+                for o in organizations if o.id in ids]
+        rows = [row for row in rows if len(row) > 1]
+        if rows:
+            await self.session.execute(update(models.Organization), rows)
+        return sorted(ids)
+
+    async def set_phone_numbers(self, phone_numbers: dict[str, int], replace: set[int] = frozenset()) -> set[int]:
+        """
+        `phone_numbers` - phone -> organization id; phones owned by other organizations
+        move. Organizations in `replace` lose their other phones. Returns the
+        organizations phones were moved away from.
+        """
+        table = models.PhoneNumber.__table__
+        if replace:
+            await self.session.execute(delete(table).filter(table.c.organization_id.in_(replace)))
+        if not phone_numbers:
+            return set()
+        previous_owners = set((await self.session.execute(
+            select(table.c.organization_id).filter(table.c.phone_number.in_(list(phone_numbers)))
+        )).scalars().all())
+        statement = upsert_statement(self.session, models.PhoneNumber)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.phone_number],
+            set_={"organization_id": statement.excluded.organization_id},
+        )
+        await self.session.execute(statement, [{"phone_number": phone, "organization_id": organization_id}
+                                               for phone, organization_id in phone_numbers.items()])
+        return previous_owners - set(phone_numbers.values()) - {None}
+
+    async def set_activities(self, activities: set[tuple[int, int]], replace: set[int] = frozenset()):
+        """ `activities` - (organization id, activity id) pairs to add; organizations in `replace` lose the others. """
+        table = models.OrganizationActivity.__table__
+        if replace:
+            await self.session.execute(delete(table).filter(table.c.organization_id.in_(replace)))
+        if activities:
+            await check_references(self.session, models.Activity, {activity_id for _, activity_id in activities})
+            await self.session.execute(
+                upsert_statement(self.session, models.OrganizationActivity).on_conflict_do_nothing(),
+                [{"organization_id": organization_id, "activity_id": activity_id}
+                 for organization_id, activity_id in sorted(activities)]
+            )
+
+    async def delete_organizations(self, organization_ids: list[int]) -> list[int]:
+        for model in (models.PhoneNumber, models.OrganizationActivity):
+            await self.session.execute(delete(model).filter(model.organization_id.in_(organization_ids)))
+        result = await self.session.execute(
+            delete(models.Organization).filter(models.Organization.id.in_(organization_ids))
+            .returning(models.Organization.id)
+        )
+        return sorted(result.scalars().all())
 
 
+@timed_repository
 class UserRepository:
     def __init__(self, session: AsyncSession):
         self.session = session
 
     async def get_user(self, username) -> schemas.UserInDb | None:
-        print(username)
+        logger.debug("get user", extra={"username": username})
         # relationships fields required
-        query = (select(models.User)
-                 .options(joinedload(models.User.permissions))
-                 .filter_by(username=username))
-        result = await self.session.execute(query)
-        user = result.scalar()
+        result = await self.session.execute(USER_BY_USERNAME, {"username": username})
+        user = result.unique().scalars().first()
 
         return schemas.UserInDb.model_validate(user) if user else None
         # return schemas.UserInDb(
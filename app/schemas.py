@@ -1,6 +1,8 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from typing import List, Optional
 
+from app.phones import normalize_phone
+
 
 class PhoneNumber(BaseModel):
     model_config = ConfigDict(from_attributes=True)
@@ -16,14 +18,76 @@ class OrganizationBase(BaseModel):
     phone_numbers: List[PhoneNumber]
 
 
-class OrganizationCreate(OrganizationBase):
-    pass
+class OrganizationCreate(BaseModel):
+    """ Upserted by (building_id, name); phone numbers move here from other organizations. """
+    name: str = Field(min_length=1)
+    building_id: int
+    phone_numbers: List[str] = []
+    activity_ids: List[int] = []
+
+    @field_validator("phone_numbers")
+    @classmethod
+    def normalize_phone_numbers(cls, phone_numbers: List[str]) -> List[str]:
+        return [normalize_phone(phone) for phone in phone_numbers]
+
+
+class OrganizationUpdate(BaseModel):
+    """ Only the given fields change; lists replace the current ones. """
+    id: int
+    name: Optional[str] = Field(None, min_length=1)
+    building_id: Optional[int] = None
+    phone_numbers: Optional[List[str]] = None
+    activity_ids: Optional[List[int]] = None
+
+    @field_validator("phone_numbers")
+    @classmethod
+    def normalize_phone_numbers(cls, phone_numbers: Optional[List[str]]) -> Optional[List[str]]:
+        return phone_numbers if phone_numbers is None else [normalize_phone(phone) for phone in phone_numbers]
+
+    @field_validator("name")
+    @classmethod
+    def not_null(cls, value):
+        # omitted - unchanged, null - would break NOT NULL
+        if value is None:
+            raise ValueError("may be omitted but not null")
+        return value
 
 
 class Organization(OrganizationBase):
     id: int
 
 
+class SearchHit(Organization):
+    city: Optional[str] = None
+    street: Optional[str] = None
+    house: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    score: float
+    # only when searched around a point
+    distance_km: Optional[float] = None
+
+
+class SearchPage(BaseModel):
+    items: List[SearchHit]
+    offset: int
+    limit: int
+    has_more: bool
+
+
+class OrganizationPage(BaseModel):
+    items: List[Organization]
+    offset: int
+    limit: int
+    total: int
+
+
+class PhoneNumberOwner(BaseModel):
+    """ The organization a phone number (E.164) belongs to, None - nobody's. """
+    phone_number: str
+    organization: Optional[Organization] = None
+
+
 class BuildingBase(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
@@ -35,7 +99,26 @@ class BuildingBase(BaseModel):
 
 
 class BuildingCreate(BuildingBase):
-    pass
+    """ Upserted by address. """
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
+
+
+class BuildingUpdate(BaseModel):
+    id: int
+    city: Optional[str] = None
+    street: Optional[str] = None
+    house: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+
+    @field_validator("city", "street", "house", "latitude", "longitude")
+    @classmethod
+    def not_null(cls, value):
+        # omitted - unchanged, null - would break NOT NULL
+        if value is None:
+            raise ValueError("may be omitted but not null")
+        return value
 
 
 class Building(BuildingBase):
@@ -44,6 +127,24 @@ class Building(BuildingBase):
     id: int
 
 
+class BuildingCluster(BaseModel):
+    """ Buildings of one grid cell: their count and centroid. """
+    latitude: float
+    longitude: float
+    count: int
+
+
+class Viewport(BaseModel):
+    """ Either clusters (low zoom) or buildings (high zoom). """
+    zoom: int
+    clusters: List[BuildingCluster] = []
+    buildings: List[Building] = []
+
+
+class BatchDelete(BaseModel):
+    ids: List[int]
+
+
 class ActivityBase(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
@@ -55,6 +156,10 @@ class ActivityCreate(ActivityBase):
     pass
 
 
+class ActivityNode(ActivityBase):
+    id: int
+
+
 class Activity(ActivityBase):
     model_config = ConfigDict(from_attributes=True)
 
@@ -1,20 +1,127 @@
+from collections import defaultdict
 from datetime import timedelta, datetime, timezone
-from typing import List, Dict
+from typing import AsyncIterator, List, Dict, Iterable
 
 from geopy import Nominatim
 from geopy.adapters import AioHTTPAdapter
 from geopy.distance import distance
 import jwt
 from passlib.context import CryptContext
+from pydantic import TypeAdapter
 
 from . import schemas
+from .activity_index import LiveActivityIndex, bitset_ids
+from .cache import cache, make_key
+from .deadlines import time_left
+from .metrics import GEOCODER_REQUEST_DURATION
+from .read_model import mark_dirty
+from .phones import normalize_phone
 from .schemas import UserInDb
+from .tiles import tile_bounds, tiles_covering
 from .uow import unit_of_work
 from config import settings
 
+ORGANIZATION_ADAPTER = TypeAdapter(schemas.Organization)
+ORGANIZATIONS_ADAPTER = TypeAdapter(List[schemas.Organization])
+ACTIVITY_TREE_ADAPTER = TypeAdapter(List[schemas.ActivityNode])
+BUILDINGS_WITH_ORGANIZATIONS_ADAPTER = TypeAdapter(List[Dict])
+CITY_ADAPTER = TypeAdapter(str)
+CLUSTERS_ADAPTER = TypeAdapter(List[schemas.BuildingCluster])
+SEARCH_PAGE_ADAPTER = TypeAdapter(schemas.SearchPage)
+PHONE_NUMBER_OWNERS_ADAPTER = TypeAdapter(List[schemas.PhoneNumberOwner])
+ORGANIZATION_PAGE_ADAPTER = TypeAdapter(schemas.OrganizationPage)
+USER_ACTIVE_ADAPTER = TypeAdapter(bool)
+
+# cache tags, writes invalidate them
+ORGANIZATIONS_TAG = "organizations"
+BUILDINGS_TAG = "buildings"
+ACTIVITIES_TAG = "activities"
+
+
+def organization_tag(organization_id: int) -> str:
+    return f"org:{organization_id}"
+
+
+async def invalidate_organizations(organization_ids: Iterable[int], *tags: str):
+    """ Drops cached reads of the given organizations, of every organization list and of `tags`. """
+    await cache.invalidate([ORGANIZATIONS_TAG, *tags, *map(organization_tag, organization_ids)])
+
+
+# rebuilt when either tag moves
+activity_index = LiveActivityIndex([ORGANIZATIONS_TAG, ACTIVITIES_TAG])
+
 
 class BuildingService:
 
+    async def create_buildings(self, buildings: List[schemas.BuildingCreate]) -> List[schemas.Building]:
+        async with unit_of_work() as uow:
+            created = await uow.building_repository.upsert_buildings(buildings)
+            # existing buildings may have got new coordinates
+            mark_dirty(uow.session, building_ids=[b.id for b in created])
+        await cache.invalidate([BUILDINGS_TAG, ORGANIZATIONS_TAG])
+        return created
+
+    async def update_buildings(self, buildings: List[schemas.BuildingUpdate]) -> List[int]:
+        async with unit_of_work() as uow:
+            updated = await uow.building_repository.update_buildings(buildings)
+            mark_dirty(uow.session, building_ids=updated)
+        await cache.invalidate([BUILDINGS_TAG, ORGANIZATIONS_TAG])
+        return updated
+
+    async def delete_buildings(self, building_ids: List[int]) -> List[int]:
+        async with unit_of_work() as uow:
+            deleted = await uow.building_repository.delete_buildings(building_ids)
+            mark_dirty(uow.session, building_ids=deleted)
+        await cache.invalidate([BUILDINGS_TAG])
+        return deleted
+
+    async def get_viewport(
+            self,
+            south: float,
+            west: float,
+            north: float,
+            east: float,
+            zoom: int
+    ) -> schemas.Viewport:
+        """
+        Buildings in the box, or at zoom <= VIEWPORT_CLUSTER_MAX_ZOOM grid clusters of
+        every map tile the box touches. Clusters are computed and cached per tile, so
+        they may lie outside the box - the map clips them, and panning hits the cache.
+        """
+        GeoUtils.validate_coordinates(south, west)
+        GeoUtils.validate_coordinates(north, east)
+        # west > east - the box crosses the antimeridian
+        if south >= north or west == east:
+            raise ValueError("Empty bounding box, south has to be below north and west can't equal east.")
+        if not 0 <= zoom <= 22:
+            raise ValueError(f"Invalid zoom: {zoom}")
+
+        if zoom > settings.VIEWPORT_CLUSTER_MAX_ZOOM:
+            async with unit_of_work(read_only=True, single_statement=True) as uow:
+                buildings = await uow.building_repository.get_buildings_in_bbox(
+                    south, west, north, east, settings.VIEWPORT_MAX_BUILDINGS)
+            return schemas.Viewport(zoom=zoom, buildings=buildings)
+
+        tiles = tiles_covering(south, west, north, east, zoom)
+        if len(tiles) > settings.VIEWPORT_MAX_TILES:
+            raise ValueError(f"The box covers {len(tiles)} tiles at zoom {zoom}, "
+                             f"at most {settings.VIEWPORT_MAX_TILES} are allowed.")
+        clusters = []
+        for x, y in tiles:
+            clusters += await cache.get_or_load(
+                make_key("viewport:tile", zoom, x, y),
+                lambda: self._get_tile_clusters(zoom, x, y),
+                CLUSTERS_ADAPTER,
+                tags=[BUILDINGS_TAG],
+                ttl=settings.VIEWPORT_TILE_TTL,
+            )
+        return schemas.Viewport(zoom=zoom, clusters=clusters)
+
+    async def _get_tile_clusters(self, zoom: int, x: int, y: int) -> List[schemas.BuildingCluster]:
+        async with unit_of_work(read_only=True, single_statement=True) as uow:
+            return await uow.building_repository.get_clusters(
+                *tile_bounds(zoom, x, y), settings.VIEWPORT_GRID_SIZE)
+
     async def get_buildings_with_organizations_by_coordinates(
             self,
             latitude: float,
@@ -22,8 +129,26 @@ class BuildingService:
             r: float
     ) -> List[Dict]:
         GeoUtils.validate_coordinates(latitude, longitude, r)
-        async with unit_of_work() as uow:
-            city = await GeoUtils.find_city_by_coordinates(latitude, longitude)
+        return await cache.get_or_load(
+            make_key("buildings:coordinates", latitude, longitude, r),
+            lambda: self._get_buildings_with_organizations_by_coordinates(latitude, longitude, r),
+            BUILDINGS_WITH_ORGANIZATIONS_ADAPTER,
+            tags=[BUILDINGS_TAG, ORGANIZATIONS_TAG],
+        )
+
+    async def _get_buildings_with_organizations_by_coordinates(
+            self,
+            latitude: float,
+            longitude: float,
+            r: float
+    ) -> List[Dict]:
+        async with unit_of_work(read_only=True) as uow:
+            city = await cache.get_or_load(
+                make_key("geo:city", latitude, longitude),
+                lambda: GeoUtils.find_city_by_coordinates(latitude, longitude),
+                CITY_ADAPTER,
+                ttl=settings.GEOCODER_CACHE_TTL,
+            )
             if not city:
                 raise ValueError(f"No city found for coordinates: {latitude}, {longitude}")
 
@@ -43,6 +168,52 @@ class BuildingService:
 
 class OrganizationService:
 
+    async def create_organizations(
+            self,
+            organizations: List[schemas.OrganizationCreate]
+    ) -> List[schemas.Organization]:
+        async with unit_of_work() as uow:
+            repository = uow.organization_repository
+            ids = await repository.upsert_organizations(organizations)
+            moved_from = await repository.set_phone_numbers(
+                {phone: ids[(o.building_id, o.name)] for o in organizations for phone in o.phone_numbers})
+            await repository.set_activities(
+                {(ids[(o.building_id, o.name)], activity_id) for o in organizations for activity_id in o.activity_ids})
+            touched = {*ids.values(), *moved_from}
+            mark_dirty(uow.session, touched)
+        await invalidate_organizations(touched)
+        return await self.get_organizations_by_ids(sorted(set(ids.values())))
+
+    async def update_organizations(self, organizations: List[schemas.OrganizationUpdate]) -> List[int]:
+        async with unit_of_work() as uow:
+            repository = uow.organization_repository
+            updated = await repository.update_organizations(organizations)
+            organizations = [o for o in organizations if o.id in updated]
+            with_phones = [o for o in organizations if o.phone_numbers is not None]
+            moved_from = await repository.set_phone_numbers(
+                {phone: o.id for o in with_phones for phone in o.phone_numbers},
+                replace={o.id for o in with_phones})
+            with_activities = [o for o in organizations if o.activity_ids is not None]
+            await repository.set_activities(
+                {(o.id, activity_id) for o in with_activities for activity_id in o.activity_ids},
+                replace={o.id for o in with_activities})
+            touched = {*updated, *moved_from}
+            mark_dirty(uow.session, touched)
+        await invalidate_organizations(touched)
+        return updated
+
+    async def delete_organizations(self, organization_ids: List[int]) -> List[int]:
+        async with unit_of_work() as uow:
+            deleted = await uow.organization_repository.delete_organizations(organization_ids)
+            mark_dirty(uow.session, deleted)
+        await invalidate_organizations(deleted)
+        return deleted
+
+    async def get_organizations_by_ids(self, organization_ids: List[int]) -> List[schemas.Organization]:
+        # right after a write - replicas may not have it yet
+        async with unit_of_work(read_only=True, single_statement=True, primary=True) as uow:
+            return await uow.organization_repository.get_organizations_by_ids(organization_ids)
+
     async def get_organizations_by_building_address(
             self,
             city: str,
@@ -50,41 +221,222 @@ class OrganizationService:
             house: str
     ) -> List[schemas.Organization]:
         self.validate_address(city, street, house)
-        async with unit_of_work() as uow:
-            return await uow.organization_repository.get_organizations_by_building_address(city, street, house)
+
+        async def load():
+            async with unit_of_work(read_only=True, single_statement=True) as uow:
+                return await uow.organization_repository.get_organizations_by_building_address(city, street, house)
+
+        return await cache.get_or_load(make_key("orgs:address", city, street, house), load,
+                                       ORGANIZATIONS_ADAPTER, tags=[ORGANIZATIONS_TAG, BUILDINGS_TAG])
 
     async def get_organizations_by_activity(
             self,
             activity: str
     ) -> List[schemas.Organization]:
         self.validate_activity(activity)
-        async with unit_of_work() as uow:
-            return await uow.organization_repository.get_organizations_by_activity(activity)
+
+        async def load():
+            async with unit_of_work(read_only=True, single_statement=True) as uow:
+                return await uow.organization_repository.get_organizations_by_activity(activity)
+
+        return await cache.get_or_load(make_key("orgs:activity", activity), load,
+                                       ORGANIZATIONS_ADAPTER, tags=[ORGANIZATIONS_TAG, ACTIVITIES_TAG])
 
     async def get_organization_by_id(
             self,
             organization_id: int
     ) -> schemas.Organization:
         self.validate_id(organization_id)
-        async with unit_of_work() as uow:
-            return await uow.organization_repository.get_organization_by_id(organization_id)
+
+        async def load():
+            async with unit_of_work(read_only=True, single_statement=True) as uow:
+                return await uow.organization_repository.get_organization_by_id(organization_id)
+
+        return await cache.get_or_load(make_key("org:id", organization_id), load,
+                                       ORGANIZATION_ADAPTER, tags=[organization_tag(organization_id)])
 
     async def get_organization_by_name(
             self,
             name: str
     ) -> schemas.Organization:
         self.validate_name(name)
-        async with unit_of_work() as uow:
-            return await uow.organization_repository.get_organization_by_name(name)
+
+        async def load():
+            async with unit_of_work(read_only=True, single_statement=True) as uow:
+                return await uow.organization_repository.get_organization_by_name(name)
+
+        return await cache.get_or_load(make_key("org:name", name), load,
+                                       ORGANIZATION_ADAPTER, tags=[ORGANIZATIONS_TAG])
+
+    async def get_organizations_by_phone_numbers(
+            self,
+            phone_numbers: List[str]
+    ) -> List[schemas.PhoneNumberOwner]:
+        """ Owners of the numbers in any format, in the order asked; one indexed query for the batch. """
+        if not phone_numbers or len(phone_numbers) > settings.PHONE_LOOKUP_MAX:
+            raise ValueError(f"Between 1 and {settings.PHONE_LOOKUP_MAX} phone numbers per lookup.")
+        normalized = list(dict.fromkeys(normalize_phone(phone) for phone in phone_numbers))
+
+        async def load():
+            async with unit_of_work(read_only=True, single_statement=True) as uow:
+                owners = await uow.organization_repository.get_organizations_by_phone_numbers(normalized)
+            return [schemas.PhoneNumberOwner(phone_number=phone, organization=owners.get(phone))
+                    for phone in normalized]
+
+        return await cache.get_or_load(make_key("org:phones", *normalized), load,
+                                       PHONE_NUMBER_OWNERS_ADAPTER, tags=[ORGANIZATIONS_TAG])
+
+    async def search_organizations(
+            self,
+            query: str,
+            latitude: float | None = None,
+            longitude: float | None = None,
+            offset: int = 0,
+            limit: int = 20
+    ) -> schemas.SearchPage:
+        """ Ranked search over names, activity names and addresses, closer ones first around a point. """
+        if not isinstance(query, str) or not query.strip():
+            raise ValueError("Invalid query. Query must be a non-empty string.")
+        if (latitude is None) != (longitude is None):
+            raise ValueError("Latitude and longitude go together.")
+        if latitude is not None:
+            GeoUtils.validate_coordinates(latitude, longitude)
+        if not 1 <= limit <= settings.SEARCH_MAX_LIMIT:
+            raise ValueError(f"Invalid limit: {limit}. Limit must be between 1 and {settings.SEARCH_MAX_LIMIT}.")
+        if not 0 <= offset <= settings.SEARCH_MAX_OFFSET:
+            raise ValueError(f"Invalid offset: {offset}. Offset must be between 0 and {settings.SEARCH_MAX_OFFSET}.")
+        query = " ".join(query.split())
+
+        async def load():
+            async with unit_of_work(read_only=True, single_statement=True) as uow:
+                # one extra row tells whether there is a next page
+                hits = await uow.organization_repository.search(
+                    query, limit + 1, offset, latitude, longitude, settings.SEARCH_DISTANCE_SCALE_KM)
+            return schemas.SearchPage(items=hits[:limit], offset=offset, limit=limit, has_more=len(hits) > limit)
+
+        return await cache.get_or_load(make_key("org:search", query, latitude, longitude, offset, limit), load,
+                                       SEARCH_PAGE_ADAPTER, tags=[ORGANIZATIONS_TAG])
 
     async def get_organizations_by_subactivities(
             self,
             activity: str
     ) -> List[schemas.Organization]:
         self.validate_activity(activity)
-        async with unit_of_work() as uow:
-            subactivities = await uow.activity_repository.get_all_subactivities(activity)
-            return await uow.organization_repository.find_organizations_by_activity(activity, subactivities)
+
+        async def load():
+            index = await activity_index.get()
+            if index is not None:
+                organization_ids = bitset_ids(index.subtree(activity))
+                async with unit_of_work(read_only=True, single_statement=True) as uow:
+                    return await uow.organization_repository.get_organizations_by_ids(organization_ids)
+            activity_ids = self.collect_activity_ids(await self.get_activity_tree(), activity)
+            async with unit_of_work(read_only=True, single_statement=True) as uow:
+                return await uow.organization_repository.get_organizations_by_activity_ids(activity_ids)
+
+        return await cache.get_or_load(make_key("orgs:subactivities", activity), load,
+                                       ORGANIZATIONS_ADAPTER, tags=[ORGANIZATIONS_TAG, ACTIVITIES_TAG])
+
+    async def get_organizations_by_activities(
+            self,
+            any_of: List[str] = (),
+            all_of: List[str] = (),
+            offset: int = 0,
+            limit: int = 100
+    ) -> schemas.OrganizationPage:
+        """
+        Organizations under every activity of `all_of` and under at least one of `any_of`,
+        subactivities included, by id. Set operations on the activity index, then one batched fetch.
+        """
+        any_of, all_of = sorted(set(any_of)), sorted(set(all_of))
+        if not any_of and not all_of:
+            raise ValueError("At least one activity is required.")
+        if len(any_of) + len(all_of) > settings.ACTIVITY_FILTER_MAX_NAMES:
+            raise ValueError(f"At most {settings.ACTIVITY_FILTER_MAX_NAMES} activities per query.")
+        for activity in [*any_of, *all_of]:
+            self.validate_activity(activity)
+        if not 1 <= limit <= settings.ACTIVITY_FILTER_MAX_LIMIT:
+            raise ValueError(
+                f"Invalid limit: {limit}. Limit must be between 1 and {settings.ACTIVITY_FILTER_MAX_LIMIT}.")
+        if offset < 0:
+            raise ValueError(f"Invalid offset: {offset}. Offset must not be negative.")
+
+        async def load():
+            index = await activity_index.get()
+            if index is not None:
+                bits = index.match(all_of, any_of)
+                total = bits.bit_count()
+                organization_ids = bitset_ids(bits, offset, limit)
+            else:
+                organization_ids = sorted(await self._match_activities(all_of, any_of))
+                total = len(organization_ids)
+                organization_ids = organization_ids[offset:offset + limit]
+            async with unit_of_work(read_only=True, single_statement=True) as uow:
+                items = await uow.organization_repository.get_organizations_by_ids(organization_ids)
+            return schemas.OrganizationPage(items=items, offset=offset, limit=limit, total=total)
+
+        return await cache.get_or_load(make_key("orgs:activities", *any_of, "&", *all_of, offset, limit), load,
+                                       ORGANIZATION_PAGE_ADAPTER, tags=[ORGANIZATIONS_TAG, ACTIVITIES_TAG])
+
+    async def _match_activities(self, all_of: List[str], any_of: List[str]) -> set[int]:
+        """ ActivityIndex.match in SQL, for when the index is too big to hold. """
+        tree = await self.get_activity_tree()
+        async with unit_of_work(read_only=True) as uow:
+            repository = uow.organization_repository
+            matched = None
+            for activity in all_of:
+                ids = await repository.get_organization_ids_by_activity_ids(self.collect_activity_ids(tree, activity))
+                matched = ids if matched is None else matched & ids
+            if any_of:
+                ids = await repository.get_organization_ids_by_activity_ids(
+                    [i for activity in any_of for i in self.collect_activity_ids(tree, activity)])
+                matched = ids if matched is None else matched & ids
+        return matched
+
+    async def stream_organizations_by_activity(self, activity: str) -> AsyncIterator[schemas.Organization]:
+        """ Uncached and in bounded memory, for results too big to build in one piece. Validates right away. """
+        self.validate_activity(activity)
+        return self._stream(lambda repository: repository.stream_organizations_by_activity(
+            activity, settings.STREAM_BATCH_SIZE))
+
+    async def stream_organizations_by_subactivities(self, activity: str) -> AsyncIterator[schemas.Organization]:
+        """ Uncached and in bounded memory, for results too big to build in one piece. Validates right away. """
+        self.validate_activity(activity)
+        activity_ids = self.collect_activity_ids(await self.get_activity_tree(), activity)
+        return self._stream(lambda repository: repository.stream_organizations_by_activity_ids(
+            activity_ids, settings.STREAM_BATCH_SIZE))
+
+    @staticmethod
+    async def _stream(query) -> AsyncIterator[schemas.Organization]:
+        # server-side cursors live in a transaction, not in autocommit mode
+        async with unit_of_work(read_only=True) as uow:
+            async for organization in query(uow.organization_repository):
+                yield organization
+
+    async def get_activity_tree(self) -> List[schemas.ActivityNode]:
+        async def load():
+            async with unit_of_work(read_only=True, single_statement=True) as uow:
+                return await uow.activity_repository.get_activity_tree()
+
+        return await cache.get_or_load("activities:tree", load,
+                                       ACTIVITY_TREE_ADAPTER, tags=[ACTIVITIES_TAG])
+
+    @staticmethod
+    def collect_activity_ids(
+            tree: List[schemas.ActivityNode],
+            activity: str
+    ) -> List[int]:
+        """ Ids of the activities named `activity` and of all their subactivities - ActivityIndex.subtree. """
+        children = defaultdict(list)
+        for node in tree:
+            children[node.parent_id].append(node.id)
+        level = [node.id for node in tree if node.name == activity]
+        activity_ids = list(level)
+        seen = set(level)
+        while level:
+            level = [child for parent in level for child in children[parent] if child not in seen]
+            seen.update(level)
+            activity_ids.extend(level)
+        return activity_ids
 
     @staticmethod
     def validate_address(city: str, street: str, house: str):
@@ -112,9 +464,20 @@ class AuthService:
         self.pwd_context = pwd_context
 
     async def get_user(self, username: str):
-        async with unit_of_work() as uow:
+        async with unit_of_work(read_only=True, single_statement=True, primary=True) as uow:
             await uow.user_repository.get_user(username)
 
+    @staticmethod
+    async def is_active_user(username: str) -> bool:
+        """ Whether `username` exists and isn't disabled, cached for USER_STATUS_TTL seconds. """
+        async def load():
+            async with unit_of_work(read_only=True, single_statement=True, primary=True) as uow:
+                user = await uow.user_repository.get_user(username)
+            return user is not None and not user.disabled
+
+        return await cache.get_or_load(make_key("user:active", username), load,
+                                       USER_ACTIVE_ADAPTER, ttl=settings.USER_STATUS_TTL)
+
     def verify_password(self, plain_password, hashed_password):
         return self.pwd_context.verify(plain_password, hashed_password)
 
@@ -122,7 +485,7 @@ class AuthService:
         return self.pwd_context.hash(password)
 
     async def authenticate_user(self, username: str, password: str) -> UserInDb | bool:
-        async with unit_of_work() as uow:
+        async with unit_of_work(read_only=True, single_statement=True, primary=True) as uow:
             user = await uow.user_repository.get_user(username)
             if not user:
                 return False
@@ -142,6 +505,21 @@ class AuthService:
 
 
 class GeoUtils:
+    # shared client, opened by the application lifespan; None - a client per call
+    geolocator: Nominatim | None = None
+
+    @classmethod
+    async def open_geolocator(cls):
+        if cls.geolocator is None:
+            geolocator = Nominatim(user_agent="companies_app",
+                                   adapter_factory=AioHTTPAdapter)
+            cls.geolocator = await geolocator.__aenter__()
+
+    @classmethod
+    async def close_geolocator(cls):
+        if cls.geolocator is not None:
+            geolocator, cls.geolocator = cls.geolocator, None
+            await geolocator.__aexit__(None, None, None)
 
     @classmethod
     def is_within_radius(
@@ -163,16 +541,24 @@ class GeoUtils:
     @classmethod
     async def find_city_by_coordinates(cls, latitude: float, longitude: float):
         cls.validate_coordinates(latitude, longitude)
-
-        async with Nominatim(user_agent="companies_app",
-                             adapter_factory=AioHTTPAdapter) as geolocator:
-            location = await geolocator.reverse(
-                (latitude, longitude), exactly_one=True)
-            if not location:
-                return None
-            address = location.raw['address']
-            city = address.get('city', '')
-            return city
+        # no point waiting for Nominatim longer than the request may take
+        left = time_left()
+        kwargs = {"timeout": max(left, 0.001)} if left is not None else {}
+
+        with GEOCODER_REQUEST_DURATION.time("reverse"):
+            if cls.geolocator is not None:
+                location = await cls.geolocator.reverse(
+                    (latitude, longitude), exactly_one=True, **kwargs)
+            else:
+                async with Nominatim(user_agent="companies_app",
+                                     adapter_factory=AioHTTPAdapter) as geolocator:
+                    location = await geolocator.reverse(
+                        (latitude, longitude), exactly_one=True, **kwargs)
+        if not location:
+            return None
+        address = location.raw['address']
+        city = address.get('city', '')
+        return city
 
     @staticmethod
     def validate_coordinates(
@@ -0,0 +1,43 @@
+"""
+    Slippy map (Web Mercator, z/x/y) tile math: the tiles the map UI renders are the
+    units viewport aggregates are computed and cached in.
+"""
+import math
+
+# latitudes beyond this don't exist in Web Mercator
+MAX_LATITUDE = 85.0511287798
+
+
+def tile_of(latitude: float, longitude: float, zoom: int) -> tuple[int, int]:
+    n = 2 ** zoom
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude))
+    x = int((longitude + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(zoom: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """ (south, west, north, east) of a tile. """
+    n = 2 ** zoom
+
+    def latitude(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return latitude(y + 1), x / n * 360 - 180, latitude(y), (x + 1) / n * 360 - 180
+
+
+def longitude_ranges(west: float, east: float) -> list[tuple[float, float]]:
+    """ west > east - the box crosses the antimeridian and is two ranges, one on each side. """
+    if west <= east:
+        return [(west, east)]
+    return [(west, 180), (-180, east)]
+
+
+def tiles_covering(south: float, west: float, north: float, east: float, zoom: int) -> list[tuple[int, int]]:
+    tiles = []
+    for range_west, range_east in longitude_ranges(west, east):
+        # y grows southwards
+        min_x, min_y = tile_of(north, range_west, zoom)
+        max_x, max_y = tile_of(south, range_east, zoom)
+        tiles += [(x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)]
+    return list(dict.fromkeys(tiles))
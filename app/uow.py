@@ -1,16 +1,21 @@
-import traceback
-
+import logging
 from contextlib import asynccontextmanager
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app import read_model  # registers the read model refresh on commit
+from app.deadlines import check_deadline
 from app.repositories import BuildingRepository, ActivityRepository, OrganizationRepository, UserRepository
-from app.db import AsyncSessionLocal
+from app.db import AsyncSessionLocal, ReadOnlySessionLocal, AutocommitSessionLocal
+from app.replicas import Replica, replica_pool, is_connection_error
+
+logger = logging.getLogger(__name__)
 
 
 class UnitOfWork:
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, read_only: bool = False):
         self.session = session
+        self.read_only = read_only
         self._building_repository = None
         self._activity_repository = None
         self._organization_repository = None
@@ -41,6 +46,8 @@ class UnitOfWork:
         return self._user_repository
 
     async def commit(self):
+        if self.read_only:
+            raise RuntimeError("Read-only unit of work can't be committed.")
         await self.session.commit()
 
     async def rollback(self):
@@ -50,17 +57,55 @@ class UnitOfWork:
         await self.session.close()
 
 
+def _make_session(
+        read_only: bool,
+        single_statement: bool,
+        primary: bool
+) -> tuple[AsyncSession, Replica | None, bool]:
+    if not read_only:
+        return AsyncSessionLocal(), None, False
+    replica, trial = (None, False) if primary else replica_pool.choose()
+    if replica is not None:
+        return replica.session(single_statement), replica, trial
+    if single_statement:
+        return AutocommitSessionLocal(), None, False
+    return ReadOnlySessionLocal(), None, False
+
+
 @asynccontextmanager
-async def unit_of_work():
-    session = AsyncSessionLocal()
-    uow = UnitOfWork(session)
+async def unit_of_work(
+        read_only: bool = False,
+        single_statement: bool = False,
+        primary: bool = False
+):
+    """
+    read_only: the session runs in a READ ONLY transaction and is never committed.
+    Read-only units of work are routed to a read replica if any is configured.
+    single_statement: (read_only only) run in autocommit mode, so a single
+    query doesn't pay for BEGIN/COMMIT round trips.
+    primary: (read_only only) read from the primary anyway - for reads that
+    can't tolerate replication lag (auth).
+
+    Past the request deadline (app.deadlines) no unit of work starts and none commits.
+    """
+    check_deadline()
+    session, replica, trial = _make_session(read_only, single_statement, primary)
+    uow = UnitOfWork(session, read_only=read_only)
     try:
         yield uow
-        await uow.commit()
+        if not read_only:
+            check_deadline()
+            await uow.commit()
     except Exception as e:
+        if replica is not None and is_connection_error(e):
+            replica_pool.eject(replica)
         await uow.rollback()
-        print(f"ValidationError: {e}")
-        print(traceback.format_exc())
+        logger.exception("unit of work failed", extra={"read_only": read_only})
         raise
+    else:
+        if trial:
+            replica_pool.succeeded(replica)
     finally:
+        if trial:
+            replica_pool.end_trial(replica)
         await uow.close()
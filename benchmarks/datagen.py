@@ -0,0 +1,292 @@
+"""
+    Deterministic synthetic dataset for benchmarks and scale tests.
+
+    generate() builds every table's rows in memory from a seed: buildings clustered
+    around real cities (bigger cities get more buildings, spread normally around the
+    centre), organizations with phones and activities, a deep and wide activity tree,
+    users with permissions, and the organization documents derived from all of that.
+    load() writes them with explicit ids - COPY on asyncpg, chunked executemany
+    elsewhere - and moves the id sequences past them.
+
+    Destroys everything in the configured database, so it only runs with MODE=TEST.
+
+    python -m benchmarks.datagen --scale 1000  # 1M buildings, 3M organizations
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass, field
+
+from passlib.context import CryptContext
+from sqlalchemy import insert, text, JSON, Table
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncConnection
+
+from app import models
+from app.config import settings
+from app.db import Base
+
+PASSWORD = "benchmark"
+
+# rows per executemany call on drivers without COPY
+CHUNK_SIZE = 10000
+
+# name, latitude, longitude, share of buildings, spread in degrees
+CITIES = [
+    ("Minsk", 53.9023, 27.5619, 0.45, 0.06),
+    ("Homyel", 52.4252, 30.9754, 0.12, 0.04),
+    ("Mahilyow", 53.9007, 30.3314, 0.09, 0.035),
+    ("Vitebsk", 55.1938, 30.2033, 0.09, 0.035),
+    ("Hrodna", 53.6694, 23.8131, 0.09, 0.035),
+    ("Brest", 52.0976, 23.7341, 0.08, 0.03),
+    ("Babruysk", 53.1384, 29.2214, 0.04, 0.025),
+    ("Baranavichy", 53.1327, 26.0139, 0.04, 0.025),
+]
+STREETS = ["Lenina St", "Sovetskaya St", "Nezavisimosti Ave", "Pobediteley Ave", "Gorkogo St",
+           "Kirova St", "Pushkina St", "Mira Ave", "Sadovaya St", "Shkolnaya St", "Molodezhnaya St",
+           "Lesnaya St", "Tsentralnaya St", "Zelenaya St", "Naberezhnaya St", "Oktyabrskaya St"]
+HOUSES_PER_STREET = 200
+
+ORGANIZATION_WORDS = ["Alpha", "Belaya", "Vostok", "Zapad", "Sever", "Yug", "Nord", "Stroy", "Agro",
+                      "Tekh", "Market", "Service", "Trade", "Prom", "Invest", "Logistic", "Med", "Avto"]
+ORGANIZATION_FORMS = ["LLC", "JSC", "PE", "CJSC"]
+ACTIVITY_WORDS = ["Food", "Meat", "Milk", "Bakery", "Cars", "Parts", "Tyres", "Repair", "Clothes",
+                  "Shoes", "Kids", "Sport", "Books", "Music", "Health", "Pharmacy", "Dental", "Beauty",
+                  "Building", "Tools", "Garden", "Furniture", "Electronics", "Phones"]
+
+
+@dataclass
+class Sizes:
+    buildings: int = 1000
+    organizations_per_building: float = 3
+    max_phones: int = 3
+    max_activities: int = 3
+    activity_roots: int = 8
+    activity_branching: int = 5
+    activity_depth: int = 4
+    users: int = 100
+    # share of users with the advanced_user permission
+    advanced_users: float = 0.2
+
+    @classmethod
+    def scaled(cls, scale: float) -> "Sizes":
+        return cls(buildings=int(1000 * scale), users=max(int(100 * scale), 1))
+
+
+@dataclass
+class Dataset:
+    """ Rows per table (dicts in column order) plus samples the load generator builds requests from. """
+    tables: dict[str, list[dict]] = field(default_factory=dict)
+    organization_ids: list[int] = field(default_factory=list)
+    organization_names: list[str] = field(default_factory=list)
+    addresses: list[tuple[str, str, str]] = field(default_factory=list)
+    coordinates: list[tuple[float, float]] = field(default_factory=list)
+    activity_names: list[str] = field(default_factory=list)
+    username: str = "benchmark"
+    password: str = PASSWORD
+
+    def row_count(self) -> int:
+        return sum(len(rows) for rows in self.tables.values())
+
+
+def _buildings(rng: random.Random, sizes: Sizes) -> list[dict]:
+    names, weights = [c[0] for c in CITIES], [c[3] for c in CITIES]
+    cities = {c[0]: c for c in CITIES}
+    next_house: dict[tuple[str, str], int] = {}
+    buildings = []
+    for building_id in range(1, sizes.buildings + 1):
+        city, latitude, longitude, _, spread = cities[rng.choices(names, weights)[0]]
+        # numbered streets once the named ones run out of houses
+        street = rng.choice(STREETS)
+        house = next_house.get((city, street), 1)
+        while house > HOUSES_PER_STREET:
+            street = f"{rng.choice(STREETS)} {rng.randint(2, sizes.buildings // 1000 + 2)}"
+            house = next_house.get((city, street), 1)
+        next_house[(city, street)] = house + 1
+        buildings.append({
+            "id": building_id,
+            "city": city,
+            "street": street,
+            "house": str(house),
+            "latitude": round(rng.gauss(latitude, spread), 6),
+            "longitude": round(rng.gauss(longitude, spread * 1.6), 6),
+        })
+    return buildings
+
+
+def _activities(rng: random.Random, sizes: Sizes) -> list[dict]:
+    activities = []
+    level = []
+    for root in range(sizes.activity_roots):
+        activities.append({"id": len(activities) + 1, "name": f"{ACTIVITY_WORDS[root % len(ACTIVITY_WORDS)]} {root}",
+                           "parent_id": None})
+        level.append(activities[-1])
+    for _ in range(sizes.activity_depth - 1):
+        next_level = []
+        for parent in level:
+            for child in range(rng.randint(1, sizes.activity_branching)):
+                activities.append({"id": len(activities) + 1,
+                                   "name": f"{parent['name']}.{child} {rng.choice(ACTIVITY_WORDS)}",
+                                   "parent_id": parent["id"]})
+                next_level.append(activities[-1])
+        level = next_level
+    return activities
+
+
+def hash_password(password: str = PASSWORD) -> str:
+    return CryptContext(schemes=["bcrypt"]).hash(password)
+
+
+def generate(
+        sizes: Sizes,
+        seed_value: int = 0,
+        hashed_password: str | None = None,
+        sample_size: int = 10000
+) -> Dataset:
+    """ `hashed_password` - shared by every generated user (bcrypt is slow on purpose and salted). """
+    rng = random.Random(seed_value)
+    dataset = Dataset()
+
+    buildings = _buildings(rng, sizes)
+    activities = _activities(rng, sizes)
+    parent_ids = {a["parent_id"] for a in activities}
+    leaves = [a["id"] for a in activities if a["id"] not in parent_ids]
+    activity_ids = [a["id"] for a in activities]
+    activity_names = {a["id"]: a["name"] for a in activities}
+
+    organizations, phones, organization_activities, documents = [], [], [], []
+    organization_count = int(len(buildings) * sizes.organizations_per_building)
+    for organization_id in range(1, organization_count + 1):
+        building = buildings[rng.randrange(len(buildings))]
+        name = (f"{rng.choice(ORGANIZATION_WORDS)}{rng.choice(ORGANIZATION_WORDS).lower()} "
+                f"{rng.choice(ORGANIZATION_FORMS)} {organization_id}")
+        organizations.append({"id": organization_id, "name": name, "building_id": building["id"]})
+
+        organization_phones = []
+        for _ in range(rng.randint(1, sizes.max_phones)):
+            phone = {"id": len(phones) + 1,
+                     "phone_number": f"+375{rng.choice((17, 25, 29, 33, 44))}{len(phones) + 1:07d}",
+                     "organization_id": organization_id}
+            phones.append(phone)
+            organization_phones.append({"id": phone["id"], "phone_number": phone["phone_number"]})
+
+        # mostly leaves, like real catalogues, sometimes an inner node
+        chosen = {rng.choice(leaves) if rng.random() < 0.8 else rng.choice(activity_ids)
+                  for _ in range(rng.randint(1, sizes.max_activities))}
+        for activity_id in sorted(chosen):
+            organization_activities.append({"id": len(organization_activities) + 1,
+                                            "organization_id": organization_id,
+                                            "activity_id": activity_id})
+
+        documents.append({
+            "organization_id": organization_id,
+            "name": name,
+            "building_id": building["id"],
+            "city": building["city"],
+            "street": building["street"],
+            "house": building["house"],
+            "latitude": building["latitude"],
+            "longitude": building["longitude"],
+            "phone_numbers": organization_phones,
+            "activity_ids": sorted(chosen),
+            "search_text": " ".join((name, *(activity_names[i] for i in sorted(chosen)),
+                                     building["city"], building["street"], building["house"])),
+        })
+
+    permissions = [{"id": 1, "name": "basic_user", "details": "basic"},
+                   {"id": 2, "name": "advanced_user", "details": "advanced"}]
+    hashed_password = hashed_password or hash_password()
+    users = [{"id": 1, "username": dataset.username, "hashed_password": hashed_password, "disabled": False}]
+    user_permissions = [{"id": 1, "user_id": 1, "permission_id": 1},
+                        {"id": 2, "user_id": 1, "permission_id": 2}]
+    for user_id in range(2, sizes.users + 1):
+        users.append({"id": user_id, "username": f"user{user_id}", "hashed_password": hashed_password,
+                      "disabled": rng.random() < 0.02})
+        user_permissions.append({"id": len(user_permissions) + 1, "user_id": user_id, "permission_id": 1})
+        if rng.random() < sizes.advanced_users:
+            user_permissions.append({"id": len(user_permissions) + 1, "user_id": user_id, "permission_id": 2})
+
+    dataset.tables = {
+        models.Building.__tablename__: buildings,
+        models.Activity.__tablename__: activities,
+        models.Organization.__tablename__: organizations,
+        models.PhoneNumber.__tablename__: phones,
+        models.OrganizationActivity.__tablename__: organization_activities,
+        models.Permission.__tablename__: permissions,
+        models.User.__tablename__: users,
+        models.UserPermissions.__tablename__: user_permissions,
+        models.OrganizationDocument.__tablename__: documents,
+    }
+
+    sample = rng.sample(organizations, min(sample_size, len(organizations)))
+    dataset.organization_ids = [o["id"] for o in sample]
+    dataset.organization_names = [o["name"] for o in sample]
+    sample = rng.sample(buildings, min(sample_size, len(buildings)))
+    dataset.addresses = [(b["city"], b["street"], b["house"]) for b in sample]
+    # few points, so the geocoder is hit a handful of times and then served from its cache
+    dataset.coordinates = [(b["latitude"], b["longitude"]) for b in sample[:5]]
+    dataset.activity_names = [a["name"] for a in activities]
+    return dataset
+
+
+async def _copy(conn: AsyncConnection, table: Table, rows: list[dict]):
+    columns = list(rows[0])
+    json_columns = {c.name for c in table.columns if isinstance(c.type, JSON)}
+    records = [tuple(json.dumps(row[c]) if c in json_columns else row[c] for c in columns) for row in rows]
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(table.name, records=records, columns=columns)
+
+
+async def load(engine: AsyncEngine, dataset: Dataset):
+    assert settings.MODE == "TEST"
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+        use_copy = engine.dialect.driver == "asyncpg"
+        # parents first
+        for table in Base.metadata.sorted_tables:
+            rows = dataset.tables.get(table.name)
+            if not rows:
+                continue
+            if use_copy:
+                await _copy(conn, table, rows)
+            else:
+                for i in range(0, len(rows), CHUNK_SIZE):
+                    await conn.execute(insert(table), rows[i:i + CHUNK_SIZE])
+
+            if engine.dialect.name == "postgresql" and "id" in table.columns:
+                # ids were explicit, the serial sequence still starts at 1
+                await conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                    f"(SELECT max(id) FROM {table.name}))"))
+        if engine.dialect.name == "postgresql":
+            await conn.execute(text("ANALYZE"))
+
+
+async def seed(engine: AsyncEngine, scale: float = 1, seed_value: int = 0) -> Dataset:
+    dataset = generate(Sizes.scaled(scale), seed_value)
+    await load(engine, dataset)
+    return dataset
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=float, default=1, help="thousands of buildings")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from app.db import async_engine
+
+    start = time.perf_counter()
+    dataset = generate(Sizes.scaled(args.scale), args.seed)
+    generated = time.perf_counter()
+    print(f"generated {dataset.row_count()} rows in {generated - start:.1f}s")
+    await load(async_engine, dataset)
+    print(f"loaded in {time.perf_counter() - generated:.1f}s")
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""
+    Load test of the engine/pool configuration.
+
+    Runs the same read workload against an engine created with SQLAlchemy defaults
+    (the old `create_async_engine(url, echo=True)`) and against `make_engine()`
+    configured from Settings, and prints throughput, latency and pool wait time.
+
+    python -m benchmarks.pool_load --concurrency 64 --requests 5000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+
+from app.config import settings
+from app.db import make_engine, make_autocommit_sessionmaker, pool_stats
+from app.repositories import OrganizationRepository
+
+
+async def run_workload(engine: AsyncEngine, concurrency: int, requests: int) -> dict:
+    sessionmaker = make_autocommit_sessionmaker(engine)
+    latencies = []
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i % 1000 + 1)
+
+    async def worker():
+        while not queue.empty():
+            organization_id = queue.get_nowait()
+            start = time.perf_counter()
+            async with sessionmaker() as session:
+                await OrganizationRepository(session).get_organization_by_id(organization_id)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100)
+    result = {
+        "requests_per_second": requests / elapsed,
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+        "pool": pool_stats(engine),
+    }
+    await engine.dispose()
+    return result
+
+
+async def main(concurrency: int, requests: int):
+    url = settings.DATABASE_URL_asyncpg
+    for name, engine in (("defaults", create_async_engine(url, echo=True)),
+                         ("settings", make_engine(url))):
+        result = await run_workload(engine, concurrency, requests)
+        print(f"{name}: {result['requests_per_second']:.0f} req/s, "
+              f"p50 {result['p50_ms']:.2f} ms, p95 {result['p95_ms']:.2f} ms, "
+              f"p99 {result['p99_ms']:.2f} ms, pool {result['pool']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency, args.requests))
@@ -0,0 +1,223 @@
+"""
+    Load-testing benchmark suite.
+
+    Seeds the test database (MODE=TEST), boots the app with uvicorn in-process and
+    drives every endpoint of organizations_ep and auth_ep at a fixed concurrency.
+    Reports throughput and p50/p95/p99 latency per endpoint, saves them as JSON and
+    compares them with a stored baseline.
+
+    python -m benchmarks.run --scale 10 --concurrency 32 --requests 2000 \
+        --output bench.json --baseline benchmarks/baseline.json
+
+    Exits with 1 when an endpoint's p95 grew or its throughput dropped by more than
+    --tolerance against the baseline. --save-baseline stores the results as the new
+    baseline instead.
+
+    Request parameters are drawn from the whole seeded dataset, so the response cache
+    only helps as much as it would with real traffic. The coordinate search calls the
+    configured geocoder; its results are cached, and the benchmark uses only a few
+    distinct points.
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import statistics
+import sys
+import time
+
+import aiohttp
+import uvicorn
+
+from app.db import async_engine
+from benchmarks.datagen import seed, Dataset
+
+
+def organization_by_id(rng: random.Random, dataset: Dataset):
+    return "GET", "/get_organization_by_id", {"organization_id": rng.choice(dataset.organization_ids)}
+
+
+def organization_by_name(rng: random.Random, dataset: Dataset):
+    return "GET", "/get_organization_by_name", {"name": rng.choice(dataset.organization_names)}
+
+
+def organizations_by_building_address(rng: random.Random, dataset: Dataset):
+    city, street, house = rng.choice(dataset.addresses)
+    return "GET", "/get_organizations_by_building_address", {"city": city, "street": street, "house": house}
+
+
+def organizations_by_activity(rng: random.Random, dataset: Dataset):
+    return "GET", "/get_organizations_by_activity", {"activity": rng.choice(dataset.activity_names)}
+
+
+def organizations_by_subactivities(rng: random.Random, dataset: Dataset):
+    return "GET", "/get_organizations_by_subactivities", {"activity": rng.choice(dataset.activity_names)}
+
+
+def organizations_by_coordinates(rng: random.Random, dataset: Dataset):
+    latitude, longitude = rng.choice(dataset.coordinates)
+    return "GET", "/get_organizations_by_coordinates", {"latitude": latitude, "longitude": longitude, "radius": 1}
+
+
+def users_me(rng: random.Random, dataset: Dataset):
+    return "GET", "/users/me/", {}
+
+
+def token(rng: random.Random, dataset: Dataset):
+    return "POST", "/token/", {"username": dataset.username, "password": dataset.password}
+
+
+SCENARIOS = {
+    "get_organization_by_id": organization_by_id,
+    "get_organization_by_name": organization_by_name,
+    "get_organizations_by_building_address": organizations_by_building_address,
+    "get_organizations_by_activity": organizations_by_activity,
+    "get_organizations_by_subactivities": organizations_by_subactivities,
+    "get_organizations_by_coordinates": organizations_by_coordinates,
+    "users_me": users_me,
+    "token": token,
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def get_token(session: aiohttp.ClientSession, base_url: str, dataset: Dataset) -> str:
+    async with session.post(f"{base_url}/token/",
+                            data={"username": dataset.username, "password": dataset.password}) as response:
+        response.raise_for_status()
+        return (await response.json())["access_token"]
+
+
+async def run_scenario(
+        session: aiohttp.ClientSession,
+        base_url: str,
+        headers: dict,
+        scenario,
+        dataset: Dataset,
+        concurrency: int,
+        requests: int,
+        seed_value: int
+) -> dict:
+    rng = random.Random(seed_value)
+    plan = [scenario(rng, dataset) for _ in range(requests)]
+    latencies = []
+    statuses: dict[str, int] = {}
+
+    async def worker():
+        while plan:
+            method, path, params = plan.pop()
+            start = time.perf_counter()
+            if method == "GET":
+                request = session.get(f"{base_url}{path}", params=params, headers=headers)
+            else:
+                request = session.post(f"{base_url}{path}", data=params)
+            try:
+                async with request as response:
+                    await response.read()
+                status = str(response.status)
+            except aiohttp.ClientError:
+                status = "error"
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "requests_per_second": requests / elapsed,
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+        "statuses": dict(sorted(statuses.items())),
+    }
+
+
+async def run(args) -> dict:
+    dataset = await seed(async_engine, scale=args.scale, seed_value=args.seed)
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config("app.main:app", host="127.0.0.1", port=port,
+                                           log_level="warning", lifespan="on"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    base_url = f"http://127.0.0.1:{port}"
+    results = {}
+    try:
+        connector = aiohttp.TCPConnector(limit=args.concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            headers = {"Authorization": f"Bearer {await get_token(session, base_url, dataset)}"}
+            for name in args.scenarios:
+                results[name] = await run_scenario(session, base_url, headers, SCENARIOS[name], dataset,
+                                                   args.concurrency, args.requests, args.seed)
+                print(f"{name}: {results[name]['requests_per_second']:.0f} req/s, "
+                      f"p50 {results[name]['p50_ms']:.1f} ms, p95 {results[name]['p95_ms']:.1f} ms, "
+                      f"p99 {results[name]['p99_ms']:.1f} ms, statuses {results[name]['statuses']}")
+    finally:
+        server.should_exit = True
+        await serving
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+        if result["requests_per_second"] < base["requests_per_second"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['requests_per_second']:.0f} -> "
+                               f"{result['requests_per_second']:.0f} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=float, default=1, help="thousands of buildings")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=1000, help="per endpoint")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--output", help="where to save the results as JSON")
+    parser.add_argument("--baseline", default="benchmarks/baseline.json")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative p95 growth / throughput drop")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        return
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one.")
+        return
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
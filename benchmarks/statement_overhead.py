@@ -0,0 +1,60 @@
+"""
+    Microbenchmark of the Python-side cost of issuing a repository query.
+
+    "inline" builds the select(...).options(joinedload(...)).filter(...) construct on
+    every call, like the repositories used to; "prebuilt" reuses the module-level
+    statement from app.repositories. Both then go through the cache key generation
+    SQLAlchemy performs on every execution to find the compiled form.
+
+    python -m benchmarks.statement_overhead --number 20000
+"""
+import argparse
+import timeit
+
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+from app import models
+from app.repositories import ORGANIZATION_BY_ID, ORGANIZATIONS_BY_BUILDING_ADDRESS
+
+
+def inline_by_id(organization_id=1):
+    query = (
+        select(models.Organization)
+        .options(joinedload(models.Organization.phone_numbers))
+        .options(joinedload(models.Organization.building))
+        .filter(models.Organization.id == organization_id)
+    )
+    return query._generate_cache_key()
+
+
+def prebuilt_by_id():
+    return ORGANIZATION_BY_ID._generate_cache_key()
+
+
+def inline_by_address(city="Minsk", street="Nezavisimosti Ave", house="1"):
+    query = (select(models.Organization)
+             .options(joinedload(models.Organization.phone_numbers))
+             .options(joinedload(models.Organization.building))
+             .filter((models.Building.city == city) &
+                     (models.Building.street == street) &
+                     (models.Building.house == house)))
+    return query._generate_cache_key()
+
+
+def prebuilt_by_address():
+    return ORGANIZATIONS_BY_BUILDING_ADDRESS._generate_cache_key()
+
+
+def main(number: int):
+    for name, before, after in (("get_organization_by_id", inline_by_id, prebuilt_by_id),
+                                ("get_organizations_by_building_address", inline_by_address, prebuilt_by_address)):
+        before_us = min(timeit.repeat(before, number=number, repeat=5)) / number * 1e6
+        after_us = min(timeit.repeat(after, number=number, repeat=5)) / number * 1e6
+        print(f"{name}: inline {before_us:.1f} us/query, prebuilt {after_us:.2f} us/query")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20000)
+    main(parser.parse_args().number)
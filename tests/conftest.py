@@ -9,6 +9,7 @@ import pytest_asyncio
 
 from sqlalchemy.sql.ddl import DropTable
 
+from app.cache import cache, MemoryBackend
 from app.config import settings
 from app.db import AsyncSessionLocal, Base, async_engine
 
@@ -23,6 +24,9 @@ from app.db import AsyncSessionLocal, Base, async_engine
 @pytest_asyncio.fixture(scope="function", autouse=True)
 async def setup_db():
     assert settings.MODE == "TEST"
+    # every test starts with an empty cache
+    cache.backend = MemoryBackend()
+    cache.clear_local()
     async with AsyncSessionLocal() as session:
         async with session.begin():
             for table in reversed(Base.metadata.sorted_tables):
@@ -0,0 +1,121 @@
+import pytest
+from sqlalchemy import select
+
+from app import models, schemas
+from app.activity_index import ActivityIndex, bitset_ids, to_bitset
+from app.config import settings
+from app.read_model import mark_dirty
+from app.services import ACTIVITIES_TAG, OrganizationService, activity_index, invalidate_organizations
+from app.uow import unit_of_work
+
+# Eat -> Milk, Meat -> Sausages; Drink separate
+TREE = [schemas.ActivityNode(id=1, name="Eat", parent_id=None),
+        schemas.ActivityNode(id=2, name="Milk", parent_id=1),
+        schemas.ActivityNode(id=3, name="Meat", parent_id=1),
+        schemas.ActivityNode(id=4, name="Sausages", parent_id=3),
+        schemas.ActivityNode(id=5, name="Drink", parent_id=None),
+        schemas.ActivityNode(id=6, name="Milk", parent_id=5)]
+# (organization id, activity id)
+PAIRS = [(1, 1), (2, 2), (3, 4), (3, 5), (900, 6), (901, 4)]
+
+
+class TestBitsets:
+    def test_round_trip(self):
+        ids = [0, 1, 7, 8, 63, 64, 1000]
+        assert bitset_ids(to_bitset(ids, max(ids))) == ids
+
+    def test_offset_and_limit(self):
+        bits = to_bitset(range(0, 100, 3), 100)
+        assert bitset_ids(bits, offset=2, limit=3) == [6, 9, 12]
+        assert bitset_ids(bits, offset=40) == []
+        assert bitset_ids(0) == []
+
+
+class TestActivityIndex:
+    index = ActivityIndex(TREE, PAIRS)
+
+    def test_subtree_includes_descendants(self):
+        assert bitset_ids(self.index.subtree("Eat")) == [1, 2, 3, 901]
+        assert bitset_ids(self.index.subtree("Meat")) == [3, 901]
+        assert bitset_ids(self.index.subtree("Sausages")) == [3, 901]
+        assert bitset_ids(self.index.subtree("Unknown")) == []
+
+    def test_repeated_names_are_merged(self):
+        assert bitset_ids(self.index.subtree("Milk")) == [2, 900]
+        assert bitset_ids(self.index.subtree("Drink")) == [3, 900]
+
+    def test_match(self):
+        assert bitset_ids(self.index.match(all_of=["Eat", "Drink"])) == [3]
+        assert bitset_ids(self.index.match(any_of=["Milk", "Meat"])) == [2, 3, 900, 901]
+        assert bitset_ids(self.index.match(all_of=["Eat"], any_of=["Milk", "Drink"])) == [2, 3]
+        assert bitset_ids(self.index.match()) == []
+
+
+@pytest.mark.usefixtures("empty_buildings", "fill_buildings")
+class TestOrganizationsByActivities:
+    @pytest.fixture(autouse=True, params=["index", "sql"])
+    def index_or_sql(self, request, monkeypatch):
+        if request.param == "sql":
+            monkeypatch.setattr(settings, "ACTIVITY_INDEX_MAX_MB", 0)
+        activity_index.invalidate()
+        yield
+        activity_index.invalidate()
+
+    @pytest.mark.asyncio
+    async def test_subtrees(self):
+        service = OrganizationService()
+        page = await service.get_organizations_by_activities(any_of=["Eat"])
+        assert [o.name for o in page.items] == ["Org 1", "Org 2"]
+        assert page.total == 2
+        assert page.items == await service.get_organizations_by_subactivities("Eat")
+        page = await service.get_organizations_by_activities(all_of=["Eat", "Milk"])
+        assert [o.name for o in page.items] == ["Org 2"]
+        page = await service.get_organizations_by_activities(any_of=["Meat", "Sausages"])
+        assert page.items == [] and page.total == 0
+
+    @pytest.mark.asyncio
+    async def test_deep_subtrees(self):
+        # Eat -> Meat -> Sausages -> Level 3 -> ... -> Level 6, Org 3 at the bottom
+        async with unit_of_work() as uow:
+            session = uow.session
+            parent_id = (await session.execute(select(models.Activity.id).filter_by(name="Sausages"))).scalar_one()
+            for level in range(3, 7):
+                activity = models.Activity(name=f"Level {level}", parent_id=parent_id)
+                session.add(activity)
+                await session.flush()
+                parent_id = activity.id
+            org3 = (await session.execute(select(models.Organization.id).filter_by(name="Org 3"))).scalar_one()
+            session.add(models.OrganizationActivity(organization_id=org3, activity_id=parent_id))
+            mark_dirty(session, [org3])
+        await invalidate_organizations([org3], ACTIVITIES_TAG)
+
+        service = OrganizationService()
+        page = await service.get_organizations_by_activities(any_of=["Eat"])
+        assert [o.name for o in page.items] == ["Org 1", "Org 2", "Org 3"]
+        assert [o.name for o in (await service.get_organizations_by_activities(all_of=["Meat"])).items] == ["Org 3"]
+        assert await service.get_organizations_by_subactivities("Eat") == page.items
+        assert [o async for o in await service.stream_organizations_by_subactivities("Eat")] == page.items
+
+    @pytest.mark.asyncio
+    async def test_pages(self):
+        page = await OrganizationService().get_organizations_by_activities(any_of=["Eat"], offset=1, limit=1)
+        assert [o.name for o in page.items] == ["Org 2"]
+        assert page.total == 2
+
+    @pytest.mark.asyncio
+    async def test_rebuilt_after_writes(self):
+        service = OrganizationService()
+        organization = (await service.get_organizations_by_activities(any_of=["Milk"])).items[0]
+        await service.update_organizations([schemas.OrganizationUpdate(id=organization.id, activity_ids=[])])
+        assert (await service.get_organizations_by_activities(any_of=["Milk"])).total == 0
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("any_of, all_of, limit", [
+        ([], [], 10),
+        (["Eat"], [""], 10),
+        (["Eat"], [], 0),
+        ([str(i) for i in range(11)], [], 10),
+    ])
+    async def test_invalid(self, any_of, all_of, limit):
+        with pytest.raises(ValueError):
+            await OrganizationService().get_organizations_by_activities(any_of, all_of, limit=limit)
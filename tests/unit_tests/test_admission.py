@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from app.admission import ConcurrencyLimiter, Overloaded
+
+
+async def hold(limiter: ConcurrencyLimiter, seconds: float):
+    await limiter.acquire()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        limiter.observe(seconds)
+        limiter.release()
+
+
+class TestConcurrencyLimiter:
+    @pytest.mark.asyncio
+    async def test_queued_requests_are_admitted(self):
+        limiter = ConcurrencyLimiter("test", max_concurrency=2, max_queue=2, max_wait=1)
+
+        results = await asyncio.gather(*(hold(limiter, 0.01) for _ in range(4)))
+
+        assert results == [None] * 4
+        assert limiter.admitted == 4
+        assert limiter.active == 0
+
+    @pytest.mark.asyncio
+    async def test_full_queue_is_rejected(self):
+        limiter = ConcurrencyLimiter("test", max_concurrency=1, max_queue=1, max_wait=1)
+
+        results = await asyncio.gather(*(hold(limiter, 0.01) for _ in range(3)),
+                                       return_exceptions=True)
+
+        assert isinstance(results[2], Overloaded)
+        assert limiter.rejected_queue_full == 1
+        assert limiter.active == 0
+
+    @pytest.mark.asyncio
+    async def test_rejected_when_expected_wait_exceeds_deadline(self):
+        limiter = ConcurrencyLimiter("test", max_concurrency=1, max_queue=10, max_wait=0.5)
+        limiter.avg_service_time = 1.0
+
+        results = await asyncio.gather(*(hold(limiter, 0.01) for _ in range(2)),
+                                       return_exceptions=True)
+
+        assert isinstance(results[1], Overloaded)
+        assert limiter.rejected_deadline == 1
+
+    @pytest.mark.asyncio
+    async def test_wait_times_out(self):
+        limiter = ConcurrencyLimiter("test", max_concurrency=1, max_queue=10, max_wait=0.05)
+
+        results = await asyncio.gather(hold(limiter, 0.2), hold(limiter, 0.01),
+                                       return_exceptions=True)
+
+        assert isinstance(results[1], Overloaded)
+        assert limiter.timed_out == 1
+        assert limiter.active == 0
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from app.bulk_import import BulkImporter, read_ndjson, read_csv, IMPORT_RECORD_ADAPTER, OrganizationRecord
+from app.services import OrganizationService
+
+RECORDS = [
+    {"kind": "building", "city": "Minsk", "street": "Lenina St", "house": "1",
+     "latitude": 53.9023, "longitude": 27.5619},
+    {"kind": "organization", "name": "Org 1", "city": "Minsk", "street": "Lenina St", "house": "1",
+     "phones": ["111", "222"], "activities": ["Eat/Meat"]},
+    {"kind": "organization", "name": "Org 2", "city": "Minsk", "street": "Lenina St", "house": "1",
+     "phones": ["222"]},
+]
+
+
+class TestReaders:
+    def test_ndjson_reports_invalid_lines(self):
+        rows = list(read_ndjson(['{"kind": "activity", "path": "Eat"}', "", "{oops"]))
+        assert rows[0] == (1, {"kind": "activity", "path": "Eat"})
+        assert rows[1][0] == 3
+        assert rows[1][1].startswith("invalid JSON")
+
+    def test_csv_lists_and_empty_cells(self):
+        lines = ["kind,name,city,street,house,phones,activities,latitude\n",
+                 "organization,Org 1,Minsk,Lenina St,1,111;222,Eat/Meat;Eat/Milk,\n"]
+        number, row = next(read_csv(lines))
+        record = IMPORT_RECORD_ADAPTER.validate_python(row)
+        assert number == 2
+        assert isinstance(record, OrganizationRecord)
+        assert record.phones == ["+375111", "+375222"]
+        assert record.activities == ["Eat/Meat", "Eat/Milk"]
+
+
+@pytest.mark.usefixtures("empty_buildings")
+class TestBulkImporter:
+    @pytest.mark.asyncio
+    async def test_import_is_idempotent(self):
+        lines = [json.dumps(record) for record in RECORDS]
+        await BulkImporter().run(read_ndjson(lines))
+        stats = await BulkImporter(batch_size=1).run(read_ndjson(lines))
+
+        assert stats.invalid == 0
+        organizations = await OrganizationService().get_organizations_by_building_address(
+            "Minsk", "Lenina St", "1")
+        phones = {o.name: [p.phone_number for p in o.phone_numbers] for o in organizations}
+        # the phone belongs to the last organization that listed it
+        assert phones == {"Org 1": ["+375111"], "Org 2": ["+375222"]}
+        assert [o.name for o in await OrganizationService().get_organizations_by_subactivities("Eat")] == ["Org 1"]
+
+    @pytest.mark.asyncio
+    async def test_invalid_records_are_skipped(self):
+        lines = ['{"kind": "building", "city": "Minsk"}', json.dumps(RECORDS[0])]
+        stats = await BulkImporter().run(read_ndjson(lines))
+        assert stats.invalid == 1
+        assert stats.errors[0][0] == 1
+        assert stats.buildings == 1
+
+    @pytest.mark.asyncio
+    async def test_too_many_invalid_records(self):
+        with pytest.raises(RuntimeError):
+            await BulkImporter(max_errors=0).run(read_ndjson(["{}"]))
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+from pydantic import TypeAdapter
+
+from app.cache import TwoTierCache, MemoryBackend, SQLiteBackend
+
+INT_ADAPTER = TypeAdapter(int)
+
+
+class Loader:
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    return SQLiteBackend(str(tmp_path / "cache.sqlite3"))
+
+
+class TestTwoTierCache:
+    @pytest.mark.asyncio
+    async def test_second_lookup_is_served_from_l1(self, backend):
+        cache = TwoTierCache(backend)
+        loader = Loader(42)
+
+        assert await cache.get_or_load("key", loader, INT_ADAPTER, tags=["org:1"]) == 42
+        assert await cache.get_or_load("key", loader, INT_ADAPTER, tags=["org:1"]) == 42
+
+        assert loader.calls == 1
+        assert cache.hits_l1 == 1
+
+    @pytest.mark.asyncio
+    async def test_other_worker_is_served_from_l2(self, backend):
+        worker1, worker2 = TwoTierCache(backend), TwoTierCache(backend)
+        loader = Loader(42)
+
+        await worker1.get_or_load("key", loader, INT_ADAPTER, tags=["org:1"])
+        assert await worker2.get_or_load("key", loader, INT_ADAPTER, tags=["org:1"]) == 42
+
+        assert loader.calls == 1
+        assert worker2.hits_l2 == 1
+
+    @pytest.mark.asyncio
+    async def test_tag_invalidation_reaches_other_workers(self, backend):
+        worker1 = TwoTierCache(backend, tag_check_interval=0)
+        worker2 = TwoTierCache(backend, tag_check_interval=0)
+        loader = Loader(42)
+        await worker1.get_or_load("key", loader, INT_ADAPTER, tags=["org:1"])
+        await worker2.get_or_load("key", loader, INT_ADAPTER, tags=["org:1"])
+
+        await worker1.invalidate(["org:1"])
+        loader.value = 43
+
+        assert await worker2.get_or_load("key", loader, INT_ADAPTER, tags=["org:1"]) == 43
+        assert loader.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_other_tags_stay_valid(self, backend):
+        cache = TwoTierCache(backend)
+        loader = Loader(42)
+        await cache.get_or_load("key", loader, INT_ADAPTER, tags=["org:1"])
+
+        await cache.invalidate(["org:2"])
+        await cache.get_or_load("key", loader, INT_ADAPTER, tags=["org:1"])
+
+        assert loader.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_none_is_not_cached(self, backend):
+        cache = TwoTierCache(backend)
+        loader = Loader(None)
+
+        await cache.get_or_load("key", loader, INT_ADAPTER)
+        await cache.get_or_load("key", loader, INT_ADAPTER)
+
+        assert loader.calls == 2
+
+
+class TestMemoryBackend:
+    @pytest.mark.asyncio
+    async def test_least_recently_used_is_evicted(self):
+        backend = MemoryBackend(max_size=2)
+        await backend.set("a", b"1", None)
+        await backend.set("b", b"2", None)
+        await backend.get("a")
+
+        await backend.set("c", b"3", None)
+
+        assert await backend.get("a") == b"1"
+        assert await backend.get("b") is None
+        assert await backend.get("c") == b"3"
+
+    @pytest.mark.asyncio
+    async def test_expired_entries_are_swept(self):
+        backend = MemoryBackend(sweep_interval=0)
+        await backend.set("a", b"1", 0.001)
+        await asyncio.sleep(0.01)
+
+        await backend.set("b", b"2", None)
+
+        assert list(backend.entries) == ["b"]
@@ -0,0 +1,55 @@
+from benchmarks.datagen import generate, Sizes, CITIES
+
+# generate() would bcrypt the password, which is slow and salted
+HASH = "hash"
+
+
+class TestGenerate:
+    def test_same_seed_same_rows(self):
+        assert generate(Sizes(buildings=200), 7, HASH).tables == generate(Sizes(buildings=200), 7, HASH).tables
+
+    def test_buildings_are_clustered_around_cities(self):
+        dataset = generate(Sizes(buildings=2000), hashed_password=HASH)
+        centres = {name: (latitude, longitude) for name, latitude, longitude, _, _ in CITIES}
+        for building in dataset.tables["buildings"]:
+            latitude, longitude = centres[building["city"]]
+            assert abs(building["latitude"] - latitude) < 0.5
+            assert abs(building["longitude"] - longitude) < 0.8
+        minsk = sum(b["city"] == "Minsk" for b in dataset.tables["buildings"])
+        assert 0.35 < minsk / 2000 < 0.55
+
+    def test_addresses_are_unique(self):
+        buildings = generate(Sizes(buildings=5000), hashed_password=HASH).tables["buildings"]
+        assert len({(b["city"], b["street"], b["house"]) for b in buildings}) == len(buildings)
+
+    def test_activity_tree_depth(self):
+        activities = generate(Sizes(buildings=10, activity_depth=5), hashed_password=HASH).tables["activities"]
+        parents = {a["id"]: a["parent_id"] for a in activities}
+
+        def depth(activity_id):
+            return 1 if parents[activity_id] is None else depth(parents[activity_id]) + 1
+
+        assert max(depth(activity_id) for activity_id in parents) == 5
+
+    def test_documents_match_rows(self):
+        tables = generate(Sizes(buildings=100), hashed_password=HASH).tables
+        phones = {}
+        for phone in tables["phone_numbers"]:
+            phones.setdefault(phone["organization_id"], []).append(
+                {"id": phone["id"], "phone_number": phone["phone_number"]})
+        activities = {}
+        for row in tables["organization_activities"]:
+            activities.setdefault(row["organization_id"], []).append(row["activity_id"])
+
+        assert len(tables["organization_documents"]) == len(tables["organizations"])
+        for document in tables["organization_documents"]:
+            assert document["phone_numbers"] == phones[document["organization_id"]]
+            assert document["activity_ids"] == sorted(activities[document["organization_id"]])
+
+    def test_users_have_permissions(self):
+        tables = generate(Sizes(buildings=10, users=50), hashed_password=HASH).tables
+        granted = {}
+        for row in tables["user_permissions"]:
+            granted.setdefault(row["user_id"], set()).add(row["permission_id"])
+        assert granted[1] == {1, 2}
+        assert all(1 in granted[user["id"]] for user in tables["users"])
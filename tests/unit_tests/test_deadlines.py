@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from geopy.exc import GeocoderRateLimited, GeocoderServiceError, GeocoderTimedOut, GeocoderUnavailable
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from app import schemas
+from app.api.api_v1.endpoints import organizations_ep
+from app.deadlines import DeadlineExceeded, check_deadline, current_deadline, time_left
+from app.dependencies import get_advanced_user, get_basic_user
+from app.middleware import DeadlineMiddleware, deadline_exceeded_handler
+from app.services import BuildingService
+from app.uow import unit_of_work
+
+cancelled = []
+
+
+async def slow_endpoint(request):
+    try:
+        await asyncio.sleep(10)
+    except asyncio.CancelledError:
+        cancelled.append(request.url.path)
+        raise
+    return PlainTextResponse("too late")
+
+
+async def deadline_endpoint(request):
+    return PlainTextResponse(f"{time_left():.1f}")
+
+
+def make_app():
+    app = Starlette(routes=[Route("/slow", slow_endpoint), Route("/deadline", deadline_endpoint)])
+    return DeadlineMiddleware(app, deadlines={"/slow": 0.05, "/deadline": 5})
+
+
+async def call(app, path: str, disconnect_after: float | None = None, query_string: bytes = b"") -> list[dict]:
+    """ Calls the ASGI app, returns the messages it sent. """
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": query_string, "root_path": "",
+             "headers": []}
+    body_sent = False
+    sent = []
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # like a server: nothing more until the client goes away
+        await asyncio.sleep(disconnect_after if disconnect_after is not None else 3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent
+
+
+class TestDeadlineMiddleware:
+    @pytest.mark.asyncio
+    async def test_deadline_cancels_the_request(self):
+        cancelled.clear()
+        sent = await asyncio.wait_for(call(make_app(), "/slow"), 1)
+        assert sent[0]["status"] == 504
+        assert cancelled == ["/slow"]
+
+    @pytest.mark.asyncio
+    async def test_disconnect_cancels_the_request(self):
+        app = DeadlineMiddleware(Starlette(routes=[Route("/slow", slow_endpoint)]), deadlines={"/slow": 5})
+        cancelled.clear()
+        sent = await asyncio.wait_for(call(app, "/slow", disconnect_after=0.01), 1)
+        assert sent == []
+        assert cancelled == ["/slow"]
+
+    @pytest.mark.asyncio
+    async def test_deadline_is_visible_to_the_app(self):
+        sent = await call(make_app(), "/deadline")
+        assert sent[0]["status"] == 200
+        assert sent[1]["body"] == b"5.0"
+
+
+class TestUnitOfWorkDeadline:
+    @pytest.mark.asyncio
+    async def test_no_work_past_the_deadline(self):
+        token = current_deadline.set(asyncio.get_running_loop().time() - 1)
+        try:
+            with pytest.raises(DeadlineExceeded):
+                check_deadline()
+            with pytest.raises(DeadlineExceeded):
+                async with unit_of_work(read_only=True):
+                    pass
+        finally:
+            current_deadline.reset(token)
+
+
+class TestEndpointDeadline:
+    @pytest.mark.asyncio
+    async def test_504_when_the_deadline_passes_before_the_unit_of_work(self):
+        app = FastAPI()
+        app.include_router(organizations_ep.router)
+        app.add_exception_handler(DeadlineExceeded, deadline_exceeded_handler)
+        app.dependency_overrides[get_basic_user] = lambda: schemas.User(username="user", permissions=[])
+
+        async def past_deadline(scope, receive, send):
+            token = current_deadline.set(asyncio.get_running_loop().time() - 1)
+            try:
+                await app(scope, receive, send)
+            finally:
+                current_deadline.reset(token)
+
+        sent = await call(past_deadline, "/get_organizations_by_activity", query_string=b"activity=Eat")
+        assert sent[0]["status"] == 504
+        assert sent[1]["body"] == b'{"detail":"Request deadline exceeded"}'
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("error, status", [
+        (GeocoderTimedOut("timed out"), 504),
+        (GeocoderUnavailable("down"), 503),
+        (GeocoderRateLimited("slow down"), 503),
+        (GeocoderServiceError("bad answer"), 502),
+        (ValueError("Invalid coordinates"), 400),
+        (DeadlineExceeded("Request deadline exceeded"), 504),
+    ])
+    async def test_geocoder_errors(self, error, status):
+        class FailingBuildingService:
+            async def get_buildings_with_organizations_by_coordinates(self, *args):
+                raise error
+
+        app = FastAPI()
+        app.include_router(organizations_ep.router)
+        app.add_exception_handler(DeadlineExceeded, deadline_exceeded_handler)
+        app.dependency_overrides[get_advanced_user] = lambda: schemas.User(username="user", permissions=[])
+        app.dependency_overrides[BuildingService] = FailingBuildingService
+
+        sent = await call(app, "/get_organizations_by_coordinates",
+                          query_string=b"latitude=53.9&longitude=27.5&radius=1")
+        assert sent[0]["status"] == status
@@ -0,0 +1,36 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+from app.export import export_documents
+
+
+async def collect(**kwargs) -> bytes:
+    return b"".join([chunk async for chunk in export_documents(**kwargs)])
+
+
+@pytest.mark.usefixtures("empty_buildings", "fill_buildings")
+class TestExport:
+    @pytest.mark.asyncio
+    async def test_ndjson(self):
+        documents = [json.loads(line) for line in (await collect(batch_size=2)).decode().splitlines()]
+        assert [d["name"] for d in documents] == ["Org 1", "Org 2", "Org 3"]
+        assert documents[0]["city"] == "Minsk"
+        assert documents[0]["phone_numbers"][0]["phone_number"] == "+375123456789"
+        assert len(documents[0]["activity_ids"]) == 1
+
+    @pytest.mark.asyncio
+    async def test_gzip_csv(self):
+        data = gzip.decompress(await collect(file_format="csv", compression="gzip"))
+        rows = list(csv.DictReader(io.StringIO(data.decode())))
+        assert [row["name"] for row in rows] == ["Org 1", "Org 2", "Org 3"]
+        assert rows[1]["phone_numbers"] == "+375987654321"
+        assert rows[2]["activity_ids"] == ""
+
+    @pytest.mark.asyncio
+    async def test_unknown_format(self):
+        with pytest.raises(ValueError):
+            await collect(file_format="xml")
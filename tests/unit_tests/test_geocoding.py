@@ -0,0 +1,102 @@
+import asyncio
+import json
+import time
+
+import pytest
+from geopy.exc import GeocoderQueryError, GeocoderTimedOut
+
+from app.bulk_import import BulkImporter, read_ndjson
+from app.geocoding import Geocoder, RateLimiter, StaticBackend, address_query
+from app.uow import unit_of_work
+
+ADDRESS = ("Minsk", "Lenina St", "1")
+QUERY = address_query(ADDRESS)
+
+
+class TestRateLimiter:
+    @pytest.mark.asyncio
+    async def test_spaces_acquisitions(self):
+        limiter = RateLimiter(rate=50)
+        start = time.monotonic()
+        for _ in range(6):
+            await limiter.acquire()
+        # the first one is free, 5 more at 50 per second
+        assert time.monotonic() - start >= 0.09
+
+    @pytest.mark.asyncio
+    async def test_pause_isnt_refilled_from_before_it(self):
+        limiter = RateLimiter(rate=10)
+        await limiter.acquire()
+        await asyncio.sleep(0.3)
+        limiter.pause(0.2)
+        start = time.monotonic()
+        await limiter.acquire()
+        assert time.monotonic() - start >= 0.25
+
+
+class TestGeocoder:
+    @pytest.mark.asyncio
+    async def test_results_are_cached(self):
+        backend = StaticBackend({QUERY: (53.9, 27.5)})
+        async with Geocoder(backend, rate=1000) as geocoder:
+            first = await geocoder.geocode_many([ADDRESS, ADDRESS, ("Minsk", "Nowhere", "0")])
+            second = await geocoder.geocode_many([ADDRESS, ("Minsk", "Nowhere", "0")])
+
+        assert first == second == {ADDRESS: (53.9, 27.5), ("Minsk", "Nowhere", "0"): None}
+        assert len(backend.queries) == 2
+        assert geocoder.stats.cached == 2
+
+    @pytest.mark.asyncio
+    async def test_expired_results_are_asked_again(self):
+        backend = StaticBackend({QUERY: (53.9, 27.5)})
+        async with Geocoder(backend, rate=1000) as geocoder:
+            await geocoder.geocode_many([ADDRESS, ("Minsk", "Nowhere", "0")])
+        nowhere = address_query(("Minsk", "Nowhere", "0"))
+
+        assert await Geocoder.load_cached({QUERY, nowhere}, result_ttl=3600, not_found_ttl=0) == {
+            QUERY: (53.9, 27.5)}
+        assert await Geocoder.load_cached({QUERY, nowhere}, result_ttl=0, not_found_ttl=3600) == {
+            nowhere: None}
+
+    @pytest.mark.asyncio
+    async def test_retries_and_gives_up(self):
+        backend = StaticBackend({QUERY: (53.9, 27.5)}, failures=[GeocoderTimedOut()])
+        async with Geocoder(backend, rate=1000, backoff=0) as geocoder:
+            assert await geocoder.geocode_many([ADDRESS]) == {ADDRESS: (53.9, 27.5)}
+            # a bad query isn't retried
+            backend.failures = [GeocoderQueryError()]
+            assert await geocoder.geocode_many([("Minsk", "Lenina St", "2")]) == {}
+        assert geocoder.stats.retries == 1
+        assert geocoder.stats.failed == 1
+
+
+    @pytest.mark.asyncio
+    async def test_fetched_results_survive_an_aborted_run(self):
+        class Failing(StaticBackend):
+            async def geocode(self, query):
+                if query.startswith("zbroken"):
+                    raise RuntimeError("bug")
+                if query.startswith("unreachable"):
+                    raise OSError("connection reset")
+                return await super().geocode(query)
+
+        addresses = [ADDRESS, ("Minsk", "unreachable", "1"), ("Minsk", "zbroken", "1")]
+        async with Geocoder(Failing({QUERY: (53.9, 27.5)}), rate=1000, concurrency=1) as geocoder:
+            with pytest.raises(RuntimeError):
+                await geocoder.geocode_many(addresses)
+        assert geocoder.stats.failed == 1
+        assert await Geocoder.load_cached({QUERY}) == {QUERY: (53.9, 27.5)}
+
+
+class TestImportGeocoding:
+    @pytest.mark.asyncio
+    async def test_buildings_without_coordinates_are_geocoded(self):
+        lines = [json.dumps({"kind": "building", "city": city, "street": street, "house": house})
+                 for city, street, house in (ADDRESS, ("Minsk", "Nowhere", "0"))]
+        async with Geocoder(StaticBackend({QUERY: (53.9, 27.5)}), rate=1000) as geocoder:
+            stats = await BulkImporter(geocoder=geocoder).run(read_ndjson(lines))
+
+        assert stats.invalid == 1
+        async with unit_of_work(read_only=True) as uow:
+            buildings = await uow.building_repository.get_buildings_by_city("Minsk")
+        assert [(b.house, b.latitude) for b in buildings] == [("1", 53.9)]
@@ -0,0 +1,90 @@
+import pytest
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from app import schemas
+from app.api.api_v1.endpoints import ingest_ep
+from app.services import OrganizationService, BuildingService
+
+
+@pytest.mark.usefixtures("fill_buildings")
+class TestOrganizationWrites:
+    @pytest.mark.asyncio
+    async def test_create_moves_phones_and_refreshes_cached_reads(self):
+        service = OrganizationService()
+        org1 = await service.get_organization_by_name("Org 1")
+        org2 = await service.get_organization_by_name("Org 2")
+        # warm the cache
+        assert [p.phone_number for p in (await service.get_organization_by_id(org2.id)).phone_numbers] == ["+375987654321"]
+
+        building_id = (await BuildingService().create_buildings([schemas.BuildingCreate(
+            city="Minsk", street="Nezavisimosti Ave", house="1", latitude=53.9023, longitude=27.5619)]))[0].id
+        created = await service.create_organizations([
+            schemas.OrganizationCreate(name="Org 4", building_id=building_id, phone_numbers=["987654321", "555"]),
+            schemas.OrganizationCreate(name="Org 1", building_id=building_id, phone_numbers=["123456789"]),
+        ])
+
+        assert [o.id for o in created][0] == org1.id
+        assert {p.phone_number for p in created[1].phone_numbers} == {"+375987654321", "+375555"}
+        assert (await service.get_organization_by_id(org2.id)).phone_numbers == []
+
+    @pytest.mark.asyncio
+    async def test_update_replaces_given_lists_only(self):
+        service = OrganizationService()
+        org1 = await service.get_organization_by_name("Org 1")
+        updated = await service.update_organizations([
+            schemas.OrganizationUpdate(id=org1.id, name="Org 1 Renamed", phone_numbers=["777"]),
+            schemas.OrganizationUpdate(id=-1, name="Missing"),
+        ])
+
+        assert updated == [org1.id]
+        organization = await service.get_organization_by_id(org1.id)
+        assert organization.name == "Org 1 Renamed"
+        assert [p.phone_number for p in organization.phone_numbers] == ["+375777"]
+        # activities weren't given - kept
+        assert "Org 1 Renamed" in [o.name for o in await service.get_organizations_by_subactivities("Eat")]
+
+    @pytest.mark.asyncio
+    async def test_delete(self):
+        service = OrganizationService()
+        org3 = await service.get_organization_by_name("Org 3")
+        assert await service.delete_organizations([org3.id, -1]) == [org3.id]
+        assert await service.get_organizations_by_ids([org3.id]) == []
+
+    @pytest.mark.asyncio
+    async def test_unknown_building_fails_the_batch(self):
+        with pytest.raises(ValueError):
+            await OrganizationService().create_organizations([
+                schemas.OrganizationCreate(name="Org 5", building_id=-1)])
+
+
+@pytest.mark.usefixtures("fill_buildings")
+class TestBuildingWrites:
+    @pytest.mark.asyncio
+    async def test_buildings_with_organizations_are_not_deleted(self):
+        service = BuildingService()
+        building = (await service.create_buildings([schemas.BuildingCreate(
+            city="Minsk", street="Nezavisimosti Ave", house="1", latitude=53.9, longitude=27.5)]))[0]
+        assert building.latitude == 53.9
+
+        with pytest.raises(ValueError):
+            await service.delete_buildings([building.id])
+        empty = (await service.create_buildings([schemas.BuildingCreate(
+            city="Minsk", street="Nezavisimosti Ave", house="2", latitude=53.9, longitude=27.5)]))[0]
+        assert await service.update_buildings([schemas.BuildingUpdate(id=empty.id, house="2a")]) == [empty.id]
+        assert await service.delete_buildings([empty.id]) == [empty.id]
+
+    @pytest.mark.asyncio
+    async def test_taken_address_is_a_conflict(self):
+        service = BuildingService()
+        empty = (await service.create_buildings([schemas.BuildingCreate(
+            city="Minsk", street="Nezavisimosti Ave", house="2", latitude=53.9, longitude=27.5)]))[0]
+        with pytest.raises(HTTPException) as error:
+            await ingest_ep.update_buildings([schemas.BuildingUpdate(id=empty.id, house="1")], service)
+        assert error.value.status_code == 409
+
+    @pytest.mark.parametrize("field", ["city", "street", "house", "latitude", "longitude"])
+    def test_fields_can_be_omitted_but_not_null(self, field):
+        assert schemas.BuildingUpdate(id=1).model_dump(exclude_unset=True) == {"id": 1}
+        with pytest.raises(ValidationError):
+            schemas.BuildingUpdate(id=1, **{field: None})
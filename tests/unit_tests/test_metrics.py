@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from app.metrics import Registry, Counter, Gauge, Histogram, MultiProcessStore, timed_repository
+
+
+def make_registry():
+    registry = Registry()
+    requests = registry.register(Counter("requests_total", "Requests.", ("route",)))
+    latency = registry.register(Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0)))
+    in_use = registry.register(Gauge("in_use", "In use."))
+    return registry, requests, latency, in_use
+
+
+class TestRegistry:
+    def test_render(self):
+        registry, requests, latency, in_use = make_registry()
+        requests.inc("/a")
+        requests.inc("/a")
+        latency.observe(0.05, "/a")
+        latency.observe(0.5, "/a")
+        latency.observe(5, "/a")
+        in_use.set(3)
+
+        text = registry.render({os.getpid(): registry.snapshot()})
+        assert "# TYPE requests_total counter" in text
+        assert 'requests_total{route="/a"} 2.0' in text
+        assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{route="/a",le="1.0"} 2' in text
+        assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3' in text
+        assert 'latency_seconds_count{route="/a"} 3' in text
+        assert 'latency_seconds_sum{route="/a"} 5.55' in text
+        assert "in_use 3" in text
+
+    def test_label_values_are_escaped(self):
+        registry, requests, _, _ = make_registry()
+        requests.inc('/a"b')
+        assert 'requests_total{route="/a\\"b"} 1.0' in registry.render({1: registry.snapshot()})
+
+    def test_callback(self):
+        registry = Registry()
+        registry.register(Gauge("ratio", "Ratio.", callback=lambda: {(): 0.5}))
+        assert "ratio 0.5" in registry.render({1: registry.snapshot()})
+
+
+class TestMultiProcess:
+    def test_sums_counters_and_keeps_live_gauges(self, tmp_path):
+        registry, requests, latency, in_use = make_registry()
+        store = MultiProcessStore(str(tmp_path))
+
+        requests.inc("/a")
+        latency.observe(0.05, "/a")
+        in_use.set(1)
+        store.write(registry.snapshot(), pid=100)
+        store.write(registry.snapshot(), pid=200)
+
+        text = registry.render(store.read_all(), live_pids={200})
+        assert 'requests_total{route="/a"} 2.0' in text
+        assert 'latency_seconds_count{route="/a"} 2' in text
+        assert 'in_use{pid="200"} 1' in text
+        assert 'pid="100"' not in text
+
+
+class TestTimedRepository:
+    @pytest.mark.asyncio
+    async def test_records_public_async_methods(self):
+        from app.metrics import REPOSITORY_CALL_DURATION
+
+        @timed_repository
+        class Repository:
+            async def get(self):
+                return 1
+
+            async def _private(self):
+                return 2
+
+        assert await Repository().get() == 1
+        assert ("Repository", "get") in REPOSITORY_CALL_DURATION.values
+        assert ("Repository", "_private") not in REPOSITORY_CALL_DURATION.values
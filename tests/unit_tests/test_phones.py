@@ -0,0 +1,31 @@
+import pytest
+
+from app.phones import normalize_phone
+from app.services import OrganizationService
+
+
+class TestNormalizePhone:
+    @pytest.mark.parametrize("phone_number", ["+375 29 123-45-67", "00375291234567", "8 (029) 123-45-67",
+                                              "29 123 45 67"])
+    def test_formats(self, phone_number):
+        assert normalize_phone(phone_number) == "+375291234567"
+
+    @pytest.mark.parametrize("phone_number", ["", "80", "+375 29 CALL-ME", "+1234567890123456"])
+    def test_invalid(self, phone_number):
+        with pytest.raises(ValueError):
+            normalize_phone(phone_number)
+
+
+@pytest.mark.usefixtures("empty_buildings", "fill_buildings")
+class TestPhoneLookup:
+    @pytest.mark.asyncio
+    async def test_batch_in_order_asked(self):
+        owners = await OrganizationService().get_organizations_by_phone_numbers(
+            ["987 654 321", "+375123456789", "80111", "+375987654321"])
+        assert [owner.phone_number for owner in owners] == ["+375987654321", "+375123456789", "+375111"]
+        assert [owner.organization and owner.organization.name for owner in owners] == ["Org 2", "Org 1", None]
+
+    @pytest.mark.asyncio
+    async def test_batch_size(self):
+        with pytest.raises(ValueError):
+            await OrganizationService().get_organizations_by_phone_numbers([])
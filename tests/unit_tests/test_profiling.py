@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from app.config import settings
+from app.instrumentation import QueryStats, current_query_stats
+from app.middleware import ProfilingMiddleware, QueryStatsMiddleware
+from app.profiling import StackSampler, ProfileStore
+
+
+def busy_wait(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+async def slow_endpoint(request):
+    busy_wait(0.05)
+    return PlainTextResponse("ok")
+
+
+def make_app(store: ProfileStore, sample_rate: float = 0.0):
+    app = Starlette(routes=[Route("/slow", slow_endpoint)])
+    return QueryStatsMiddleware(ProfilingMiddleware(app, store, sample_rate=sample_rate, interval=0.001))
+
+
+async def get(app, path: str, headers: dict = None) -> dict:
+    """ Calls the ASGI app, returns the response headers. """
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": b"", "root_path": "",
+             "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]}
+    response_headers = {}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response_headers.update((k.decode(), v.decode()) for k, v in message["headers"])
+
+    await app(scope, receive, send)
+    return response_headers
+
+
+class TestStackSampler:
+    def test_samples_the_target_thread(self):
+        sampler = StackSampler(threading.get_ident(), 0.001)
+        sampler.start()
+        busy_wait(0.05)
+        sampler.stop()
+        assert sampler.samples > 0
+        assert "busy_wait" in sampler.collapsed()
+
+
+class TestProfilingMiddleware:
+    @pytest.mark.asyncio
+    async def test_not_profiled_by_default(self):
+        store = ProfileStore(10)
+        headers = await get(make_app(store), "/slow", {"X-Profile": "1"})
+        assert "x-profile-id" not in headers
+        assert not store.profiles
+
+    @pytest.mark.asyncio
+    async def test_profiled_with_header_and_api_key(self):
+        store = ProfileStore(10)
+        headers = await get(make_app(store), "/slow", {"X-Profile": "1", "API-key": settings.API_SECRET_KEY})
+        profile = store.get(headers["x-profile-id"])
+        assert profile.status == 200
+        assert profile.samples > 0
+        assert "slow_endpoint" in profile.collapsed
+
+    @pytest.mark.asyncio
+    async def test_sample_rate(self):
+        store = ProfileStore(2)
+        app = make_app(store, sample_rate=1.0)
+        for _ in range(3):
+            await get(app, "/slow")
+        assert len(store.profiles) == 2
+
+
+class TestQueryStats:
+    def test_failed_statement_doesnt_shift_timings(self):
+        engine = create_engine("sqlite://")
+        stats = QueryStats()
+        token = current_query_stats.set(stats)
+        try:
+            with engine.connect() as conn:
+                with pytest.raises(OperationalError):
+                    conn.execute(text("SELECT * FROM missing"))
+                conn.execute(text("SELECT 1"))
+                assert "query_start_time" not in conn.info
+        finally:
+            current_query_stats.reset(token)
+        assert stats.count == 1
+        assert list(stats.shapes) == ["SELECT 1"]
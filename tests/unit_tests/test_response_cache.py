@@ -0,0 +1,75 @@
+from typing import Annotated
+
+import pytest
+import pytest_asyncio
+from fastapi import Depends, FastAPI
+from sqlalchemy import delete
+
+from app import models, schemas
+from app.dependencies import get_basic_user
+from app.middleware import ResponseCacheMiddleware
+from app.services import AuthService
+from app.uow import unit_of_work
+
+calls = []
+
+
+def make_app():
+    app = FastAPI()
+
+    @app.get("/organizations")
+    async def organizations(basic_user: Annotated[schemas.User, Depends(get_basic_user)]):
+        calls.append(basic_user.username)
+        return {"organizations": ["Org 1"]}
+
+    return ResponseCacheMiddleware(app, ttls={"/organizations": 30})
+
+
+def bearer(username: str) -> bytes:
+    token = AuthService(None).create_access_token({"sub": username, "scopes": ["basic_user"]})
+    return f"Bearer {token}".encode()
+
+
+async def call(app, username: str) -> list[dict]:
+    scope = {"type": "http", "method": "GET", "path": "/organizations", "query_string": b"", "root_path": "",
+             "headers": [(b"authorization", bearer(username))]}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent
+
+
+class TestResponseCache:
+    @pytest_asyncio.fixture(autouse=True)
+    async def users(self):
+        async with unit_of_work() as uow:
+            uow.session.add_all([models.User(username="active", hashed_password="-", disabled=False),
+                                 models.User(username="disabled", hashed_password="-", disabled=True)])
+        calls.clear()
+        yield
+        async with unit_of_work() as uow:
+            await uow.session.execute(delete(models.User).where(models.User.username.in_(["active", "disabled"])))
+
+    @pytest.mark.asyncio
+    async def test_hit_for_active_user(self):
+        app = make_app()
+        assert (await call(app, "active"))[0]["status"] == 200
+        sent = await call(app, "active")
+        assert sent[0]["status"] == 200
+        assert (b"x-cache", b"HIT") in sent[0]["headers"]
+        assert calls == ["active"]
+
+    @pytest.mark.asyncio
+    async def test_disabled_user_is_not_served_from_cache(self):
+        app = make_app()
+        assert (await call(app, "active"))[0]["status"] == 200
+        sent = await call(app, "disabled")
+        assert sent[0]["status"] == 400
+        assert b"Org 1" not in sent[1]["body"]
+        assert (await call(app, "deleted"))[0]["status"] == 401
@@ -0,0 +1,36 @@
+import pytest
+
+from app.services import OrganizationService
+
+
+@pytest.mark.usefixtures("empty_buildings", "fill_buildings")
+class TestSearchOrganizations:
+    @pytest.mark.asyncio
+    async def test_matches_names_activities_and_addresses(self):
+        service = OrganizationService()
+        assert [hit.name for hit in (await service.search_organizations("org milk")).items] == ["Org 2"]
+        page = await service.search_organizations("Sovetskaya")
+        assert sorted(hit.name for hit in page.items) == ["Org 2", "Org 3"]
+        assert page.items[0].city == "Homyel"
+
+    @pytest.mark.asyncio
+    async def test_pages(self):
+        service = OrganizationService()
+        first = await service.search_organizations("org", limit=2)
+        second = await service.search_organizations("org", offset=2, limit=2)
+        assert first.has_more and not second.has_more
+        assert len({hit.id for hit in first.items + second.items}) == 3
+
+    @pytest.mark.asyncio
+    async def test_closer_ones_first(self):
+        # from Vitebsk, which has no organizations, Minsk is closer than Homyel
+        page = await OrganizationService().search_organizations("org", latitude=55.19, longitude=30.20)
+        assert page.items[0].name == "Org 1"
+        assert page.items[0].distance_km < page.items[1].distance_km
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("kwargs", [{"query": " "}, {"query": "org", "latitude": 53.9},
+                                        {"query": "org", "limit": 0}, {"query": "org", "offset": -1}])
+    async def test_invalid(self, kwargs):
+        with pytest.raises(ValueError):
+            await OrganizationService().search_organizations(**kwargs)
@@ -67,7 +67,7 @@ class TestOrganizationService:
                 assert isinstance(organization, Organization)
 
                 assert organization.name == "Org 1"
-                assert organization.phone_numbers[0].phone_number == "123456789"
+                assert organization.phone_numbers[0].phone_number == "+375123456789"
 
     @pytest.mark.asyncio
     @pytest.mark.parametrize(
@@ -90,7 +90,7 @@ class TestOrganizationService:
                 assert isinstance(organization, Organization)
 
                 assert organization.name == "Org 1"
-                assert organization.phone_numbers[0].phone_number == "123456789"
+                assert organization.phone_numbers[0].phone_number == "+375123456789"
 
     @pytest.mark.asyncio
     @pytest.mark.parametrize(
@@ -112,7 +112,7 @@ class TestOrganizationService:
                 assert isinstance(organization, Organization)
 
                 assert organization.name == "Org 3"
-                assert organization.phone_numbers[0].phone_number == "123123123"
+                assert organization.phone_numbers[0].phone_number == "+375123123123"
 
     @pytest.mark.asyncio
     @pytest.mark.parametrize(
@@ -133,29 +133,29 @@ class TestOrganizationService:
                 assert isinstance(organization, Organization)
 
                 assert organization.name == "Org 2"
-                assert organization.phone_numbers[0].phone_number == "987654321"
-
-    # @pytest.mark.asyncio
-    # @pytest.mark.parametrize(
-    #     "activity, expectation",
-    #     [
-    #         (0, pytest.raises(ValueError)),
-    #         ("Eat", does_not_raise()),
-    #     ]
-    # )
-    # async def test_get_organizations_by_subactivities(
-    #         self,
-    #         activity: str,
-    #         expectation):
-    #     with expectation:
-    #         organizations = await OrganizationService().get_organizations_by_subactivities(activity)
-    #
-    #         if organizations:
-    #             assert isinstance(organizations, list)
-    #
-    #             organization = organizations[0]
-    #             assert organization.name == "Org 1"
-    #             assert organization.phone_numbers[0].phone_number == "123456789"
+                assert organization.phone_numbers[0].phone_number == "+375987654321"
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "activity, expectation",
+        [
+            (0, pytest.raises(ValueError)),
+            ("Eat", does_not_raise()),
+        ]
+    )
+    async def test_get_organizations_by_subactivities(
+            self,
+            activity: str,
+            expectation):
+        with expectation:
+            organizations = await OrganizationService().get_organizations_by_subactivities(activity)
+
+            if organizations:
+                assert isinstance(organizations, list)
+
+                organization = organizations[0]
+                assert organization.name == "Org 1"
+                assert organization.phone_numbers[0].phone_number == "+375123456789"
 
 class TestGeoUtils:
     @pytest.mark.parametrize(
@@ -0,0 +1,92 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+
+from app import schemas
+from app.admission import ConcurrencyLimiter
+from app.api.api_v1.endpoints import organizations_ep
+from app.config import settings
+from app.dependencies import get_advanced_user
+from app.repositories import collapse_organizations
+from app.services import OrganizationService
+
+
+async def aiter_rows(*rows):
+    for organization_id, name, phone_id, phone_number in rows:
+        yield SimpleNamespace(id=organization_id, name=name, phone_id=phone_id, phone_number=phone_number)
+
+
+class TestCollapseOrganizations:
+    @pytest.mark.asyncio
+    async def test_adjacent_rows_merge(self):
+        organizations = [o async for o in collapse_organizations(aiter_rows(
+            (1, "Org 1", 10, "+375111"), (1, "Org 1", 11, "+375222"), (2, "Org 2", None, None)))]
+        assert [(o.id, [p.phone_number for p in o.phone_numbers]) for o in organizations] == \
+               [(1, ["+375111", "+375222"]), (2, [])]
+
+
+@pytest.mark.usefixtures("empty_buildings", "fill_buildings")
+class TestStreamedLists:
+    @pytest.fixture(autouse=True)
+    def small_batches(self, monkeypatch):
+        monkeypatch.setattr(settings, "STREAM_BATCH_SIZE", 1)
+
+    @pytest.mark.asyncio
+    async def test_same_as_materialized(self):
+        service = OrganizationService()
+        streamed = [o async for o in await service.stream_organizations_by_subactivities("Eat")]
+        assert len(streamed) == 2
+        assert streamed == await service.get_organizations_by_subactivities("Eat")
+        streamed = [o async for o in await service.stream_organizations_by_activity("Milk")]
+        assert streamed == await service.get_organizations_by_activity("Milk")
+
+    @pytest.mark.asyncio
+    async def test_validates_before_streaming(self):
+        with pytest.raises(ValueError):
+            await OrganizationService().stream_organizations_by_activity("")
+
+
+@pytest.mark.usefixtures("empty_buildings", "fill_buildings")
+class TestStreamAdmission:
+    @pytest.mark.asyncio
+    async def test_slot_is_held_until_the_stream_ends(self, monkeypatch):
+        limiter = ConcurrencyLimiter("test", max_concurrency=1, max_queue=0, max_wait=1)
+        monkeypatch.setattr(organizations_ep, "expensive_limiter", limiter)
+        app = FastAPI()
+        app.include_router(organizations_ep.router)
+        app.dependency_overrides[get_advanced_user] = lambda: schemas.User(username="user", permissions=[])
+        started, resume = asyncio.Event(), asyncio.Event()
+
+        async def call(send_body) -> list[dict]:
+            scope = {"type": "http", "method": "GET", "path": "/stream_organizations_by_subactivities",
+                     "query_string": b"activity=Eat", "root_path": "", "headers": []}
+            sent = []
+
+            async def receive():
+                await asyncio.sleep(3600)
+
+            async def send(message):
+                sent.append(message)
+                if message["type"] == "http.response.body":
+                    await send_body()
+
+            await app(scope, receive, send)
+            return sent
+
+        async def slow_client():
+            started.set()
+            await resume.wait()
+
+        async def no_wait():
+            pass
+
+        first = asyncio.create_task(call(slow_client))
+        await asyncio.wait_for(started.wait(), 1)
+        assert limiter.active == 1
+        # the first stream is still open
+        assert (await call(no_wait))[0]["status"] == 503
+        resume.set()
+        assert (await asyncio.wait_for(first, 1))[0]["status"] == 200
+        assert limiter.active == 0
@@ -0,0 +1,65 @@
+import pytest
+
+from app import schemas
+from app.services import BuildingService
+from app.tiles import tile_of, tile_bounds, tiles_covering
+
+# Belarus
+BOX = (51.2, 23.1, 56.2, 32.8)
+
+
+class TestTiles:
+    def test_tile_contains_its_points(self):
+        x, y = tile_of(53.9023, 27.5619, 12)
+        south, west, north, east = tile_bounds(12, x, y)
+        assert south <= 53.9023 < north and west <= 27.5619 < east
+
+    def test_covering(self):
+        assert tiles_covering(-85, -180, 85, 179.9, 1) == [(0, 0), (0, 1), (1, 0), (1, 1)]
+
+    def test_covering_across_the_antimeridian(self):
+        assert tiles_covering(-10, 170, 10, -170, 2) == [(3, 1), (3, 2), (0, 1), (0, 2)]
+
+
+@pytest.mark.usefixtures("fill_buildings")
+class TestViewport:
+    @pytest.mark.asyncio
+    async def test_clusters_at_low_zoom(self):
+        viewport = await BuildingService().get_viewport(*BOX, zoom=2)
+        assert viewport.buildings == []
+        assert sum(cluster.count for cluster in viewport.clusters) == 3
+
+    @pytest.mark.asyncio
+    async def test_buildings_at_high_zoom(self):
+        viewport = await BuildingService().get_viewport(53.90, 27.56, 53.91, 27.57, zoom=17)
+        assert [b.city for b in viewport.buildings] == ["Minsk"]
+
+    @pytest.mark.asyncio
+    async def test_cached_tiles_follow_writes(self):
+        service = BuildingService()
+        assert sum(c.count for c in (await service.get_viewport(*BOX, zoom=5)).clusters) == 3
+        await service.create_buildings([schemas.BuildingCreate(
+            city="Brest", street="Sovetskaya St", house="1", latitude=52.0976, longitude=23.7341)])
+        assert sum(c.count for c in (await service.get_viewport(*BOX, zoom=5)).clusters) == 4
+
+    @pytest.mark.asyncio
+    async def test_buildings_across_the_antimeridian(self):
+        service = BuildingService()
+        await service.create_buildings([
+            schemas.BuildingCreate(city="Suva", street="Victoria Parade", house="1",
+                                   latitude=-18.1416, longitude=178.4419),
+            schemas.BuildingCreate(city="Apia", street="Beach Rd", house="1",
+                                   latitude=-13.8333, longitude=-171.7667),
+        ])
+        viewport = await service.get_viewport(-20, 178, -13, -171, zoom=17)
+        assert sorted(b.city for b in viewport.buildings) == ["Apia", "Suva"]
+
+    @pytest.mark.asyncio
+    async def test_empty_box(self):
+        with pytest.raises(ValueError):
+            await BuildingService().get_viewport(53.90, 27.56, 53.91, 27.56, zoom=17)
+
+    @pytest.mark.asyncio
+    async def test_too_many_tiles(self):
+        with pytest.raises(ValueError):
+            await BuildingService().get_viewport(*BOX, zoom=14)